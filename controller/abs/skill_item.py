@@ -6,6 +6,12 @@ class SkillArg:
         self.arg_name = arg_name
         self.arg_type = arg_type
     
+    def parse(self, value: str) -> Union[int, float, bool, str]:
+        """Converts a string value to the argument type."""
+        if self.arg_type == bool:
+            return value.strip().lower() == 'true'
+        return self.arg_type(value.strip())
+
     def __repr__(self):
         return f"{self.arg_name}:{self.arg_type.__name__}"
 
@@ -66,10 +72,7 @@ class SkillItem(ABC):
                 parsed_args.append(arg)
                 continue
             try:
-                if self.args[i].arg_type == bool:
-                    parsed_args.append(arg.strip().lower() == 'true')
-                else:
-                    parsed_args.append(self.args[i].arg_type(arg.strip()))
+                parsed_args.append(self.args[i].parse(arg))
             except ValueError as e:
                 raise ValueError(f"Error parsing argument {i + 1}. Expected type {self.args[i].arg_type.__name__}, but got value '{arg.strip()}'. Original error: {e}")
         return parsed_args
\ No newline at end of file
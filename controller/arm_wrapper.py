@@ -22,10 +22,13 @@ class ArmFrame:
     def __init__(self, cap):
         self.cap = cap
 
+    def grab(self):
+        # BGR frame straight from the camera
+        return self.cap.get_frame_reader()
+
     @property
     def frame(self):
-        img = self.cap.get_frame_reader()
-        return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        return cv2.cvtColor(self.grab(), cv2.COLOR_BGR2RGB)
 
 class ArmWrapper(RobotWrapper):
     def __init__(self):
@@ -0,0 +1,154 @@
+import time
+import queue
+import threading
+import cv2
+import numpy as np
+from collections import deque
+from typing import Callable, List, Tuple
+
+from .shared_frame import Frame
+from .utils import print_t
+
+# (names, (x, y, w, h) measurements, timestamp of the frame)
+MarkerCallback = Callable[[List[str], List[Tuple[float, float, float, float]], float], None]
+
+'''
+Detects ArUco markers on frames from the capture loop in a background thread
+and hands the measurements to `on_result`. Only every `stride`-th frame is
+looked at, full scans run on a downscaled image, and in between only the
+regions around the markers found last are searched.
+'''
+class ArucoWorker():
+    def __init__(self, on_result: MarkerCallback, stride: int = 2, downscale: float = 0.5,
+                 full_scan_interval: int = 10, roi_margin: float = 1.0):
+        self.on_result = on_result
+        self.stride = stride
+        self.downscale = downscale
+        # processed frames between full scans, new markers only show up in those
+        self.full_scan_interval = full_scan_interval
+        # ROI padding, relative to the marker size
+        self.roi_margin = roi_margin
+        self.detector = cv2.aruco.ArucoDetector(
+            cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_4X4_250),
+            cv2.aruco.DetectorParameters())
+
+        # latest frame only, older ones are dropped
+        self.queue = queue.Queue(maxsize=1)
+        # marker id -> corners (4, 2) in full resolution pixels
+        self.tracked = {}
+        self.submitted = 0
+        self.processed = 0
+        self.dropped = 0
+        self.full_scans = 0
+        self.latencies = deque(maxlen=200)
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.worker, daemon=True)
+        self.thread.start()
+
+    def submit(self, frame: Frame):
+        self.submitted += 1
+        if self.submitted % self.stride != 0:
+            return
+        try:
+            self.queue.put_nowait((frame, time.time()))
+        except queue.Full:
+            try:
+                self.queue.get_nowait()
+                self.dropped += 1
+            except queue.Empty:
+                pass
+            self.queue.put_nowait((frame, time.time()))
+
+    def stop(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def worker(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            frame, timestamp = item
+            start = time.perf_counter()
+            try:
+                names, measurements = self.detect(frame)
+            except Exception as e:
+                print_t(f"[V] ArUco detection failed: {e}")
+                continue
+            with self.lock:
+                self.latencies.append(time.perf_counter() - start)
+                self.processed += 1
+            self.on_result(names, measurements, timestamp)
+
+    def detect(self, frame: Frame) -> Tuple[List[str], List[Tuple[float, float, float, float]]]:
+        image = frame.image_view
+        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY) if image.ndim == 3 else image
+        markers = None
+        if len(self.tracked) > 0 and self.processed % self.full_scan_interval != 0:
+            markers = self.detect_rois(gray)
+            # a tracked marker was lost, look at the whole frame again
+            if len(markers) < len(self.tracked):
+                markers = None
+        if markers is None:
+            markers = self.detect_full(gray)
+            with self.lock:
+                self.full_scans += 1
+        self.tracked = markers
+
+        height, width = gray.shape[:2]
+        names = []
+        measurements = []
+        for marker_id, loc in markers.items():
+            # a marker stands for the door below it, hence the shifted and taller box
+            x = loc[:, 0].sum() / 4 / width
+            y = loc[:, 1].sum() / 4 / height + 0.1
+            w = abs(loc[1][0] - loc[0][0]) / width
+            h = abs(loc[2][1] - loc[0][1]) / height + 0.3
+            names.append(f'door_{marker_id}')
+            measurements.append((float(x), float(y), float(w), float(h)))
+        return names, measurements
+
+    def detect_full(self, gray: np.ndarray) -> dict:
+        scaled = gray
+        if self.downscale != 1.0:
+            scaled = cv2.resize(gray, None, fx=self.downscale, fy=self.downscale, interpolation=cv2.INTER_AREA)
+        locs, ids, _ = self.detector.detectMarkers(scaled)
+        if ids is None:
+            return {}
+        # ids are (n, 1) or (n,) depending on the OpenCV version
+        ids = np.asarray(ids).reshape(-1)
+        return {int(ids[i]): loc[0] / self.downscale for i, loc in enumerate(locs)}
+
+    def detect_rois(self, gray: np.ndarray) -> dict:
+        height, width = gray.shape[:2]
+        markers = {}
+        for loc in self.tracked.values():
+            size = max(loc[:, 0].max() - loc[:, 0].min(), loc[:, 1].max() - loc[:, 1].min())
+            margin = size * self.roi_margin
+            x1 = int(max(loc[:, 0].min() - margin, 0))
+            y1 = int(max(loc[:, 1].min() - margin, 0))
+            x2 = int(min(loc[:, 0].max() + margin, width))
+            y2 = int(min(loc[:, 1].max() + margin, height))
+            if x2 <= x1 or y2 <= y1:
+                continue
+            locs, ids, _ = self.detector.detectMarkers(gray[y1:y2, x1:x2])
+            if ids is None:
+                continue
+            ids = np.asarray(ids).reshape(-1)
+            for i, roi_loc in enumerate(locs):
+                markers[int(ids[i])] = roi_loc[0] + np.array([x1, y1], dtype=roi_loc.dtype)
+        return markers
+
+    def stats(self) -> dict:
+        with self.lock:
+            latencies = sorted(self.latencies)
+            stats = {
+                'submitted': self.submitted,
+                'processed': self.processed,
+                'dropped': self.dropped,
+                'full_scans': self.full_scans,
+            }
+        if len(latencies) > 0:
+            stats['latency_ms_p50'] = latencies[len(latencies) // 2] * 1000
+            stats['latency_ms_p95'] = latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)] * 1000
+        return stats
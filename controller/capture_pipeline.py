@@ -0,0 +1,168 @@
+import time
+import asyncio
+import threading
+import cv2
+from collections import deque
+from typing import Callable
+
+from .shared_frame import Frame
+from .utils import print_t
+
+STAGES = ['grab', 'convert', 'publish', 'submit']
+
+'''
+One capture tick runs grab -> convert -> publish -> submit, reading the
+camera once. Detection requests (encode, then detect) run on the asyncio loop,
+at most `max_in_flight` at a time; a frame that finds the window full waits as
+the single pending frame and is replaced by any newer one, so the detector
+always gets the freshest frame, never builds a backlog and frames that are
+dropped are never encoded. The capture interval follows the measured request
+latency to keep the window busy without overrunning it.
+'''
+class CapturePipeline():
+    def __init__(self, frame_reader, yolo_client, asyncio_loop: asyncio.AbstractEventLoop,
+                 on_frame: Callable[[Frame], None], max_in_flight: int = 2,
+                 interval: float = 0.080, min_interval: float = 0.033, max_interval: float = 0.5,
+                 smoothing: float = 0.2):
+        self.frame_reader = frame_reader
+        self.yolo_client = yolo_client
+        self.asyncio_loop = asyncio_loop
+        # frame fan-out to vision, ArUco and the frame ring
+        self.on_frame = on_frame
+        self.max_in_flight = max_in_flight
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        # weight of the newest sample in the detector latency average
+        self.smoothing = smoothing
+        self.interval = interval
+        self.detect_latency = None
+
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.pending = None
+        self.captured = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.timings = {stage: deque(maxlen=200) for stage in STAGES + ['encode', 'detect']}
+
+    def tick(self) -> Frame:
+        """Captures one frame and hands it to the detector, returns the frame."""
+        start = time.perf_counter()
+        # readers that hand out raw BGR leave the conversion to us
+        raw = hasattr(self.frame_reader, 'grab')
+        image = self.frame_reader.grab() if raw else self.frame_reader.frame
+        depth = self.frame_reader.depth if hasattr(self.frame_reader, 'depth') else None
+        grabbed = time.perf_counter()
+
+        if raw:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        frame = Frame(image, depth)
+        converted = time.perf_counter()
+
+        self.on_frame(frame)
+        published = time.perf_counter()
+
+        self.submit(frame)
+        submitted = time.perf_counter()
+
+        with self.lock:
+            self.captured += 1
+            for stage, duration in zip(STAGES, [grabbed - start, converted - grabbed, published - converted,
+                                                submitted - published]):
+                self.timings[stage].append(duration)
+        return frame
+
+    def submit(self, frame: Frame):
+        if self.yolo_client.is_local_service():
+            # the local service answers synchronously, no window to manage
+            start = time.perf_counter()
+            ok = False
+            try:
+                image_bytes = self.yolo_client.encode(frame)
+                encoded = time.perf_counter()
+                self.record('encode', encoded - start)
+                self.yolo_client.detect_local(frame, image_bytes=image_bytes)
+                self.record('detect', time.perf_counter() - encoded)
+                ok = True
+            except Exception as e:
+                print_t(f"[C] Detection failed: {e}")
+            self.finish(time.perf_counter() - start, ok)
+            return
+        with self.lock:
+            if self.in_flight >= self.max_in_flight:
+                if self.pending is not None:
+                    self.dropped += 1
+                self.pending = frame
+                return
+            self.in_flight += 1
+            self.submitted += 1
+        asyncio.run_coroutine_threadsafe(self.detect(frame), self.asyncio_loop)
+
+    async def detect(self, frame: Frame):
+        while True:
+            start = time.perf_counter()
+            ok = False
+            try:
+                image_bytes = await self.yolo_client.encode_async(frame)
+                encoded = time.perf_counter()
+                self.record('encode', encoded - start)
+                await self.yolo_client.detect(frame, image_bytes=image_bytes)
+                self.record('detect', time.perf_counter() - encoded)
+                ok = True
+            except asyncio.CancelledError:
+                with self.lock:
+                    self.in_flight -= 1
+                raise
+            except Exception as e:
+                print_t(f"[C] Detection failed: {e}")
+            self.finish(time.perf_counter() - start, ok)
+            # the freed slot goes to the pending frame, if any
+            with self.lock:
+                if self.pending is None:
+                    self.in_flight -= 1
+                    return
+                frame = self.pending
+                self.pending = None
+                self.submitted += 1
+
+    def record(self, stage: str, duration: float):
+        with self.lock:
+            self.timings[stage].append(duration)
+
+    def finish(self, latency: float, ok: bool):
+        """Accounts a finished request; `latency` covers encoding and detection."""
+        with self.lock:
+            if not ok:
+                self.failed += 1
+                return
+            self.completed += 1
+            if self.detect_latency is None:
+                self.detect_latency = latency
+            else:
+                self.detect_latency += self.smoothing * (latency - self.detect_latency)
+            # one new frame per free slot, as fast as the detector drains them
+            self.interval = min(max(self.detect_latency / self.max_in_flight, self.min_interval), self.max_interval)
+
+    def next_interval(self) -> float:
+        with self.lock:
+            return self.interval
+
+    def stats(self) -> dict:
+        with self.lock:
+            stats = {
+                'captured': self.captured,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'dropped': self.dropped,
+                'in_flight': self.in_flight,
+                'interval_ms': self.interval * 1000,
+            }
+            timings = {stage: sorted(samples) for stage, samples in self.timings.items()}
+        for stage, samples in timings.items():
+            if len(samples) > 0:
+                stats[f'{stage}_ms_p50'] = samples[len(samples) // 2] * 1000
+                stats[f'{stage}_ms_p95'] = samples[min(int(len(samples) * 0.95), len(samples) - 1)] * 1000
+        return stats
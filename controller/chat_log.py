@@ -0,0 +1,108 @@
+import os, re, time, json
+import gzip, shutil
+import queue
+import threading
+from typing import Optional
+
+'''
+Background JSONL sink for LLM requests. Callers only enqueue; serialization,
+writing and rotation happen on the sink thread. When the queue is full the
+record is dropped and counted instead of blocking the caller.
+'''
+class ChatLogSink():
+    def __init__(self, path: str, max_queue: int = 256, max_bytes: int = 16 * 1024 * 1024,
+                 rotate_interval: Optional[float] = 24 * 3600, backup_count: int = 5, compress: bool = True):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.backup_count = backup_count
+        self.compress = compress
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.written = 0
+        self.file = None
+        self.opened_at = 0
+        self.thread = threading.Thread(target=self.writer, daemon=True)
+        self.thread.start()
+
+    def log(self, record: dict):
+        """Never blocks: the record is dropped if the sink is behind."""
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout: Optional[float] = None):
+        """Flushes pending records and stops the sink thread."""
+        self.queue.put(None)
+        self.thread.join(timeout)
+
+    def writer(self):
+        while True:
+            record = self.queue.get()
+            if record is None:
+                break
+            try:
+                line = json.dumps(self.serialize(record), separators=(',', ':'), default=str)
+                self.write(line + '\n')
+            except Exception as e:
+                print(f"[L] Failed to write chat log: {e}")
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def serialize(self, record: dict) -> dict:
+        # responses are dumped here, off the request thread
+        response = record.get('response')
+        if hasattr(response, 'model_dump'):
+            record['response'] = response.model_dump(exclude_none=True)
+        return record
+
+    def write(self, line: str):
+        if self.file is not None and self.should_rotate(len(line)):
+            self.rotate()
+        if self.file is None:
+            self.file = open(self.path, 'a')
+            self.opened_at = time.time()
+        self.file.write(line)
+        self.file.flush()
+        self.written += 1
+
+    def should_rotate(self, incoming: int) -> bool:
+        if self.max_bytes is not None and self.file.tell() + incoming > self.max_bytes:
+            return True
+        return self.rotate_interval is not None and time.time() - self.opened_at > self.rotate_interval
+
+    def rotate(self):
+        self.file.close()
+        self.file = None
+        root, ext = os.path.splitext(self.path)
+        rotated = f"{root}.{time.strftime('%Y%m%d-%H%M%S')}{ext}"
+        count = 1
+        while os.path.exists(rotated) or os.path.exists(rotated + '.gz'):
+            rotated = f"{root}.{time.strftime('%Y%m%d-%H%M%S')}-{count}{ext}"
+            count += 1
+        os.replace(self.path, rotated)
+        if self.compress:
+            with open(rotated, 'rb') as src, gzip.open(rotated + '.gz', 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(rotated)
+        self.remove_old_backups(root, ext)
+
+    def remove_old_backups(self, root: str, ext: str):
+        directory = os.path.dirname(self.path) or '.'
+        prefix = os.path.basename(root) + '.'
+        # <root>.<YYYYmmdd-HHMMSS>[-<n>]<ext>[.gz], ordered by time and then by n;
+        # as strings "-1" of the same second would sort before its base name
+        pattern = re.compile(re.escape(prefix) + r'(\d{8}-\d{6})(?:-(\d+))?' + re.escape(ext) + r'(\.gz)?$')
+        backups = []
+        for name in os.listdir(directory):
+            match = pattern.match(name)
+            if match is not None:
+                backups.append(((match.group(1), int(match.group(2) or 0)), name))
+        backups.sort()
+        for _, name in backups[:max(len(backups) - self.backup_count, 0)]:
+            os.remove(os.path.join(directory, name))
+
+    def stats(self) -> dict:
+        return {'written': self.written, 'dropped': self.dropped, 'pending': self.queue.qsize()}
@@ -0,0 +1,87 @@
+from typing import List, Optional
+from numpy.typing import NDArray
+import numpy as np
+
+EMPTY_BOXES = np.zeros((0, 4), dtype=np.float32)
+EMPTY_VALUES = np.zeros(0, dtype=np.float32)
+
+'''
+Class names of the standard and the custom model, as last sent by the service.
+The service only includes them in a response when the version the client
+reports is out of date.
+'''
+class ClassTable():
+    def __init__(self):
+        self.version = 0
+        self.names: List[str] = []
+        self.custom_names: List[str] = []
+
+    def update(self, response):
+        if response.class_table_version == self.version or len(response.class_names) == 0:
+            return
+        self.version = response.class_table_version
+        self.names = list(response.class_names)
+        self.custom_names = list(response.custom_class_names)
+
+'''
+Detections of one frame as arrays: `boxes` holds normalized (x1, y1, x2, y2)
+rows and `names` the object names, with the track id appended when tracking.
+Built from the binary `Detections` messages or from the JSON results of
+services and routers that only speak JSON.
+'''
+class DetectionResult():
+    __slots__ = ('image_id', 'names', 'boxes', 'confidences')
+
+    def __init__(self, image_id: Optional[int]=None, names: Optional[List[str]]=None,
+                 boxes: NDArray[np.float32]=EMPTY_BOXES, confidences: NDArray[np.float32]=EMPTY_VALUES):
+        self.image_id = image_id
+        self.names = names if names is not None else []
+        self.boxes = boxes
+        self.confidences = confidences
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def measurements(self) -> NDArray[np.float32]:
+        """(n, 4) array of box center, width and height, as the trackers take them."""
+        size = self.boxes[:, 2:] - self.boxes[:, :2]
+        return np.concatenate([self.boxes[:, :2] + size / 2, size], axis=1)
+
+    def to_dict(self) -> dict:
+        """The JSON layout of the service, with all detections under 'result'."""
+        result = []
+        for name, box, conf in zip(self.names, self.boxes.tolist(), self.confidences.tolist()):
+            result.append({'name': name, 'confidence': round(conf, 2),
+                           'box': {'x1': box[0], 'y1': box[1], 'x2': box[2], 'y2': box[3]}})
+        return {'image_id': self.image_id, 'result': result, 'result_custom': []}
+
+def unpack_detections(detections, class_names: List[str]) -> DetectionResult:
+    boxes = np.frombuffer(detections.boxes, dtype=np.float32).reshape(-1, 4)
+    confidences = np.frombuffer(detections.confidences, dtype=np.float32)
+    class_ids = np.frombuffer(detections.class_ids, dtype=np.int32).tolist()
+    names = [class_names[i] if i < len(class_names) else str(i) for i in class_ids]
+    if len(detections.track_ids) > 0:
+        track_ids = np.frombuffer(detections.track_ids, dtype=np.int32).tolist()
+        names = [f'{name}_{track_id}' for name, track_id in zip(names, track_ids)]
+    return DetectionResult(None, names, boxes, confidences)
+
+def decode_detections(response, class_table: ClassTable) -> DetectionResult:
+    """Result of a binary DetectResponse; standard and custom detections are merged."""
+    class_table.update(response)
+    result = unpack_detections(response.result, class_table.names)
+    custom = unpack_detections(response.result_custom, class_table.custom_names)
+    if len(custom) > 0:
+        result = DetectionResult(None, result.names + custom.names, np.concatenate([result.boxes, custom.boxes]),
+                                 np.concatenate([result.confidences, custom.confidences]))
+    result.image_id = response.image_id
+    return result
+
+def parse_json_result(json_results: dict) -> DetectionResult:
+    objs = (json_results.get('result') or []) + (json_results.get('result_custom') or [])
+    if len(objs) == 0:
+        return DetectionResult(json_results.get('image_id'))
+    names = [obj['name'] for obj in objs]
+    boxes = np.array([[obj['box']['x1'], obj['box']['y1'], obj['box']['x2'], obj['box']['y2']] for obj in objs],
+                     dtype=np.float32)
+    confidences = np.array([obj.get('confidence', 0.0) for obj in objs], dtype=np.float32)
+    return DetectionResult(json_results.get('image_id'), names, boxes, confidences)
@@ -0,0 +1,87 @@
+import struct
+from io import BytesIO
+from typing import List, Optional, Tuple
+from numpy.typing import NDArray
+import numpy as np
+import cv2
+from PIL import Image
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+# formats PIL recognizes by themselves, so services without codec support decode them too
+SELF_DESCRIBING = ['jpeg', 'png', 'webp']
+# raw payloads start with height, width and channels
+RAW_HEADER = struct.Struct('<HHB')
+DEFAULT_QUALITY = 80
+
+def available_codecs() -> List[str]:
+    codecs = ['jpeg', 'png', 'webp', 'raw']
+    if lz4 is not None:
+        codecs.append('raw-lz4')
+    return codecs
+
+def negotiate_codec(preferred: List[str], supported: List[str]) -> str:
+    """First codec in the caller's order that the other side supports."""
+    for codec in preferred:
+        if codec in supported:
+            return codec
+    return 'webp'
+
+def resize_image(image: NDArray[np.uint8], size: Optional[Tuple[int, int]]) -> NDArray[np.uint8]:
+    """Resizes an RGB array to (width, height), a no-op when it already has that size."""
+    if size is None or (image.shape[1], image.shape[0]) == tuple(size):
+        return image
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+def encode_image(image: NDArray[np.uint8], codec: str = 'jpeg', quality: int = DEFAULT_QUALITY) -> bytes:
+    """Encodes an RGB array."""
+    match codec:
+        case 'jpeg':
+            ok, data = cv2.imencode('.jpg', cv2.cvtColor(image, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_JPEG_QUALITY, quality])
+        case 'png':
+            # fastest compression level, PNG is only worth it when the link is fast
+            ok, data = cv2.imencode('.png', cv2.cvtColor(image, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_PNG_COMPRESSION, 1])
+        case 'webp':
+            buffer = BytesIO()
+            Image.fromarray(image).save(buffer, format='WEBP')
+            return buffer.getvalue()
+        case 'raw' | 'raw-lz4':
+            image = np.ascontiguousarray(image)
+            channels = image.shape[2] if image.ndim == 3 else 1
+            data = RAW_HEADER.pack(image.shape[0], image.shape[1], channels) + image.tobytes()
+            if codec == 'raw-lz4':
+                if lz4 is None:
+                    raise ValueError("Codec raw-lz4 needs the lz4 package")
+                data = lz4.frame.compress(data)
+            return data
+        case _:
+            raise ValueError(f"Unknown codec: {codec}")
+    if not ok:
+        raise ValueError(f"Failed to encode the image as {codec}")
+    return data.tobytes()
+
+def decode_image(data: bytes, codec: str = '', bgr: bool = False) -> NDArray[np.uint8]:
+    """Decodes to an RGB array, or BGR as OpenCV-based models expect. An empty codec
+    means a self-describing format from a client without codec support."""
+    if codec in ('raw', 'raw-lz4'):
+        if codec == 'raw-lz4':
+            if lz4 is None:
+                raise ValueError("Codec raw-lz4 needs the lz4 package")
+            data = lz4.frame.decompress(data)
+        height, width, channels = RAW_HEADER.unpack_from(data)
+        image = np.frombuffer(data, dtype=np.uint8, offset=RAW_HEADER.size).reshape(height, width, channels)
+        if channels == 1:
+            return image[:, :, 0]
+        return image[:, :, ::-1] if bgr else image
+    if codec in ('', 'webp'):
+        image = np.asarray(Image.open(BytesIO(data)).convert('RGB'))
+        return image[:, :, ::-1] if bgr else image
+    if codec not in SELF_DESCRIBING:
+        raise ValueError(f"Unknown codec: {codec}")
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError(f"Failed to decode {codec} image")
+    return image if bgr else cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
@@ -0,0 +1,142 @@
+import time
+import numpy as np
+import multiprocessing
+from multiprocessing import shared_memory, resource_tracker
+from typing import Optional, Tuple
+from numpy.typing import NDArray
+
+# header: head sequence number, slot count, slot size in bytes
+HEADER_FIELDS = 3
+# per slot: sequence number, height, width, channels, timestamp (as float64 bits)
+META_FIELDS = 5
+EMPTY = 0
+WRITING = -1
+
+'''
+Ring of fixed-size frame slots in shared memory, written by the capture loop
+and read by consumers in other processes without copying or locking. Each
+slot carries the sequence number of the frame it holds; the writer marks a
+slot as being written before touching the pixels, so a reader can tell a
+torn or overwritten slot by checking the sequence number again after use.
+One writer only; any number of readers attach by name.
+'''
+class FrameRing():
+    def __init__(self, name: Optional[str]=None, slots: int=8, shape: Tuple[int, int, int]=(720, 960, 3), create: bool=True):
+        if create:
+            slot_size = int(np.prod(shape))
+            size = (HEADER_FIELDS + slots * META_FIELDS) * 8 + slots * slot_size
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            self.header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=self.shm.buf)
+            self.header[:] = (0, slots, slot_size)
+        else:
+            try:
+                # readers must not unlink the ring when they exit
+                self.shm = shared_memory.SharedMemory(name=name, track=False)
+            except TypeError:
+                # before Python 3.13 every attach is tracked; children of the
+                # creator share its tracker, anyone else would unlink on exit
+                self.shm = shared_memory.SharedMemory(name=name)
+                if multiprocessing.parent_process() is None:
+                    resource_tracker.unregister(self.shm._name, 'shared_memory')
+            self.header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=self.shm.buf)
+        self.owner = create
+        self.name = self.shm.name
+        self.slots = int(self.header[1])
+        self.slot_size = int(self.header[2])
+        offset = HEADER_FIELDS * 8
+        self.meta = np.ndarray((self.slots, META_FIELDS), dtype=np.int64, buffer=self.shm.buf, offset=offset)
+        self.timestamps = self.meta[:, 4].view(np.float64)
+        offset += self.slots * META_FIELDS * 8
+        self.data = np.ndarray((self.slots, self.slot_size), dtype=np.uint8, buffer=self.shm.buf, offset=offset)
+        if create:
+            self.meta[:] = EMPTY
+
+    def write(self, image: NDArray[np.uint8], timestamp: Optional[float]=None) -> int:
+        """Copies the image into the next slot and returns its sequence number."""
+        image = np.asarray(image, dtype=np.uint8)
+        if image.nbytes > self.slot_size:
+            raise ValueError(f"Frame of {image.nbytes} bytes does not fit a {self.slot_size} byte slot")
+        shape = image.shape + (1,) * (3 - image.ndim)
+        seq = int(self.header[0]) + 1
+        slot = seq % self.slots
+        meta = self.meta[slot]
+        meta[0] = WRITING
+        self.data[slot, :image.nbytes] = image.reshape(-1)
+        meta[1:4] = shape
+        self.timestamps[slot] = time.time() if timestamp is None else timestamp
+        meta[0] = seq
+        self.header[0] = seq
+        return seq
+
+    def head(self) -> int:
+        """Sequence number of the latest frame, 0 before the first write."""
+        return int(self.header[0])
+
+    def view(self, seq: int) -> Optional[Tuple[float, NDArray[np.uint8]]]:
+        """Timestamp and a read-only view of frame `seq`, or None when it was overwritten.
+        The view stays valid only while `is_valid(seq)` holds."""
+        if seq <= 0:
+            return None
+        slot = seq % self.slots
+        meta = self.meta[slot]
+        if meta[0] != seq:
+            return None
+        height, width, channels = (int(v) for v in meta[1:4])
+        timestamp = float(self.timestamps[slot])
+        image = self.data[slot, :height * width * channels].reshape(height, width, channels)
+        if channels == 1:
+            image = image[:, :, 0]
+        image.flags.writeable = False
+        if meta[0] != seq:
+            return None
+        return timestamp, image
+
+    def is_valid(self, seq: int) -> bool:
+        return seq > 0 and self.meta[seq % self.slots, 0] == seq
+
+    def latest(self) -> Optional[Tuple[int, float, NDArray[np.uint8]]]:
+        """Sequence number, timestamp and view of the newest frame, without locking."""
+        while True:
+            seq = self.head()
+            if seq == 0:
+                return None
+            result = self.view(seq)
+            # the writer lapped the ring in between, try the new head
+            if result is not None:
+                return (seq,) + result
+
+    def read(self, seq: Optional[int]=None) -> Optional[Tuple[int, float, NDArray[np.uint8]]]:
+        """Like `latest` or `view` but returns a private copy that cannot be torn."""
+        while True:
+            if seq is None:
+                result = self.latest()
+                if result is None:
+                    return None
+                current, timestamp, image = result
+            else:
+                result = self.view(seq)
+                if result is None:
+                    return None
+                current = seq
+                timestamp, image = result
+            image = image.copy()
+            if self.is_valid(current):
+                return current, timestamp, image
+            if seq is not None:
+                return None
+
+    def wait(self, after: int, timeout: Optional[float]=None, interval: float=0.002) -> Optional[Tuple[int, float, NDArray[np.uint8]]]:
+        """Waits for a frame newer than `after` and returns the latest one, None on timeout."""
+        deadline = None if timeout is None else time.time() + timeout
+        while self.head() <= after:
+            if deadline is not None and time.time() > deadline:
+                return None
+            time.sleep(interval)
+        return self.latest()
+
+    def close(self):
+        # views into the buffer have to go before the mapping can be closed
+        self.header = self.meta = self.timestamps = self.data = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
@@ -0,0 +1,137 @@
+import re, time
+from abc import ABC, abstractmethod
+import threading
+from typing import Optional, List, Tuple, Dict
+
+from .skillset import SkillSet
+from .minispec_interpreter import check_minispec
+
+# extra phrasings of the built-in high-level skills, the skill name itself always matches
+SKILL_PHRASES: Dict[str, List[str]] = {
+    'goto': ['go to', 'move to', 'head to', 'navigate to'],
+    'scan': ['scan for', 'look for', 'search for'],
+    'orienting': ['orient to', 'orient towards', 'align with', 'turn to', 'face'],
+    'zoom_in': ['zoom in'],
+    'zoom_out': ['zoom out'],
+    'approach': ['approach', 'move closer'],
+    'grab_item': ['grab the item', 'pick up the item'],
+}
+
+# arguments that need reasoning about the scene, left to the LLM
+ABSTRACT_WORDS = {'something', 'anything', 'object', 'thing', 'things', 'item', 'stuff', 'any', 'some',
+                  'edible', 'food', 'animal', 'it', 'that', 'this', 'there', 'here'}
+
+# tasks with several steps or conditions are never served locally
+COMPOUND_PATTERN = re.compile(r'\b(and|then|after|before|if|when|until|while|but|or)\b|[,;]')
+ARTICLE_PATTERN = re.compile(r'^(the|a|an|my|your|that|this)\s+')
+POLITE_PATTERN = re.compile(r'^(please|can you|could you|would you|now)\s+')
+OBJECT_PATTERN = re.compile(r'^[a-z][a-z ]{0,30}$')
+
+def normalize_phrase(task: str) -> str:
+    task = re.sub(r'\s+', ' ', task.strip().lower()).rstrip('.!?')
+    while True:
+        stripped = POLITE_PATTERN.sub('', task)
+        if stripped == task:
+            return task
+        task = stripped
+
+'''
+Maps a task description to MiniSpec without asking the LLM.
+Subclasses return (program, confidence in [0, 1]) or None.
+'''
+class IntentMatcher(ABC):
+    @abstractmethod
+    def match(self, task: str, scene_description: str) -> Optional[Tuple[str, float]]:
+        pass
+
+'''
+Matches single-skill tasks such as "go to the bottle" or "zoom in" against the
+names and phrasings of the high-level skills, e.g. "go to the bottle" -> g('bottle').
+'''
+class SkillIntentMatcher(IntentMatcher):
+    def __init__(self, high_level_skillset: SkillSet):
+        # (phrase, skill abbreviation, takes an object argument)
+        self.rules: List[Tuple[str, str, bool]] = []
+        for name, skill in high_level_skillset.skills.items():
+            args = skill.get_argument()
+            # only skills without arguments or with one object name
+            if len(args) > 1 or (len(args) == 1 and args[0].arg_type != str):
+                continue
+            phrases = [name.replace('_', ' ')] + SKILL_PHRASES.get(name, [])
+            for phrase in phrases:
+                self.rules.append((phrase, skill.abbr, len(args) == 1))
+        # longest phrase first, so "zoom in" wins over "zoom"
+        self.rules.sort(key=lambda rule: -len(rule[0]))
+        scan = high_level_skillset.skills.get('scan')
+        self.scan_abbr = scan.abbr if scan is not None else None
+
+    def match(self, task: str, scene_description: str) -> Optional[Tuple[str, float]]:
+        if COMPOUND_PATTERN.search(task):
+            return None
+        for phrase, abbr, has_arg in self.rules:
+            if not has_arg:
+                if task == phrase:
+                    return f'{abbr}();', 1.0
+                continue
+            if not task.startswith(phrase + ' '):
+                continue
+            object_name = ARTICLE_PATTERN.sub('', task[len(phrase) + 1:].strip())
+            if not OBJECT_PATTERN.match(object_name) or len(object_name.split()) > 3:
+                return None
+            if any(word in ABSTRACT_WORDS for word in object_name.split()):
+                return f"{abbr}('{object_name}');", 0.3
+            confidence = 1.0
+            if abbr != self.scan_abbr and object_name not in scene_description.lower():
+                # the object has to be found first, which the LLM plans better
+                confidence = 0.5
+            return f"{abbr}('{object_name}');", confidence
+        return None
+
+'''
+Serves tasks locally when a matcher is confident enough, otherwise the caller
+asks the LLM. Keeps the share of tasks served locally and their latency.
+'''
+class FastPathPlanner():
+    def __init__(self, high_level_skillset: SkillSet, low_level_skillset: SkillSet, threshold: float = 0.8):
+        self.high_level_skillset = high_level_skillset
+        self.low_level_skillset = low_level_skillset
+        self.threshold = threshold
+        self.matchers: List[IntentMatcher] = [SkillIntentMatcher(high_level_skillset)]
+        self.lock = threading.Lock()
+        self.tasks = 0
+        self.local = 0
+        self.local_latency = 0.0
+
+    def add_matcher(self, matcher: IntentMatcher):
+        self.matchers.append(matcher)
+
+    def plan(self, task_description: str, scene_description: str) -> Optional[str]:
+        """Returns a MiniSpec program, or None to fall back to the LLM."""
+        start = time.perf_counter()
+        plan = None
+        # questions are answered by the LLM
+        if task_description.startswith('[A]') or not task_description.startswith('['):
+            task = normalize_phrase(re.sub(r'^\[A\]\s*', '', task_description))
+            best = None
+            for matcher in self.matchers:
+                result = matcher.match(task, scene_description)
+                if result is not None and (best is None or result[1] > best[1]):
+                    best = result
+            if best is not None and best[1] >= self.threshold \
+                    and check_minispec(best[0], self.low_level_skillset, self.high_level_skillset) is None:
+                plan = best[0]
+        with self.lock:
+            self.tasks += 1
+            if plan is not None:
+                self.local += 1
+                self.local_latency += time.perf_counter() - start
+        return plan
+
+    def report(self) -> dict:
+        with self.lock:
+            return {
+                'tasks': self.tasks,
+                'local': self.local,
+                'local_share': self.local / self.tasks if self.tasks > 0 else 0.0,
+                'local_latency_ms': self.local_latency / self.local * 1000 if self.local > 0 else 0.0,
+            }
@@ -3,9 +3,13 @@ import queue, time, os, json
 from typing import Optional, Tuple
 import asyncio
 import uuid
+import threading
 from enum import Enum
+from openai import ChatCompletion, Stream
 
 from .shared_frame import SharedFrame, Frame
+from .frame_ring import FrameRing
+from .capture_pipeline import CapturePipeline
 from .yolo_client import YoloClient
 from .yolo_grpc_client import YoloGRPCClient
 from .tello_wrapper import TelloWrapper
@@ -19,6 +23,9 @@ from .minispec_interpreter import MiniSpecInterpreter, Statement
 
 
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+# publish captured frames to a shared-memory ring of this name for other processes
+FRAME_RING_NAME = os.environ.get("FRAME_RING_NAME")
+FRAME_RING_SLOTS = int(os.environ.get("FRAME_RING_SLOTS", "8"))
 
 class LLMController():
     class RobotType(Enum):
@@ -33,8 +40,12 @@ class LLMController():
         else:
             self.yolo_client = YoloGRPCClient(shared_frame=self.shared_frame)
             self.yolo_client.set_class([])
+            self.yolo_client.negotiate_codec()
         self.vision = VisionSkillWrapper(self.shared_frame)
+        # created on the first frame, sized to the camera
+        self.frame_ring: Optional[FrameRing] = None
         self.latest_frame = None
+        self.capture_pipeline: Optional[CapturePipeline] = None
         self.controller_active = True
         self.controller_wait_takeoff = True
         self.message_queue = message_queue
@@ -76,13 +87,14 @@ class LLMController():
         self.low_level_skillset.add_skill(LowLevelSkillItem("turn_ccw", self.drone.turn_ccw, "Rotate counterclockwise/left by certain degrees", args=[SkillArg("degrees", int)]))
         self.low_level_skillset.add_skill(LowLevelSkillItem("move_in_circle", self.drone.move_in_circle, "Move in circle in cw/ccw", args=[SkillArg("cw", bool)]))
         self.low_level_skillset.add_skill(LowLevelSkillItem("delay", self.skill_delay, "Wait for specified microseconds", args=[SkillArg("milliseconds", int)]))
-        self.low_level_skillset.add_skill(LowLevelSkillItem("is_visible", self.vision.is_visible, "Check the visibility of target object", args=[SkillArg("object_name", str)]))
-        self.low_level_skillset.add_skill(LowLevelSkillItem("object_x", self.vision.object_x, "Get object's X-coordinate in (0,1)", args=[SkillArg("object_name", str)]))
-        self.low_level_skillset.add_skill(LowLevelSkillItem("object_y", self.vision.object_y, "Get object's Y-coordinate in (0,1)", args=[SkillArg("object_name", str)]))
-        self.low_level_skillset.add_skill(LowLevelSkillItem("object_width", self.vision.object_width, "Get object's width in (0,1)", args=[SkillArg("object_name", str)]))
-        self.low_level_skillset.add_skill(LowLevelSkillItem("object_height", self.vision.object_height, "Get object's height in (0,1)", args=[SkillArg("object_name", str)]))
-        self.low_level_skillset.add_skill(LowLevelSkillItem("object_dis", self.vision.object_distance, "Get object's distance in cm", args=[SkillArg("object_name", str)]))
-        self.low_level_skillset.add_skill(LowLevelSkillItem("probe", self.planner.probe, "Probe the LLM for reasoning", args=[SkillArg("question", str)]))
+        self.low_level_skillset.add_skill(LowLevelSkillItem("is_visible", self.vision.is_visible, "Check the visibility of target object", args=[SkillArg("object_name", str)], perception=True))
+        self.low_level_skillset.add_skill(LowLevelSkillItem("object_x", self.vision.object_x, "Get object's X-coordinate in (0,1)", args=[SkillArg("object_name", str)], perception=True))
+        self.low_level_skillset.add_skill(LowLevelSkillItem("object_y", self.vision.object_y, "Get object's Y-coordinate in (0,1)", args=[SkillArg("object_name", str)], perception=True))
+        self.low_level_skillset.add_skill(LowLevelSkillItem("object_width", self.vision.object_width, "Get object's width in (0,1)", args=[SkillArg("object_name", str)], perception=True))
+        self.low_level_skillset.add_skill(LowLevelSkillItem("object_height", self.vision.object_height, "Get object's height in (0,1)", args=[SkillArg("object_name", str)], perception=True))
+        self.low_level_skillset.add_skill(LowLevelSkillItem("object_dis", self.vision.object_distance, "Get object's distance in cm", args=[SkillArg("object_name", str)], perception=True))
+        self.low_level_skillset.add_skill(LowLevelSkillItem("object_info", self.vision.object_info, "Get object's position, size and distance at once", args=[SkillArg("object_name", str)], perception=True))
+        self.low_level_skillset.add_skill(LowLevelSkillItem("probe", self.planner.probe, "Probe the LLM for reasoning", args=[SkillArg("question", str)], perception=True))
         self.low_level_skillset.add_skill(LowLevelSkillItem("log", self.skill_log, "Output text to console", args=[SkillArg("text", str)]))
         self.low_level_skillset.add_skill(LowLevelSkillItem("take_picture", self.skill_take_picture, "Take a picture"))
         self.low_level_skillset.add_skill(LowLevelSkillItem("re_plan", self.skill_re_plan, "Replanning"))
@@ -105,10 +117,12 @@ class LLMController():
 
         Statement.low_level_skillset = self.low_level_skillset
         Statement.high_level_skillset = self.high_level_skillset
+        Statement.perception = self.vision
         self.planner.init(high_level_skillset=self.high_level_skillset, low_level_skillset=self.low_level_skillset, vision_skill=self.vision)
 
         self.current_plan = None
         self.execution_history = None
+        self.time_to_first_action = None
 
     def skill_take_picture(self) -> Tuple[None, bool]:
         img_path = os.path.join(self.cache_folder, f"{uuid.uuid4()}.jpg")
@@ -139,16 +153,28 @@ class LLMController():
     def get_latest_frame(self, plot=False):
         image = self.shared_frame.get_image()
         if plot and image:
-            # YoloClient.plot_results(image, self.shared_frame.get_yolo_result().get('result'))
-            self.vision.update()
+            # draw on a copy, the image is shared with the frame
+            image = image.copy()
+            # YoloClient.plot_results(image, self.shared_frame.get_yolo_result().to_dict().get('result'))
+            # not pinned, the UI always reads the latest frame
             YoloClient.plot_results_oi(image, self.vision.object_list)
         return image
     
-    def execute_minispec(self, minispec: str):
+    def execute_minispec(self, minispec: str | Stream[ChatCompletion.ChatCompletionChunk], timestamp_request: Optional[float] = None):
         interpreter = MiniSpecInterpreter()
-        interpreter.execute(minispec)
+        try:
+            interpreter.execute(minispec)
+        except Exception:
+            # statements queued before the error must not keep the robot moving after the task ends
+            interpreter.stop()
+            raise
         self.execution_history = interpreter.execution_history
-        ret_val = interpreter.ret_queue.get()
+        ret_val = interpreter.wait()
+        # streamed plans are only known as text once parsed
+        self.current_plan = str(interpreter.program)
+        if timestamp_request is not None and interpreter.timestamp_first_action is not None:
+            self.time_to_first_action = interpreter.timestamp_first_action - timestamp_request
+            print_t(f"[C] Time to first action: {self.time_to_first_action:.3f}s")
         return ret_val
 
     def execute_task_description(self, task_description: str):
@@ -156,26 +182,33 @@ class LLMController():
             self.append_message("[Warning] Controller is waiting for takeoff...")
             return
         self.append_message('[TASK]: ' + task_description)
-        ret_val = None
+        # choose the open-vocabulary classes while the plan is requested and
+        # executed, only perception skills wait for them
+        if isinstance(self.yolo_client, YoloGRPCClient):
+            self.vision.classes_ready.clear()
+            threading.Thread(target=self.update_yolo_class, args=(task_description,), daemon=True).start()
         while True:
-            # set class for yolo
-            # self.yolo_client.set_class(self.planner.get_class(task_description))
+            ret_val = None
+            timestamp_request = time.time()
             self.current_plan = self.planner.plan(task_description, execution_history=self.execution_history)
             # consent = input_t(f"[C] Get plan: {self.current_plan}, executing?")
             # if consent == 'n':
             #     print_t("[C] > Plan rejected <")
             #     return
             try:
-                ret_val = self.execute_minispec(self.current_plan)
+                ret_val = self.execute_minispec(self.current_plan, timestamp_request)
             except Exception as e:
                 print_t(f"[C] Error: {e}")
             # break
             
             # disable replan for now
-            if ret_val.replan:
+            if ret_val is not None and ret_val.replan:
                 print_t(f"[C] > Replanning <: {ret_val.value}")
+                self.planner.reject_plan()
                 continue
             else:
+                if ret_val is not None:
+                    self.planner.cache_plan(self.current_plan)
                 break
         self.append_message(f'Task ended')
         # self.append_message(f'Task complete with {ret_val.value if ret_val else None}')
@@ -183,6 +216,14 @@ class LLMController():
         self.current_plan = None
         self.execution_history = None
 
+    def update_yolo_class(self, task_description: str):
+        try:
+            self.yolo_client.set_class(self.planner.get_class(task_description))
+        except Exception as e:
+            print_t(f"[C] Failed to set YOLO classes: {e}")
+        finally:
+            self.vision.classes_ready.set()
+
     def start_robot(self):
         print_t("[C] Arm is starting up...")
         self.drone.connect()
@@ -197,25 +238,38 @@ class LLMController():
         self.drone.stop_stream()
         self.controller_wait_takeoff = True
 
+    def publish_frame(self, frame: Frame):
+        image = frame.image_view
+        if self.frame_ring is None:
+            self.frame_ring = FrameRing(FRAME_RING_NAME, slots=FRAME_RING_SLOTS, shape=image.shape)
+            print_t(f"[C] Publishing {image.shape} frames to shared memory '{self.frame_ring.name}'")
+        self.frame_ring.write(image)
+
+    def on_frame(self, frame: Frame):
+        self.latest_frame = frame.image_buffer
+        self.vision.submit_frame(frame)
+        if FRAME_RING_NAME is not None:
+            self.publish_frame(frame)
+
     def capture_loop(self, asyncio_loop):
         print_t("[C] Start capture loop...")
         frame_reader = self.drone.get_frame_reader()
+        self.capture_pipeline = CapturePipeline(frame_reader, self.yolo_client, asyncio_loop, self.on_frame)
         while self.controller_active:
+            start = time.perf_counter()
             self.drone.keep_active()
-            self.latest_frame = frame_reader.frame
-            frame = Frame(frame_reader.frame,
-                          frame_reader.depth if hasattr(frame_reader, 'depth') else None)
-
-            if self.yolo_client.is_local_service():
-                self.yolo_client.detect_local(frame)
-            else:
-                # asynchronously send image to yolo server
-                asyncio_loop.call_soon_threadsafe(asyncio.create_task, self.yolo_client.detect(frame))
-            time.sleep(0.080)
+            self.capture_pipeline.tick()
+            # the interval follows the detector, minus the time the tick took
+            time.sleep(max(self.capture_pipeline.next_interval() - (time.perf_counter() - start), 0))
         # Cancel all running tasks (if any)
         for task in asyncio.all_tasks(asyncio_loop):
             task.cancel()
         self.drone.stop_stream()
         self.drone.land()
+        self.vision.aruco.stop()
+        if self.frame_ring is not None:
+            self.frame_ring.close()
+        print_t(f"[C] ArUco detection: {self.vision.aruco.stats()}")
+        print_t(f"[C] Capture pipeline: {self.capture_pipeline.stats()}")
         asyncio_loop.stop()
         print_t("[C] Capture loop stopped")
\ No newline at end of file
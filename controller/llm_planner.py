@@ -1,17 +1,30 @@
 import os, ast
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional, List
 
 from .skillset import SkillSet
 from .llm_wrapper import LLMWrapper, GPT3, GPT4
 from .vision_skill_wrapper import VisionSkillWrapper
 from .utils import print_t
-from .minispec_interpreter import MiniSpecValueType, evaluate_value
+from .minispec_interpreter import MiniSpecValueType, evaluate_value, check_minispec
+from .plan_cache import PlanCache, normalize_task
+from .probe_cache import ProbeCache
+from .intent_matcher import FastPathPlanner
+from .prompt_assembler import PromptAssembler
 
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+CLASS_CACHE_SIZE = 128
 
 class LLMPlanner():
     def __init__(self):
         self.llm = LLMWrapper()
         self.model_name = GPT4
+        # stream the plan so the interpreter can start on the first complete statement
+        self.streaming = False
+        # race the plan request against the other backend when it is slow
+        self.hedging = False
 
         # read prompt from txt
         with open(os.path.join(CURRENT_DIR, "./assets/prompt_plan.txt"), "r") as f:
@@ -32,18 +45,78 @@ class LLMPlanner():
         with open(os.path.join(CURRENT_DIR, "./assets/plan_examples.txt"), "r") as f:
             self.plan_examples = f.read()
 
+        self.plan_prompt = PromptAssembler(self.prompt_plan, static_fields=[
+            'system_skill_description_high', 'system_skill_description_low', 'guides', 'plan_examples'])
+
+        # set to None to always ask the LLM
+        self.plan_cache = PlanCache(os.path.join(CURRENT_DIR, "./assets/plan_cache.db"))
+        self.skillset_version = None
+        # (cache key, task) of the last cacheable plan() request
+        self.pending_plan = None
+        # set to None to always ask the LLM
+        self.probe_cache = ProbeCache()
+        # set to None to send every task to the LLM
+        self.fast_path: Optional[FastPathPlanner] = None
+        self.fast_path_enabled = True
+        # normalized task -> YOLO classes
+        self.class_cache: OrderedDict[str, List[str]] = OrderedDict()
+        self.class_cache_lock = threading.Lock()
+
     def set_model(self, model_name):
         self.model_name = model_name
 
+    def set_streaming(self, streaming: bool):
+        self.streaming = streaming
+
+    def set_hedging(self, hedging: bool, percentile: float = None):
+        self.hedging = hedging
+        self.llm.set_hedging(percentile)
+
+    def set_fast_path(self, enabled: bool):
+        self.fast_path_enabled = enabled
+        if not enabled:
+            self.fast_path = None
+        elif self.fast_path is None and hasattr(self, 'high_level_skillset'):
+            self.fast_path = FastPathPlanner(self.high_level_skillset, self.low_level_skillset)
+
+    def set_token_budget(self, token_budget: Optional[int]):
+        self.plan_prompt.token_budget = token_budget
+
     def init(self, high_level_skillset: SkillSet, low_level_skillset: SkillSet, vision_skill: VisionSkillWrapper):
         self.high_level_skillset = high_level_skillset
         self.low_level_skillset = low_level_skillset
         self.vision_skill = vision_skill
+        # plans are only reused with the same skills and prompt assets
+        assets = [str(high_level_skillset), str(low_level_skillset), self.prompt_plan, self.guides, self.plan_examples]
+        self.skillset_version = hashlib.sha256('\n'.join(assets).encode()).hexdigest()[:16]
+        self.plan_prompt.set_static(self.skillset_version,
+                                    system_skill_description_high=high_level_skillset,
+                                    system_skill_description_low=low_level_skillset,
+                                    guides=self.guides,
+                                    plan_examples=self.plan_examples)
+        if self.plan_cache is not None:
+            self.plan_cache.prune()
+        if self.fast_path_enabled:
+            self.fast_path = FastPathPlanner(high_level_skillset, low_level_skillset)
     
-    def get_class(self, task_description: str):
+    def get_class(self, task_description: str) -> List[str]:
+        key = normalize_task(task_description)
+        with self.class_cache_lock:
+            if key in self.class_cache:
+                self.class_cache.move_to_end(key)
+                return self.class_cache[key]
         prompt = self.prompt_yolo_get_class.format(task_description=task_description)
         result = self.llm.request(prompt, GPT3)
-        return ast.literal_eval(result)
+        try:
+            class_names = [str(name) for name in ast.literal_eval(result)]
+        except (ValueError, SyntaxError, TypeError):
+            print_t(f"[P] Invalid class list: {result}")
+            return []
+        with self.class_cache_lock:
+            self.class_cache[key] = class_names
+            if len(self.class_cache) > CLASS_CACHE_SIZE:
+                self.class_cache.popitem(last=False)
+        return class_names
 
     def plan(self, task_description: str, scene_description: str = None, error_message: str = None, execution_history: str = None):
         # by default, the task_description is an action
@@ -52,19 +125,73 @@ class LLMPlanner():
 
         if scene_description is None:
             scene_description = self.vision_skill.get_obj_list()
-        prompt = self.prompt_plan.format(system_skill_description_high=self.high_level_skillset,
-                                             system_skill_description_low=self.low_level_skillset,
-                                            #  minispec_syntax=self.minispec_syntax,
-                                             guides=self.guides,
-                                             plan_examples=self.plan_examples,
-                                             error_message=error_message,
-                                             scene_description=scene_description,
-                                             task_description=task_description,
-                                             execution_history=execution_history)
+            scene_signature = self.vision_skill.get_obj_signature()
+        else:
+            scene_signature = scene_description
+
+        self.pending_plan = None
+        if self.fast_path is not None and error_message is None and execution_history is None:
+            plan = self.fast_path.plan(task_description, scene_description)
+            print_t(f"[P] Fast path: {self.fast_path.report()}")
+            if plan is not None:
+                print_t(f"[P] Local plan for: {task_description}")
+                return plan
+
+        if self.plan_cache is not None and error_message is None and execution_history is None:
+            key = PlanCache.make_key(task_description, scene_signature, self.model_name, self.skillset_version)
+            plan = self.plan_cache.get(key)
+            print_t(f"[P] Plan cache: {self.plan_cache.report()}")
+            self.pending_plan = (key, task_description)
+            if plan is not None:
+                print_t(f"[P] Cached plan for: {task_description}")
+                return plan
+
+        prompt = self.plan_prompt.assemble(error_message=error_message,
+                                           scene_description=scene_description,
+                                           task_description=task_description,
+                                           execution_history=execution_history)
         print_t(f"[P] Planning request: {task_description}")
-        return self.llm.request(prompt, self.model_name, stream=False)
+        print_t(f"[P] Prompt tokens: {self.plan_prompt.last_report}")
+        if self.hedging:
+            # the winner has to be validated as a whole, so hedged plans are not streamed
+            if self.streaming:
+                print_t("[P] Hedging is on, the plan is not streamed")
+            return self.llm.request_hedged(prompt, self.model_name, self.validate_plan)
+        return self.llm.request(prompt, self.model_name, stream=self.streaming)
+
+    def validate_plan(self, plan: str) -> bool:
+        error = check_minispec(plan, self.low_level_skillset, self.high_level_skillset)
+        if error is not None:
+            print_t(f"[P] Invalid plan: {error}")
+        return error is None
     
+    def cache_plan(self, plan: str):
+        """Stores the plan of the last plan() request once it executed without replanning."""
+        if self.plan_cache is None or self.pending_plan is None:
+            return
+        key, task_description = self.pending_plan
+        self.plan_cache.put(key, plan, task_description, self.skillset_version)
+        self.pending_plan = None
+
+    def reject_plan(self):
+        """Drops the plan of the last plan() request from the cache, e.g. when it needed a replan."""
+        if self.plan_cache is None or self.pending_plan is None:
+            return
+        self.plan_cache.remove(self.pending_plan[0])
+        self.pending_plan = None
+
     def probe(self, question: str) -> MiniSpecValueType:
-        prompt = self.prompt_probe.format(scene_description=self.vision_skill.get_obj_list(), question=question)
-        print_t(f"[P] Execution request: {question}")
-        return evaluate_value(self.llm.request(prompt, self.model_name)), False
\ No newline at end of file
+        scene_description = self.vision_skill.get_obj_list()
+        def request():
+            prompt = self.prompt_probe.format(scene_description=scene_description, question=question)
+            print_t(f"[P] Execution request: {question}")
+            return evaluate_value(self.llm.request(prompt, self.model_name))
+
+        if self.probe_cache is None:
+            return request(), False
+        # the object list carries exact positions that change every frame, the
+        # grid-quantized signature stays put while the scene does
+        key = ProbeCache.make_key(question, self.vision_skill.get_obj_signature(), self.model_name)
+        value = self.probe_cache.get_or_compute(key, request)
+        print_t(f"[P] Probe cache: {self.probe_cache.stats()}")
+        return value, False
\ No newline at end of file
@@ -1,32 +1,114 @@
-import os
+import os, time
+import queue
+import threading
+from collections import deque
+from typing import Callable, Optional, Dict
 import openai
 from openai import Stream, ChatCompletion
 
+from .chat_log import ChatLogSink
+from .utils import print_t
+
 GPT3 = "gpt-3.5-turbo-16k"
 GPT4 = "gpt-4"
 LLAMA3 = "meta-llama/Meta-Llama-3-8B-Instruct"
 
+# backend a hedged request is duplicated to
+HEDGE_PARTNERS = {
+    GPT4: LLAMA3,
+    LLAMA3: GPT4,
+}
+
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
-chat_log_path = os.path.join(CURRENT_DIR, "assets/chat_log.txt")
+chat_log_path = os.path.join(CURRENT_DIR, "assets/chat_log.jsonl")
+
+class LatencyHistogram():
+    """
+        Sliding window of request latencies (seconds) of one backend. Requests
+        cancelled before they finished are recorded with the time they ran, a lower
+        bound of their latency; leaving them out would keep only the fast requests
+        of a backend that loses hedges and pull its percentiles down.
+    """
+    def __init__(self, size: int = 256, min_samples: int = 8):
+        self.samples = deque(maxlen=size)
+        # True for the samples of cancelled requests
+        self.censored = deque(maxlen=size)
+        self.min_samples = min_samples
+        self.lock = threading.Lock()
+
+    def record(self, latency: float, censored: bool = False):
+        with self.lock:
+            self.samples.append(latency)
+            self.censored.append(censored)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """None until enough samples have been recorded."""
+        with self.lock:
+            if len(self.samples) < self.min_samples:
+                return None
+            samples = sorted(self.samples)
+        return samples[min(int(len(samples) * p), len(samples) - 1)]
+
+    def summary(self) -> dict:
+        with self.lock:
+            samples = sorted(self.samples)
+            censored = sum(self.censored)
+        if len(samples) == 0:
+            return {'count': 0}
+        return {
+            'count': len(samples),
+            'censored': censored,
+            'p50': samples[len(samples) // 2],
+            'p95': samples[min(int(len(samples) * 0.95), len(samples) - 1)],
+            'max': samples[-1],
+        }
 
 class LLMWrapper:
+    # shared by all wrappers, started on first use
+    chat_log: ChatLogSink = None
     def __init__(self, temperature=0.0):
         self.temperature = temperature
+        if LLMWrapper.chat_log is None:
+            LLMWrapper.chat_log = ChatLogSink(chat_log_path)
+        # per backend, fed by hedged plan requests only
+        self.latency: Dict[str, LatencyHistogram] = {}
+        # a hedged request is duplicated once the primary is slower than this percentile
+        self.hedge_percentile = 0.9
+        # used until the primary has enough latency samples
+        self.hedge_delay = 3.0
         self.llama_client = openai.OpenAI(
             # base_url="http://10.66.41.78:8000/v1",
-            base_url="http://localhost:8000/v1",
+            base_url=os.environ.get("LLAMA_SERVICE_URL", "http://localhost:8000/v1"),
             api_key="token-abc123",
         )
         self.gpt_client = openai.OpenAI(
             api_key=os.environ.get("OPENAI_API_KEY"),
         )
 
-    def request(self, prompt, model_name=GPT4, stream=False) -> str | Stream[ChatCompletion.ChatCompletionChunk]:
+    def get_client(self, model_name: str) -> openai.OpenAI:
         if model_name == LLAMA3:
-            client = self.llama_client
-        else:
-            client = self.gpt_client
-        
+            return self.llama_client
+        return self.gpt_client
+
+    def get_histogram(self, model_name: str) -> LatencyHistogram:
+        if model_name not in self.latency:
+            self.latency[model_name] = LatencyHistogram()
+        return self.latency[model_name]
+
+    def set_hedging(self, percentile: float = None, delay: float = None):
+        if percentile is not None:
+            self.hedge_percentile = percentile
+        if delay is not None:
+            self.hedge_delay = delay
+
+    def get_hedge_threshold(self, model_name: str) -> float:
+        threshold = self.get_histogram(model_name).percentile(self.hedge_percentile)
+        return self.hedge_delay if threshold is None else threshold
+
+    def request(self, prompt, model_name=GPT4, stream=False) -> str | Stream[ChatCompletion.ChatCompletionChunk]:
+        client = self.get_client(model_name)
+
+        start = time.time()
         response = client.chat.completions.create(
             model=model_name,
             messages=[{"role": "user", "content": prompt}],
@@ -34,13 +116,109 @@ class LLMWrapper:
             stream=stream,
         )
 
-        # save the message in a txt
-        with open(chat_log_path, "a") as f:
-            f.write(prompt + "\n---\n")
-            if not stream:
-                f.write(response.model_dump_json(indent=2) + "\n---\n")
+        # serialized and written by the sink thread
+        LLMWrapper.chat_log.log({
+            'time': start,
+            'model': model_name,
+            'stream': stream,
+            'latency': time.time() - start,
+            'prompt': prompt,
+            'response': None if stream else response,
+        })
 
         if stream:
             return response
+        # not recorded: short probe and class requests would pull down the
+        # percentiles that set the hedge threshold of plan requests
+        return response.choices[0].message.content
+
+    def complete(self, prompt: str, model_name: str, cancel: threading.Event) -> Optional[str]:
+        """Streams a full completion, returns None if `cancel` is set before it finishes."""
+        start = time.time()
+        response = self.get_client(model_name).chat.completions.create(
+            model=model_name,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=self.temperature,
+            stream=True,
+        )
+        parts = []
+        try:
+            for chunk in response:
+                if cancel.is_set():
+                    self.get_histogram(model_name).record(time.time() - start, censored=True)
+                    return None
+                if len(chunk.choices) > 0 and chunk.choices[0].delta.content is not None:
+                    parts.append(chunk.choices[0].delta.content)
+        finally:
+            # drops the connection, so a cancelled backend stops generating
+            response.close()
+        content = ''.join(parts)
+        self.get_histogram(model_name).record(time.time() - start)
+        LLMWrapper.chat_log.log({
+            'time': start,
+            'model': model_name,
+            'stream': False,
+            'latency': time.time() - start,
+            'prompt': prompt,
+            'response': content,
+        })
+        return content
+
+    def request_hedged(self, prompt: str, model_name: str = GPT4, validate: Callable[[str], bool] = None) -> str:
+        """
+            Sends the request to `model_name`, and a duplicate to its hedge partner if no
+            valid response arrived within the primary's hedge threshold (or the primary
+            failed). The first response accepted by `validate` wins, the other is cancelled.
+        """
+        partner = HEDGE_PARTNERS.get(model_name)
+        if partner is None:
+            return self.request(prompt, model_name)
+
+        results = queue.Queue()
+        cancel = threading.Event()
+        def attempt(model: str):
+            try:
+                results.put((model, self.complete(prompt, model, cancel), None))
+            except Exception as e:
+                results.put((model, None, e))
+
+        threading.Thread(target=attempt, args=(model_name,), daemon=True).start()
+        threshold = self.get_hedge_threshold(model_name)
+        pending = 1
+        hedged = False
+        fallback = None
+        error = None
+        try:
+            while pending > 0:
+                try:
+                    model, content, e = results.get(timeout=None if hedged else threshold)
+                except queue.Empty:
+                    print_t(f"[L] No response from {model_name} after {threshold:.2f}s, hedging to {partner}")
+                    threading.Thread(target=attempt, args=(partner,), daemon=True).start()
+                    pending += 1
+                    hedged = True
+                    continue
+                pending -= 1
+                if e is not None:
+                    print_t(f"[L] Request to {model} failed: {e}")
+                    error = e
+                elif validate is None or validate(content):
+                    if hedged:
+                        print_t(f"[L] Hedged request won by {model}")
+                    return content
+                elif fallback is None:
+                    fallback = content
+                if not hedged:
+                    threading.Thread(target=attempt, args=(partner,), daemon=True).start()
+                    pending += 1
+                    hedged = True
+        finally:
+            cancel.set()
+
+        # no valid response, the first one still reaches the interpreter for its error
+        if fallback is not None:
+            return fallback
+        raise error
 
-        return response.choices[0].message.content
\ No newline at end of file
+    def latency_stats(self) -> Dict[str, dict]:
+        return {model: histogram.summary() for model, histogram in self.latency.items()}
\ No newline at end of file
@@ -1,19 +1,24 @@
-from typing import List, Tuple, Union
+from abc import ABC, abstractmethod
+from typing import List, Tuple, Union, Dict, NamedTuple
 import re
 from enum import Enum
 import time
+from collections import OrderedDict
+from functools import lru_cache
 from typing import Optional
-from threading import Thread
-from queue import Queue
+from threading import Thread, Lock, Condition
+from queue import Queue, Empty
 from openai import ChatCompletion, Stream
-from .skillset import SkillSet
-from .utils import split_args, print_t
+from .skillset import SkillSet, HighLevelSkillItem
+from .abs.skill_item import SkillArg
+from .utils import print_t
 
 def print_debug(*args):
     print(*args)
     # pass
 
-MiniSpecValueType = Union[int, float, bool, str, None]
+# dicts come from skills that return several fields at once, e.g. object_info
+MiniSpecValueType = Union[int, float, bool, str, None, Dict[str, Union[int, float]]]
 
 def evaluate_value(value: str) -> MiniSpecValueType:
     if value.isdigit():
@@ -30,84 +35,746 @@ def evaluate_value(value: str) -> MiniSpecValueType:
         return value.strip('\'"')
 
 class MiniSpecReturnValue:
-    def __init__(self, value: MiniSpecValueType, replan: bool):
+    def __init__(self, value: MiniSpecValueType, replan: bool, ret: bool = False):
         self.value = value
         self.replan = replan
+        # set when a `->` statement ends the enclosing program
+        self.ret = ret
 
     def from_tuple(t: Tuple[MiniSpecValueType, bool]):
         return MiniSpecReturnValue(t[0], t[1])
-    
+
     def default():
         return MiniSpecReturnValue(None, False)
-    
+
     def __repr__(self) -> str:
         return f'value={self.value}, replan={self.replan}'
-    
-class ParsingState(Enum):
-    CODE = 0
-    ARGUMENTS = 1
-    CONDITION = 2
-    LOOP_COUNT = 3
-    SUB_STATEMENTS = 4
+
+class TokenType(Enum):
+    STRING = 0
+    NUMBER = 1
+    RETURN = 2
+    COMPARATOR = 3
+    VARIABLE = 4
+    PARAMETER = 5
+    NAME = 6
+    SYMBOL = 7
+    END = 8
+    # unquoted free text in argument position, e.g. `p(any animal here?)`
+    TEXT = 9
+
+class Token(NamedTuple):
+    type: TokenType
+    text: str
+    pos: int
+
+TOKEN_PATTERN = re.compile(r'''
+     (?P<STRING>'[^']*'|"[^"]*")
+    |(?P<NUMBER>-?(?:\d+\.\d*|\.\d+|\d+))
+    |(?P<RETURN>->)
+    |(?P<COMPARATOR>==|!=|>|<)
+    |(?P<VARIABLE>_\w*)
+    |(?P<PARAMETER>\$\d+)
+    |(?P<NAME>[A-Za-z]\w*)
+    |(?P<SYMBOL>[?{}();,=&|])
+    |(?P<SPACE>\s+)
+    |(?P<MISMATCH>.)
+''', re.VERBOSE | re.DOTALL)
+
+# arguments that are tokenized as code, anything else is taken as raw text
+CODE_ARGUMENT = re.compile(r"""'[^']*'|"[^"]*"|-?(?:\d+\.\d*|\.\d+|\d+)|_\w*|\$\d+|[A-Za-z]\w*\s*\(.*\)""", re.DOTALL)
+
+def is_quote(code: str, i: int) -> bool:
+    # a quote right after a letter is an apostrophe, as in `what's`
+    return code[i] in '\'"' and (i == 0 or not code[i - 1].isalnum())
+
+def argument_end(code: str, pos: int) -> int:
+    """Position of the `,` or `)` that ends the argument starting at `pos`."""
+    depth = 0
+    quote = None
+    for i in range(pos, len(code)):
+        c = code[i]
+        if quote is not None:
+            if c == quote:
+                quote = None
+        elif is_quote(code, i):
+            quote = c
+        elif c == '(':
+            depth += 1
+        elif c == ')':
+            if depth == 0:
+                return i
+            depth -= 1
+        elif c == ',' and depth == 0:
+            return i
+    return len(code)
+
+def tokenize(code: str) -> List[Token]:
+    tokens = []
+    # for each open parenthesis, whether it holds call arguments
+    calls = []
+    pos = 0
+    while pos < len(code):
+        previous = tokens[-1] if len(tokens) > 0 else None
+        if previous is not None and previous.type == TokenType.SYMBOL and len(calls) > 0 and calls[-1] \
+                and previous.text in ('(', ','):
+            # arguments are free text unless they read as code, as the
+            # character parser took them: `p(any animal here?)`, `q(what's on the table)`
+            end = argument_end(code, pos)
+            text = code[pos:end].strip()
+            if text and CODE_ARGUMENT.fullmatch(text) is None:
+                tokens.append(Token(TokenType.TEXT, text, pos))
+                pos = end
+                continue
+        match = TOKEN_PATTERN.match(code, pos)
+        kind = match.lastgroup
+        pos = match.end()
+        if kind == 'SPACE':
+            continue
+        if kind == 'MISMATCH':
+            raise Exception(f'Unexpected character {match.group()!r} at {match.start()} in: {code}')
+        token = Token(TokenType[kind], match.group(), match.start())
+        if token.type == TokenType.SYMBOL and token.text == '(':
+            calls.append(previous is not None and previous.type == TokenType.NAME)
+        elif token.type == TokenType.SYMBOL and token.text == ')' and len(calls) > 0:
+            calls.pop()
+        tokens.append(token)
+    tokens.append(Token(TokenType.END, '', len(code)))
+    return tokens
+
+"""
+    Typed AST of a compiled MiniSpec program. Expressions evaluate to a value,
+    statements additionally report `ret` when a return ends the program.
+"""
+class Node(ABC):
+    @abstractmethod
+    def eval(self, env: dict) -> MiniSpecReturnValue:
+        pass
+
+class Literal(Node):
+    def __init__(self, value: MiniSpecValueType, text: str):
+        self.value = value
+        # unquoted source text, used for compile-time argument coercion
+        self.text = text
+        self.result = MiniSpecReturnValue(value, False)
+
+    def eval(self, env: dict) -> MiniSpecReturnValue:
+        return self.result
+
+    def __repr__(self) -> str:
+        return repr(self.value)
+
+class Variable(Node):
+    def __init__(self, name: str):
+        self.name = name
+
+    def eval(self, env: dict) -> MiniSpecReturnValue:
+        if self.name not in env:
+            raise Exception(f'Variable {self.name} is not defined')
+        return MiniSpecReturnValue(env[self.name], False)
+
+    def __repr__(self) -> str:
+        return self.name
+
+class Parameter(Node):
+    """Positional argument `$n` of a high-level skill, bound in the skill's env."""
+    def __init__(self, name: str):
+        self.name = name
+
+    def eval(self, env: dict) -> MiniSpecReturnValue:
+        if self.name not in env:
+            raise Exception(f'Parameter {self.name} is not bound')
+        return MiniSpecReturnValue(env[self.name], False)
+
+    def __repr__(self) -> str:
+        return self.name
+
+class CallKind(Enum):
+    BUILTIN = 0
+    LOW_LEVEL = 1
+    HIGH_LEVEL = 2
+
+BUILTIN_FUNCTIONS = {
+    'int': (int, [SkillArg("value", int)]),
+    'float': (float, [SkillArg("value", float)]),
+    'str': (str, [SkillArg("value", str)]),
+}
+
+class Call(Node):
+    def __init__(self, name: str, kind: CallKind, target, arg_specs: List[Optional[SkillArg]], args: List[Node]):
+        self.name = name
+        self.kind = kind
+        # builtin callable, LowLevelSkillItem or HighLevelSkillItem
+        self.target = target
+        self.args = args
+        # static arguments are coerced once here, dynamic ones at call time
+        self.arg_specs = arg_specs
+        self.static_args = all(isinstance(arg, Literal) for arg in args)
+        self.static_values = [arg.value for arg in args] if self.static_args else None
+        # resolved on first call, high-level skills may refer to each other
+        self.compiled_skill: Optional[CompiledSkill] = None
+        # actions may change what the robot sees, perception skills wait for the detector classes
+        self.invalidates_perception = kind == CallKind.LOW_LEVEL and not target.perception
+        self.reads_perception = kind == CallKind.LOW_LEVEL and target.perception
+
+    def eval(self, env: dict) -> MiniSpecReturnValue:
+        if self.static_args:
+            values = self.static_values
+        else:
+            values = []
+            for arg, spec in zip(self.args, self.arg_specs):
+                ret_val = arg.eval(env)
+                if ret_val.replan:
+                    return MiniSpecReturnValue(ret_val.value, True)
+                value = ret_val.value
+                if spec is not None and isinstance(value, str):
+                    value = spec.parse(value)
+                values.append(value)
+
+        if self.kind == CallKind.BUILTIN:
+            return MiniSpecReturnValue(self.target(values[0]), False)
+        elif self.kind == CallKind.LOW_LEVEL:
+            print_debug(f'Executing low-level skill: {self.target.get_name()} {values}')
+            if self.reads_perception and Statement.perception is not None:
+                Statement.perception.wait_classes()
+            ret_val = MiniSpecReturnValue.from_tuple(self.target.skill_callable(*values))
+            if self.invalidates_perception and Statement.perception is not None:
+                Statement.perception.invalidate()
+            return ret_val
+        else:
+            print_debug(f'Executing high-level skill: {self.target.get_name()} {values}')
+            if self.compiled_skill is None:
+                self.compiled_skill = CompiledSkill.get(self.target)
+            return self.compiled_skill.eval(values, self.static_args)
+
+    def __repr__(self) -> str:
+        return f'{self.name}({", ".join(repr(arg) for arg in self.args)})'
+
+class Comparison(Node):
+    def __init__(self, left: Node, comparator: Optional[str], right: Optional[Node]):
+        self.left = left
+        self.comparator = comparator
+        self.right = right
+
+    def eval(self, env: dict) -> MiniSpecReturnValue:
+        operand_1 = self.left.eval(env)
+        if operand_1.replan:
+            return operand_1
+        # a bare operand is tested for truthiness
+        if self.comparator is None:
+            return MiniSpecReturnValue(bool(operand_1.value), False)
+        operand_2 = self.right.eval(env)
+        if operand_2.replan:
+            return operand_2
+
+        print_debug(f'Condition ops: {operand_1.value} {self.comparator} {operand_2.value}')
+
+        if type(operand_1.value) != type(operand_2.value):
+            if self.comparator == '!=':
+                return MiniSpecReturnValue(True, False)
+            elif self.comparator == '==':
+                return MiniSpecReturnValue(False, False)
+            else:
+                raise Exception(f'Invalid comparator: {operand_1.value}:{type(operand_1.value)} {operand_2.value}:{type(operand_2.value)}')
+
+        if self.comparator == '>':
+            cmp = operand_1.value > operand_2.value
+        elif self.comparator == '<':
+            cmp = operand_1.value < operand_2.value
+        elif self.comparator == '==':
+            cmp = operand_1.value == operand_2.value
+        else:
+            cmp = operand_1.value != operand_2.value
+        return MiniSpecReturnValue(cmp, False)
+
+    def __repr__(self) -> str:
+        if self.comparator is None:
+            return repr(self.left)
+        return f'{self.left}{self.comparator}{self.right}'
+
+class Conjunction(Node):
+    def __init__(self, operands: List[Node]):
+        self.operands = operands
+
+    def eval(self, env: dict) -> MiniSpecReturnValue:
+        cond = True
+        for operand in self.operands:
+            ret_val = operand.eval(env)
+            if ret_val.replan:
+                return ret_val
+            cond = cond and ret_val.value
+        return MiniSpecReturnValue(cond, False)
+
+    def __repr__(self) -> str:
+        return '&'.join(repr(operand) for operand in self.operands)
+
+class Disjunction(Node):
+    def __init__(self, operands: List[Node]):
+        self.operands = operands
+
+    def eval(self, env: dict) -> MiniSpecReturnValue:
+        for operand in self.operands:
+            ret_val = operand.eval(env)
+            if ret_val.replan:
+                return ret_val
+            if ret_val.value == True:
+                return MiniSpecReturnValue(True, False)
+        return MiniSpecReturnValue(False, False)
+
+    def __repr__(self) -> str:
+        return '|'.join(repr(operand) for operand in self.operands)
+
+class Assignment(Node):
+    def __init__(self, variable: str, expression: Node):
+        self.variable = variable
+        self.expression = expression
+
+    def eval(self, env: dict) -> MiniSpecReturnValue:
+        ret_val = self.expression.eval(env)
+        if not ret_val.replan:
+            env[self.variable] = ret_val.value
+        return ret_val
+
+    def __repr__(self) -> str:
+        return f'{self.variable}={self.expression}'
+
+class Return(Node):
+    def __init__(self, expression: Node):
+        self.expression = expression
+
+    def eval(self, env: dict) -> MiniSpecReturnValue:
+        ret_val = self.expression.eval(env)
+        return MiniSpecReturnValue(ret_val.value, ret_val.replan, True)
+
+    def __repr__(self) -> str:
+        return f'->{self.expression}'
+
+class Block(Node):
+    def __init__(self, statements: List[Node]):
+        self.statements = statements
+
+    def eval(self, env: dict) -> MiniSpecReturnValue:
+        ret_val = MiniSpecReturnValue.default()
+        for statement in self.statements:
+            ret_val = statement.eval(env)
+            if ret_val.replan or ret_val.ret:
+                return ret_val
+        return ret_val
+
+    def __repr__(self) -> str:
+        return ';'.join(repr(statement) for statement in self.statements)
+
+class Conditional(Node):
+    def __init__(self, condition: Node, body: Block):
+        self.condition = condition
+        self.body = body
+
+    def eval(self, env: dict) -> MiniSpecReturnValue:
+        ret_val = self.condition.eval(env)
+        if ret_val.replan:
+            return ret_val
+        if ret_val.value:
+            return self.body.eval(env)
+        return MiniSpecReturnValue.default()
+
+    def __repr__(self) -> str:
+        return f'?{self.condition}{{{self.body}}}'
+
+class Loop(Node):
+    def __init__(self, count: int, body: Block):
+        self.count = count
+        self.body = body
+
+    def eval(self, env: dict) -> MiniSpecReturnValue:
+        ret_val = MiniSpecReturnValue.default()
+        for _ in range(self.count):
+            ret_val = self.body.eval(env)
+            if ret_val.replan or ret_val.ret:
+                return ret_val
+        return ret_val
+
+    def __repr__(self) -> str:
+        return f'{self.count}{{{self.body}}}'
+
+class MiniSpecCompiler:
+    """Compiles MiniSpec source into a typed AST with skills resolved."""
+    def __init__(self, low_level_skillset: SkillSet, high_level_skillset: SkillSet, params: Optional[dict] = None):
+        self.low_level_skillset = low_level_skillset
+        self.high_level_skillset = high_level_skillset
+        # `$n` values folded in as literals when specializing a high-level skill
+        self.params = params
+        self.tokens: List[Token] = []
+        self.index = 0
+        self.code = ''
+
+    def compile(self, code: str) -> Block:
+        self.code = code
+        self.tokens = tokenize(code)
+        self.index = 0
+        program = self.parse_program()
+        if self.peek().type != TokenType.END:
+            self.error('Unexpected token')
+        return program
+
+    def peek(self) -> Token:
+        return self.tokens[self.index]
+
+    def next(self) -> Token:
+        token = self.tokens[self.index]
+        self.index += 1
+        return token
+
+    def accept(self, text: str) -> bool:
+        token = self.tokens[self.index]
+        if token.type == TokenType.SYMBOL and token.text == text:
+            self.index += 1
+            return True
+        return False
+
+    def expect(self, text: str):
+        if not self.accept(text):
+            self.error(f'Expected {text!r}')
+
+    def error(self, message: str):
+        token = self.peek()
+        raise Exception(f'{message} at {token.pos} ({token.text!r}) in: {self.code}')
+
+    def parse_program(self) -> Block:
+        statements = []
+        while True:
+            token = self.peek()
+            if token.type == TokenType.END or (token.type == TokenType.SYMBOL and token.text == '}'):
+                break
+            if self.accept(';'):
+                continue
+            statements.append(self.parse_statement())
+        return Block(statements)
+
+    def parse_body(self) -> Block:
+        self.expect('{')
+        body = self.parse_program()
+        self.expect('}')
+        return body
+
+    def parse_statement(self) -> Node:
+        token = self.peek()
+        if token.type == TokenType.NUMBER:
+            self.next()
+            if not token.text.isdigit():
+                self.error('Loop count must be a positive integer')
+            return Loop(int(token.text), self.parse_body())
+        elif token.type == TokenType.SYMBOL and token.text == '?':
+            self.next()
+            condition = self.parse_condition()
+            return Conditional(condition, self.parse_body())
+        elif token.type == TokenType.RETURN:
+            self.next()
+            return Return(self.parse_operand())
+        elif token.type == TokenType.VARIABLE:
+            self.next()
+            self.expect('=')
+            return Assignment(token.text, self.parse_operand())
+        elif token.type == TokenType.NAME:
+            return self.parse_call()
+        self.error('Invalid statement')
+
+    def parse_condition(self) -> Node:
+        # `|` binds tighter than `&`
+        operands = [self.parse_disjunction()]
+        while self.accept('&'):
+            operands.append(self.parse_disjunction())
+        return operands[0] if len(operands) == 1 else Conjunction(operands)
+
+    def parse_disjunction(self) -> Node:
+        operands = [self.parse_comparison()]
+        while self.accept('|'):
+            operands.append(self.parse_comparison())
+        return operands[0] if len(operands) == 1 else Disjunction(operands)
+
+    def parse_comparison(self) -> Node:
+        left = self.parse_operand()
+        if self.peek().type != TokenType.COMPARATOR:
+            return Comparison(left, None, None)
+        comparator = self.next().text
+        return Comparison(left, comparator, self.parse_operand())
+
+    def parse_operand(self) -> Node:
+        token = self.peek()
+        if token.type == TokenType.STRING:
+            self.next()
+            return Literal(token.text[1:-1], token.text[1:-1])
+        elif token.type == TokenType.NUMBER:
+            self.next()
+            value = float(token.text) if '.' in token.text else int(token.text)
+            return Literal(value, token.text)
+        elif token.type == TokenType.VARIABLE:
+            self.next()
+            return Variable(token.text)
+        elif token.type == TokenType.PARAMETER:
+            self.next()
+            if self.params is not None and token.text in self.params:
+                value = self.params[token.text]
+                return Literal(value, str(value))
+            return Parameter(token.text)
+        elif token.type == TokenType.NAME:
+            if token.text in ('True', 'False', 'None'):
+                self.next()
+                return Literal(evaluate_value(token.text), token.text)
+            return self.parse_call()
+        self.error('Invalid operand')
+
+    def parse_argument(self) -> Node:
+        token = self.peek()
+        # free text in argument position is a string, e.g. `iv(bottle)`
+        if token.type == TokenType.TEXT:
+            self.next()
+            return Literal(evaluate_value(token.text) if token.text in ('True', 'False', 'None') else token.text, token.text)
+        return self.parse_operand()
+
+    def parse_call(self) -> Call:
+        token = self.next()
+        name = token.text
+        args = []
+        if self.accept('('):
+            if not self.accept(')'):
+                args.append(self.parse_argument())
+                while self.accept(','):
+                    args.append(self.parse_argument())
+                self.expect(')')
+        return self.resolve_call(name, args)
+
+    def resolve_call(self, name: str, args: List[Node]) -> Call:
+        if name in BUILTIN_FUNCTIONS:
+            target, arg_specs = BUILTIN_FUNCTIONS[name]
+            kind = CallKind.BUILTIN
+        else:
+            target = self.low_level_skillset.get_skill(name)
+            kind = CallKind.LOW_LEVEL
+            if target is None:
+                target = self.high_level_skillset.get_skill(name)
+                kind = CallKind.HIGH_LEVEL
+            if target is None:
+                raise Exception(f'Skill {name} is not defined')
+            arg_specs = target.get_argument()
+
+        if len(args) != len(arg_specs):
+            raise ValueError(f"Skill {name}: expected {len(arg_specs)} arguments, but got {len(args)}.")
+
+        for i, arg in enumerate(args):
+            if isinstance(arg, Literal):
+                try:
+                    value = arg_specs[i].parse(arg.text)
+                except ValueError as e:
+                    raise ValueError(f"Skill {name}: error parsing argument {i + 1}. Expected type {arg_specs[i].arg_type.__name__}, but got value '{arg.text}'. Original error: {e}")
+                args[i] = Literal(value, arg.text)
+        return Call(name, kind, target, arg_specs, args)
+
+@lru_cache(maxsize=256)
+def compile_minispec(code: str, low_level_skillset: SkillSet, high_level_skillset: SkillSet) -> Block:
+    """Compiles (and caches) a MiniSpec program against the given skillsets."""
+    return MiniSpecCompiler(low_level_skillset, high_level_skillset).compile(code)
+
+def check_minispec(code: str, low_level_skillset: SkillSet, high_level_skillset: SkillSet) -> Optional[str]:
+    """Returns the first error found compiling the program statement by statement, None if it is valid."""
+    splitter = StatementSplitter()
+    statements = splitter.feed(code)
+    if not splitter.closed:
+        statements += splitter.flush()
+    if len(statements) == 0:
+        return 'Empty program'
+    for source in statements:
+        try:
+            compile_minispec(source.strip(), low_level_skillset, high_level_skillset)
+        except Exception as e:
+            return str(e)
+    return None
+
+HIGH_LEVEL_SKILL_CACHE_SIZE = 64
+
+class CompiledSkill:
+    """
+        Compiled definition of a high-level skill, built once per HighLevelSkillItem.
+        Arguments are bound into the skill's env as `$1..$n`; calls with only
+        literal arguments reuse an LRU of instances specialized for them.
+    """
+    def __init__(self, skill: HighLevelSkillItem):
+        self.skill = skill
+        self.body = MiniSpecCompiler(skill.low_level_skillset, skill.high_level_skillset).compile(skill.definition)
+        self.specialized: OrderedDict[tuple, Block] = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(skill: HighLevelSkillItem) -> 'CompiledSkill':
+        if skill.compiled is None:
+            skill.compiled = CompiledSkill(skill)
+        return skill.compiled
+
+    def bind(self, values: List[MiniSpecValueType]) -> dict:
+        return {f'${i + 1}': value for i, value in enumerate(values)}
+
+    def specialize(self, values: List[MiniSpecValueType]) -> Block:
+        key = tuple(values)
+        with self.lock:
+            program = self.specialized.get(key)
+            if program is not None:
+                self.specialized.move_to_end(key)
+                self.hits += 1
+                return program
+            self.misses += 1
+        program = MiniSpecCompiler(self.skill.low_level_skillset, self.skill.high_level_skillset,
+                                   self.bind(values)).compile(self.skill.definition)
+        with self.lock:
+            self.specialized[key] = program
+            if len(self.specialized) > HIGH_LEVEL_SKILL_CACHE_SIZE:
+                self.specialized.popitem(last=False)
+        return program
+
+    def eval(self, values: List[MiniSpecValueType], static: bool) -> MiniSpecReturnValue:
+        if static:
+            val = self.specialize(values).eval({})
+        else:
+            val = self.body.eval(self.bind(values))
+        if val.value == 'rp':
+            return MiniSpecReturnValue(f'High-level skill {self.skill.get_name()} failed', True)
+        return MiniSpecReturnValue(val.value, val.replan)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self.specialized)}
+
+def skill_cache_stats(high_level_skillset: SkillSet) -> Dict[str, dict]:
+    """Hit/miss counters of the specialized instances of each compiled high-level skill."""
+    stats = {}
+    for name, skill in high_level_skillset.skills.items():
+        if skill.compiled is not None:
+            stats[name] = skill.compiled.stats()
+    return stats
+
+class StatementSplitter:
+    """Finds complete top-level statements in incrementally arriving MiniSpec code."""
+    DELIMITERS = re.compile(r'[{}();\'"]')
+
+    def __init__(self):
+        self.buffer = ''
+        self.scan_pos = 0
+        self.brace_depth = 0
+        self.paren_depth = 0
+        self.quote = None
+        # set when a `}` closes the enclosing program
+        self.closed = False
+
+    def feed(self, code: str) -> List[str]:
+        statements = []
+        if self.closed:
+            return statements
+        self.buffer += code
+        start = 0
+        for match in StatementSplitter.DELIMITERS.finditer(self.buffer, self.scan_pos):
+            c = match.group()
+            if self.quote is not None:
+                if c == self.quote:
+                    self.quote = None
+                continue
+            if is_quote(self.buffer, match.start()):
+                self.quote = c
+            elif c == '(':
+                self.paren_depth += 1
+            elif c == ')':
+                self.paren_depth -= 1
+            elif c == '{':
+                self.brace_depth += 1
+            elif c == '}':
+                if self.brace_depth == 0:
+                    statements.append(self.buffer[start:match.start()])
+                    self.buffer = ''
+                    self.scan_pos = 0
+                    self.closed = True
+                    return [s for s in statements if s.strip()]
+                self.brace_depth -= 1
+                if self.brace_depth == 0:
+                    statements.append(self.buffer[start:match.end()])
+                    start = match.end()
+            elif c == ';' and self.brace_depth == 0 and self.paren_depth == 0:
+                statements.append(self.buffer[start:match.start()])
+                start = match.end()
+        self.buffer = self.buffer[start:]
+        self.scan_pos = len(self.buffer)
+        return [s for s in statements if s.strip()]
+
+    def flush(self) -> List[str]:
+        rest = self.buffer
+        self.buffer = ''
+        self.scan_pos = 0
+        return [rest] if rest.strip() else []
 
 class MiniSpecProgram:
-    def __init__(self, env: Optional[dict] = None) -> None:
+    def __init__(self, env: Optional[dict] = None, execution_queue: Optional[Queue] = None) -> None:
         self.statements: List[Statement] = []
-        self.depth = 0
         self.finished = False
         self.ret = False
         if env is None:
             self.env = {}
         else:
             self.env = env
-        self.current_statement = Statement(self.env)
+        self.splitter = StatementSplitter()
+        # statements added with exec=True go to the executor of the owning interpreter
+        self.execution_queue = execution_queue
+        # signalled whenever a statement is added or parsing finishes
+        self.updated = Condition()
 
     def parse(self, code_instance: Stream[ChatCompletion.ChatCompletionChunk] | List[str], exec: bool = False) -> bool:
-        for chunk in code_instance:
-            if isinstance(chunk, str):
-                code = chunk
-            else:
-                code = chunk.choices[0].delta.content
-            if code == None or len(code) == 0:
-                continue
-            for c in code:
-                if self.current_statement.parse(c, exec):
-                    if len(self.current_statement.action) > 0:
-                        print_debug("Adding statement: ", self.current_statement, exec)
-                        self.statements.append(self.current_statement)
-                    self.current_statement = Statement(self.env)
-                if c == '{':
-                    self.depth += 1
-                elif c == '}':
-                    if self.depth == 0:
-                        self.finished = True
-                        return True
-                    self.depth -= 1
-        return False
-    
+        if isinstance(code_instance, str):
+            code_instance = [code_instance]
+        try:
+            for chunk in code_instance:
+                if isinstance(chunk, str):
+                    code = chunk
+                elif len(chunk.choices) == 0:
+                    continue
+                else:
+                    code = chunk.choices[0].delta.content
+                if code == None or len(code) == 0:
+                    continue
+                for source in self.splitter.feed(code):
+                    self.add_statement(source, exec)
+                if self.splitter.closed:
+                    return True
+            for source in self.splitter.flush():
+                self.add_statement(source, exec)
+            return True
+        finally:
+            with self.updated:
+                self.finished = True
+                self.updated.notify_all()
+
+    def add_statement(self, source: str, exec: bool):
+        statement = Statement(source, self.env)
+        print_debug("Adding statement: ", statement, exec)
+        with self.updated:
+            self.statements.append(statement)
+            self.updated.notify_all()
+        if exec:
+            self.execution_queue.put(statement)
+
     def eval(self) -> MiniSpecReturnValue:
         print_debug(f'Eval program: {self}, finished: {self.finished}')
         ret_val = MiniSpecReturnValue.default()
         count = 0
-        while not self.finished:
-            if len(self.statements) <= count:
-                time.sleep(0.1)
-                continue
-            ret_val = self.statements[count].eval()
-            if ret_val.replan or self.statements[count].ret:
-                print_debug(f'RET from {self.statements[count]} with {ret_val} {self.statements[count].ret}')
+        while True:
+            with self.updated:
+                while count >= len(self.statements) and not self.finished:
+                    self.updated.wait()
+                if count >= len(self.statements):
+                    return ret_val
+                statement = self.statements[count]
+            ret_val = statement.eval()
+            if ret_val.replan or ret_val.ret:
+                print_debug(f'RET from {statement} with {ret_val}')
                 self.ret = True
                 return ret_val
             count += 1
-        if count < len(self.statements):
-            for i in range(count, len(self.statements)):
-                ret_val = self.statements[i].eval()
-                if ret_val.replan or self.statements[count].ret:
-                    print_debug(f'RET from {self.statements[count]} with {ret_val} {self.statements[count].ret}')
-                    self.ret = True
-                    return ret_val
-        return ret_val
-    
+
     def __repr__(self) -> str:
         s = ''
         for statement in self.statements:
@@ -115,243 +782,32 @@ class MiniSpecProgram:
         return s
 
 class Statement:
-    execution_queue: Queue['Statement'] = None
     low_level_skillset: SkillSet = None
     high_level_skillset: SkillSet = None
-    def __init__(self, env: dict) -> None:
-        self.code_buffer: str = ''
-        self.parsing_state: ParsingState = ParsingState.CODE
-        self.condition: Optional[str] = None
-        self.loop_count: Optional[int] = None
-        self.action: str = ''
-        self.allow_digit: bool = False
-        self.executable: bool = False
-        self.ret: bool = False
-        self.sub_statements: Optional[MiniSpecProgram] = None
+    # pinned for each statement (pin/invalidate/release), e.g. the VisionSkillWrapper;
+    # perception skills first wait for its detector classes (wait_classes)
+    perception = None
+    def __init__(self, source: str, env: dict) -> None:
+        self.source = source.strip()
         self.env = env
-        self.read_argument: bool = False
-
-    def get_env_value(self, var) -> MiniSpecValueType:
-        if var not in self.env:
-            raise Exception(f'Variable {var} is not defined')
-        return self.env[var]
-
-    def parse(self, code: str, exec: bool = False) -> bool:
-        for c in code:
-            match self.parsing_state:
-                case ParsingState.CODE:
-                    if c == '?' and not self.read_argument:
-                        self.action = 'if'
-                        self.parsing_state = ParsingState.CONDITION
-                    elif c == ';' or c == '}' or c == ')':
-                        if c == ')':
-                            self.code_buffer += c
-                            self.read_argument = False
-                        self.action = self.code_buffer
-                        print_debug(f'SP Action: {self.code_buffer}')
-                        self.executable = True
-                        if exec and self.action != '':
-                            self.execution_queue.put(self)
-                        return True
-                    else:
-                        if c == '(':
-                            self.read_argument = True
-                        if c.isalpha() or c == '_':
-                            self.allow_digit = True
-                        self.code_buffer += c
-                    if c.isdigit() and not self.allow_digit:
-                        self.action = 'loop'
-                        self.parsing_state = ParsingState.LOOP_COUNT
-                case ParsingState.CONDITION:
-                    if c == '{':
-                        print_debug(f'SP Condition: {self.code_buffer}')
-                        self.condition = self.code_buffer
-                        self.executable = True
-                        if exec:
-                            self.execution_queue.put(self)
-                        self.sub_statements = MiniSpecProgram(self.env)
-                        self.parsing_state = ParsingState.SUB_STATEMENTS
-                    else:
-                        self.code_buffer += c
-                case ParsingState.LOOP_COUNT:
-                    if c == '{':
-                        print_debug(f'SP Loop: {self.code_buffer}')
-                        self.loop_count = int(self.code_buffer)
-                        self.executable = True
-                        if exec:
-                            self.execution_queue.put(self)
-                        self.sub_statements = MiniSpecProgram(self.env)
-                        self.parsing_state = ParsingState.SUB_STATEMENTS
-                    else:
-                        self.code_buffer += c
-                case ParsingState.SUB_STATEMENTS:
-                    if self.sub_statements.parse([c]):
-                        return True
-        return False
-    
-    def eval(self) -> MiniSpecReturnValue:
-        print_debug(f'Statement eval: {self} {self.action} {self.condition} {self.loop_count}')
-        while not self.executable:
-            time.sleep(0.1)
-        if self.action == 'if':
-            ret_val = self.eval_condition(self.condition)
-            if ret_val.replan:
-                return ret_val
-            if ret_val.value:
-                print_debug(f'-> eval condition statement: {self.sub_statements}')
-                ret_val = self.sub_statements.eval()
-                if ret_val.replan or self.sub_statements.ret:
-                    self.ret = True
-                return ret_val
-            else:
-                return MiniSpecReturnValue.default()
-        elif self.action == 'loop':
-            print_debug(f'-> eval loop statement: {self.loop_count} {self.sub_statements}')
-            ret_val = MiniSpecReturnValue.default()
-            for _ in range(self.loop_count):
-                print_debug(f'-> loop iteration: {ret_val}')
-                ret_val = self.sub_statements.eval()
-                if ret_val.replan or self.sub_statements.ret:
-                    self.ret = True
-                    return ret_val
-            return ret_val
-        else:
-            return self.eval_action(self.action)
-    
-    def eval_action(self, action: str) -> MiniSpecReturnValue:
-        action = action.strip()
-        print_debug(f'Eval action: {action}')
-        
-        if '=' in action:
-            var, func = action.split('=')
-            print_debug(f'Assignment: Var: {var.strip()}, Val: {func.strip()}')
-            ret_val = self.eval_function(func.strip())
-            if not ret_val.replan:
-                self.env[var.strip()] = ret_val.value
-            return ret_val
-        elif action.startswith('->'):
-            self.ret = True
-            return self.eval_var(action.lstrip("->"))
-        else:
-            return self.eval_function(action)
-
-    def eval_function(self, func: str) -> MiniSpecReturnValue:
-        print_debug(f'Eval function: {func}')
-        # append to execution state queue
-        func = func.split('(', 1)
-        name = func[0].strip()
-        if len(func) == 2:
-            args = func[1].strip()[:-1]
-            args = split_args(args)
-            for i in range(0, len(args)):
-                args[i] = args[i].strip().strip('\'"')
-                if args[i].startswith('_'):
-                    args[i] = self.get_env_value(args[i])
-        else:
-            args = []
-
-        if name == 'int':
-            return MiniSpecReturnValue(int(args[0]), False)
-        elif name == 'float':
-            return MiniSpecReturnValue(float(args[0]), False)
-        elif name == 'str':
-            return MiniSpecReturnValue(args[0], False)
-        else:
-            skill_instance = Statement.low_level_skillset.get_skill(name)
-            if skill_instance is not None:
-                print_debug(f'Executing low-level skill: {skill_instance.get_name()} {args}')
-                return MiniSpecReturnValue.from_tuple(skill_instance.execute(args))
-
-            skill_instance = Statement.high_level_skillset.get_skill(name)
-            if skill_instance is not None:
-                print_debug(f'Executing high-level skill: {skill_instance.get_name()}', args, skill_instance.execute(args))
-                interpreter = MiniSpecProgram()
-                interpreter.parse([skill_instance.execute(args)])
-                interpreter.finished = True
-                val = interpreter.eval()
-                if val.value == 'rp':
-                    return MiniSpecReturnValue(f'High-level skill {skill_instance.get_name()} failed', True)
-                return val
-            raise Exception(f'Skill {name} is not defined')
-
-    def eval_var(self, var: str) -> MiniSpecReturnValue:
-        var = var.strip()
-        if len(var) == 0:
-            raise Exception('Empty operand')
-        if var.startswith('_'):
-            return MiniSpecReturnValue(self.get_env_value(var), False)
-        elif var == 'True' or var == 'False':
-            return MiniSpecReturnValue(evaluate_value(var), False)
-        elif var[0].isalpha():
-            return self.eval_action(var)
-        else:
-            return MiniSpecReturnValue(evaluate_value(var), False)
-
-    def eval_condition(self, condition: str) -> MiniSpecReturnValue:
-        if '&' in condition:
-            conditions = condition.split('&')
-            cond = True
-            for c in conditions:
-                ret_val = self.eval_condition(c)
-                if ret_val.replan:
-                    return ret_val
-                cond = cond and ret_val.value
-            return MiniSpecReturnValue(cond, False)
-        if '|' in condition:
-            conditions = condition.split('|')
-            for c in conditions:
-                ret_val = self.eval_condition(c)
-                if ret_val.replan:
-                    return ret_val
-                if ret_val.value == True:
-                    return MiniSpecReturnValue(True, False)
-            return MiniSpecReturnValue(False, False)
-        
-        operand_1, comparator, operand_2 = re.split(r'(>|<|==|!=)', condition)
-        operand_1 = self.eval_var(operand_1)
-        if operand_1.replan:
-            return operand_1
-        operand_2 = self.eval_var(operand_2)
-        if operand_2.replan:
-            return operand_2
-        
-        print_debug(f'Condition ops: {operand_1.value} {comparator} {operand_2.value}')
+        self.ret: bool = False
+        self.program: Block = compile_minispec(self.source, Statement.low_level_skillset, Statement.high_level_skillset)
 
-        if type(operand_1.value) != type(operand_2.value):
-            if comparator == '!=':
-                return MiniSpecReturnValue(True, False)
-            elif comparator == '==':
-                return MiniSpecReturnValue(False, False)
-            else:
-                raise Exception(f'Invalid comparator: {operand_1.value}:{type(operand_1.value)} {operand_2.value}:{type(operand_2.value)}')
-            
-        if comparator == '>':
-            cmp = operand_1.value > operand_2.value
-        elif comparator == '<':
-            cmp = operand_1.value < operand_2.value
-        elif comparator == '==':
-            cmp = operand_1.value == operand_2.value
-        elif comparator == '!=':
-            cmp = operand_1.value != operand_2.value
+    def eval(self) -> MiniSpecReturnValue:
+        print_debug(f'Statement eval: {self}')
+        if Statement.perception is None:
+            ret_val = self.program.eval(self.env)
         else:
-            raise Exception(f'Invalid comparator: {comparator}')
-        
-        return MiniSpecReturnValue(cmp, False)
+            Statement.perception.pin()
+            try:
+                ret_val = self.program.eval(self.env)
+            finally:
+                Statement.perception.release()
+        self.ret = ret_val.ret
+        return ret_val
 
     def __repr__(self) -> str:
-        s = ''
-        if self.action == 'if':
-            s += f'if {self.condition}'
-        elif self.action == 'loop':
-            s += f'[{self.loop_count}]'
-        else:
-            s += f'{self.action}'
-        if self.sub_statements is not None:
-            s += ' {'
-            for statement in self.sub_statements.statements:
-                s += f'{statement}; '
-            s += '}'
-        return s
+        return self.source
 
 class MiniSpecInterpreter:
     def __init__(self):
@@ -362,48 +818,77 @@ class MiniSpecInterpreter:
         if Statement.low_level_skillset is None or \
             Statement.high_level_skillset is None:
             raise Exception('Statement: Skillset is not initialized')
-        
-        Statement.execution_queue = Queue()
-        self.execution_thread = Thread(target=self.executor)
-        self.execution_thread.start()
 
         self.timestamp_get_plan = None
         self.timestamp_start_execution = None
         self.timestamp_end_execution = None
-        self.program_count = 0
+        self.timestamp_first_action = None
+        self.program: Optional[MiniSpecProgram] = None
+        # receives the final MiniSpecReturnValue, or the exception that stopped execution
         self.ret_queue = Queue()
 
+        # `None` in the queue marks the end of the program
+        self.execution_queue: Queue[Optional[Statement]] = Queue()
+        self.execution_thread = Thread(target=self.executor)
+        self.execution_thread.start()
+
     def execute(self, code: Stream[ChatCompletion.ChatCompletionChunk] | List[str]) -> MiniSpecReturnValue:
         print_t(f'>>> Get a stream')
         self.execution_history = []
         self.timestamp_get_plan = time.time()
-        program = MiniSpecProgram()
-        program.parse(code, True)
-        self.program_count = len(program.statements)
+        program = MiniSpecProgram(execution_queue=self.execution_queue)
+        self.program = program
+        try:
+            program.parse(code, True)
+        finally:
+            self.execution_queue.put(None)
         t2 = time.time()
         print_t(">>> Program: ", program, "Time: ", t2 - self.timestamp_get_plan)
 
+    def wait(self, timeout: Optional[float] = None) -> MiniSpecReturnValue:
+        """Blocks until the program finishes, re-raising any error from the executor."""
+        ret_val = self.ret_queue.get(timeout=timeout)
+        if isinstance(ret_val, Exception):
+            raise ret_val
+        return ret_val
+
+    def stop(self):
+        """Drops the statements not started yet, lets the running one finish and joins the executor."""
+        while True:
+            try:
+                self.execution_queue.get_nowait()
+            except Empty:
+                break
+        self.execution_queue.put(None)
+        self.execution_thread.join()
+
     def executor(self):
+        ret_val = MiniSpecReturnValue.default()
         while True:
-            if not Statement.execution_queue.empty():
-                if self.timestamp_start_execution is None:
-                    self.timestamp_start_execution = time.time()
-                    print_t(">>> Start execution")
-                statement = Statement.execution_queue.get()
-                print_debug(f'Queue get statement: {statement}')
+            statement = self.execution_queue.get()
+            if statement is None:
+                break
+            if self.timestamp_start_execution is None:
+                self.timestamp_start_execution = time.time()
+                if self.timestamp_first_action is None:
+                    self.timestamp_first_action = self.timestamp_start_execution
+                print_t(">>> Start execution")
+            print_debug(f'Queue get statement: {statement}')
+            try:
                 ret_val = statement.eval()
-                print_t(f'Queue statement done: {statement}')
-                self.execution_history.append(statement)
-                if ret_val.replan:
-                    print_t(f'Queue statement replan: {statement}')
-                    self.ret_queue.put(ret_val)
-                    return
-                self.program_count -= 1
-                if self.program_count == 0:
-                    self.timestamp_end_execution = time.time()
-                    print_t(f'>>> Execution time: {self.timestamp_end_execution - self.timestamp_start_execution}')
-                    self.timestamp_start_execution = None
-                    self.ret_queue.put(ret_val)
-                    return
-            else:
-                time.sleep(0.005)
\ No newline at end of file
+            except Exception as e:
+                print_t(f'Queue statement error: {statement}: {e}')
+                self.ret_queue.put(e)
+                return
+            print_t(f'Queue statement done: {statement}')
+            self.execution_history.append(statement)
+            if ret_val.replan:
+                print_t(f'Queue statement replan: {statement}')
+                break
+            if statement.ret:
+                break
+        if self.timestamp_start_execution is not None:
+            self.timestamp_end_execution = time.time()
+            print_t(f'>>> Execution time: {self.timestamp_end_execution - self.timestamp_start_execution}')
+            self.timestamp_start_execution = None
+        self.ret_queue.put(ret_val)
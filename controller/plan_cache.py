@@ -0,0 +1,115 @@
+import re, time, json
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+def normalize_task(task_description: str) -> str:
+    task = re.sub(r'\s+', ' ', task_description.strip().lower())
+    return task.rstrip('.!?')
+
+'''
+Plan cache keyed on task, scene signature, model and skillset version.
+Entries live in an in-memory LRU backed by a sqlite file, so they survive restarts.
+'''
+class PlanCache():
+    def __init__(self, path: Optional[str] = None, capacity: int = 128, ttl: float = 24 * 3600):
+        self.capacity = capacity
+        self.ttl = ttl
+        # key -> (plan, created, normalized task, version)
+        self.memory: OrderedDict[str, Tuple[str, float, str, str]] = OrderedDict()
+        self.lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.db = None
+        if path is not None:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute('CREATE TABLE IF NOT EXISTS plans (key TEXT PRIMARY KEY, task TEXT, version TEXT, plan TEXT, created REAL)')
+            self.db.commit()
+
+    def make_key(task_description: str, scene_signature: str, model_name: str, version: str) -> str:
+        data = json.dumps([normalize_task(task_description), scene_signature, model_name, version])
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def expired(self, created: float) -> bool:
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def get(self, key: str) -> Optional[str]:
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                if not self.expired(entry[1]):
+                    self.memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return entry[0]
+                del self.memory[key]
+            if self.db is not None:
+                row = self.db.execute('SELECT plan, created, task, version FROM plans WHERE key = ?', (key,)).fetchone()
+                if row is not None and not self.expired(row[1]):
+                    self.remember(key, row)
+                    self.disk_hits += 1
+                    return row[0]
+            self.misses += 1
+            return None
+
+    def put(self, key: str, plan: str, task_description: str = '', version: str = ''):
+        entry = (plan, time.time(), normalize_task(task_description), version)
+        with self.lock:
+            self.remember(key, entry)
+            if self.db is not None:
+                self.db.execute('INSERT OR REPLACE INTO plans (key, plan, created, task, version) VALUES (?, ?, ?, ?, ?)',
+                                (key, *entry))
+                self.db.commit()
+
+    def remove(self, key: str):
+        with self.lock:
+            self.memory.pop(key, None)
+            if self.db is not None:
+                self.db.execute('DELETE FROM plans WHERE key = ?', (key,))
+                self.db.commit()
+
+    def remember(self, key: str, entry: Tuple[str, float, str, str]):
+        self.memory[key] = entry
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.capacity:
+            self.memory.popitem(last=False)
+
+    def invalidate(self, task_description: Optional[str] = None, keep_version: Optional[str] = None):
+        """Drops the plans of one task (all tasks if None), and of any skillset version but `keep_version`."""
+        task = normalize_task(task_description) if task_description is not None else None
+        with self.lock:
+            for key, entry in list(self.memory.items()):
+                if (task is None or entry[2] == task) and (keep_version is None or entry[3] != keep_version):
+                    del self.memory[key]
+            if self.db is not None:
+                query = 'DELETE FROM plans WHERE 1'
+                params = []
+                if task is not None:
+                    query += ' AND task = ?'
+                    params.append(task)
+                if keep_version is not None:
+                    query += ' AND version != ?'
+                    params.append(keep_version)
+                self.db.execute(query, params)
+                self.db.commit()
+
+    def prune(self):
+        """Removes expired plans from the disk store."""
+        if self.ttl is None or self.db is None:
+            return
+        with self.lock:
+            self.db.execute('DELETE FROM plans WHERE created < ?', (time.time() - self.ttl,))
+            self.db.commit()
+
+    def report(self) -> dict:
+        with self.lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': (self.memory_hits + self.disk_hits) / lookups if lookups > 0 else 0.0,
+                'size': len(self.memory),
+            }
@@ -0,0 +1,86 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Tuple, Any
+
+class InFlight():
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+'''
+Short-lived cache for probe answers keyed on question and scene signature. Concurrent
+lookups of a missing key share one computation instead of each asking the LLM.
+'''
+class ProbeCache():
+    def __init__(self, capacity: int = 256, ttl: float = 10.0):
+        self.capacity = capacity
+        self.ttl = ttl
+        # key -> (value, created)
+        self.entries: OrderedDict[str, Tuple[Any, float]] = OrderedDict()
+        self.in_flight: Dict[str, InFlight] = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.collapsed = 0
+
+    def make_key(question: str, scene_signature: str, model_name: str) -> str:
+        scene = hashlib.sha256(scene_signature.encode()).hexdigest()
+        return f'{model_name}|{scene}|{question.strip()}'
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if time.time() - entry[1] <= self.ttl:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                del self.entries[key]
+            flight = self.in_flight.get(key)
+            if flight is not None:
+                self.collapsed += 1
+                owner = False
+            else:
+                flight = InFlight()
+                self.in_flight[key] = flight
+                self.misses += 1
+                owner = True
+
+        if not owner:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = compute()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+                if flight.error is None:
+                    self.entries[key] = (flight.value, time.time())
+                    if len(self.entries) > self.capacity:
+                        self.entries.popitem(last=False)
+            flight.done.set()
+        return flight.value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses + self.collapsed
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'collapsed': self.collapsed,
+                'hit_rate': (self.hits + self.collapsed) / lookups if lookups > 0 else 0.0,
+                'size': len(self.entries),
+            }
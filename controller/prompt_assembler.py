@@ -0,0 +1,113 @@
+import re, string
+from typing import Optional, List, Tuple
+
+from .utils import print_t
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+EXAMPLE_SEPARATOR = re.compile(r'\n\s*\n(?=Example \d+:)')
+
+'''
+Renders a prompt template as a static prefix (skills, guides, examples) and a
+per-request suffix (scene, task, history). The prefix is rendered once per
+skillset version and kept byte-identical, so provider-side prefix caching applies.
+'''
+class PromptAssembler():
+    def __init__(self, template: str, static_fields: List[str], examples_field: str = 'plan_examples',
+                 history_field: str = 'execution_history', token_budget: Optional[int] = None):
+        pieces = list(string.Formatter().parse(template))
+        split = len(pieces)
+        for i, (_, field_name, _, _) in enumerate(pieces):
+            if field_name is not None and field_name not in static_fields:
+                split = i
+                break
+        self.prefix_pieces = pieces[:split]
+        self.suffix_pieces = pieces[split:]
+        self.dynamic_fields = [name for _, name, _, _ in self.suffix_pieces if name is not None and name not in static_fields]
+        self.static_fields = static_fields
+        self.examples_field = examples_field
+        self.history_field = history_field
+        # examples are trimmed first, then the oldest history entries
+        self.token_budget = token_budget
+        self.encoder = None
+        if tiktoken is not None:
+            try:
+                self.encoder = tiktoken.get_encoding('cl100k_base')
+            except Exception as e:
+                # the encoding is downloaded on first use, which fails offline
+                print_t(f"[P] tiktoken encoding unavailable, estimating tokens: {e}")
+
+        self.version = None
+        self.static_values = {}
+        self.examples: List[str] = []
+        # number of examples kept -> (prefix, token count per section)
+        self.prefix_cache = {}
+        self.last_report = {}
+
+    def count_tokens(self, text: str) -> int:
+        if self.encoder is None:
+            # rough estimate without tiktoken
+            return (len(text) + 3) // 4
+        return len(self.encoder.encode(text))
+
+    def set_static(self, version: str, **values):
+        if version == self.version:
+            return
+        self.version = version
+        self.static_values = {name: str(value) for name, value in values.items()}
+        self.examples = EXAMPLE_SEPARATOR.split(self.static_values.get(self.examples_field, ''))
+        self.prefix_cache = {}
+
+    def render(self, pieces: List[Tuple], values: dict) -> str:
+        formatter = string.Formatter()
+        parts = []
+        for literal_text, field_name, format_spec, conversion in pieces:
+            parts.append(literal_text)
+            if field_name is not None:
+                value = formatter.convert_field(values[field_name], conversion)
+                parts.append(format(value, format_spec))
+        return ''.join(parts)
+
+    def get_prefix(self, example_count: int) -> Tuple[str, dict]:
+        if example_count not in self.prefix_cache:
+            values = dict(self.static_values)
+            if self.examples_field in values:
+                values[self.examples_field] = '\n\n'.join(self.examples[:example_count])
+            prefix = self.render(self.prefix_pieces, values)
+            tokens = {'prefix': self.count_tokens(prefix)}
+            for name, value in values.items():
+                tokens[name] = self.count_tokens(value)
+            self.prefix_cache[example_count] = (prefix, tokens)
+        return self.prefix_cache[example_count]
+
+    def assemble(self, max_examples: Optional[int] = None, **dynamic_values) -> str:
+        """Renders the prompt within the token budget, the section token counts go to `last_report`."""
+        if self.version is None:
+            raise ValueError("Static prompt fields are not set.")
+        history = dynamic_values.get(self.history_field)
+        example_count = len(self.examples) if max_examples is None else min(max_examples, len(self.examples))
+        while True:
+            prefix, tokens = self.get_prefix(example_count)
+            report = dict(tokens)
+            suffix = self.render(self.suffix_pieces, {**self.static_values, **dynamic_values, self.history_field: history})
+            report['suffix'] = self.count_tokens(suffix)
+            for name in self.dynamic_fields:
+                value = history if name == self.history_field else dynamic_values.get(name)
+                report[name] = self.count_tokens(str(value))
+            report['total'] = report['prefix'] + report['suffix']
+            report['examples'] = example_count
+
+            if self.token_budget is None or report['total'] <= self.token_budget:
+                break
+            if example_count > 0:
+                example_count -= 1
+            elif isinstance(history, list) and len(history) > 0:
+                history = history[1:]
+            else:
+                print_t(f"[P] Prompt exceeds token budget: {report['total']} > {self.token_budget}")
+                break
+        self.last_report = report
+        return prefix + suffix
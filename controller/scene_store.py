@@ -0,0 +1,147 @@
+import bisect
+import numpy as np
+from typing import List, Optional, Dict, Tuple
+
+from .tracker_bank import TrackerBank
+
+GRID_SIZE = 8
+
+class ObjectInfo:
+    def __init__(self, name, x, y, w, h, timestamp: float = 0) -> None:
+        self.name = name
+        self.x = float(x)
+        self.y = float(y)
+        self.w = float(w)
+        self.h = float(h)
+        # time of the last detection
+        self.timestamp = timestamp
+
+    def __str__(self) -> str:
+        return f"{self.name} x:{self.x:.2f} y:{self.y:.2f} width:{self.w:.2f} height:{self.h:.2f}"
+
+'''
+Indexed view of the tracked objects of the current frame. Names are kept in a
+sorted list for prefix lookups (`bottle` finds `bottle_3`), positions in a grid
+for spatial queries. Among several matches the oldest track wins, as with the
+linear scan over the object list.
+'''
+class SceneStore():
+    def __init__(self, trackers: TrackerBank, grid_size: int = GRID_SIZE):
+        self.trackers = trackers
+        self.grid_size = grid_size
+        self.sorted_names: List[str] = []
+        self.names: List[str] = []
+        # positions in `names`, the tracker bank may already hold newer names
+        self.name_index: Dict[str, int] = {}
+        self.states = np.zeros((0, 4))
+        self.timestamps = np.zeros(0)
+        # built on first use after each refresh
+        self.objects_cache: Dict[int, ObjectInfo] = {}
+        self.grid: Optional[Dict[Tuple[int, int], List[int]]] = None
+
+    def refresh(self):
+        """Takes over the tracker states of a new frame."""
+        names, self.states = self.trackers.states()
+        self.timestamps = self.trackers.timestamp[:len(names)].copy()
+        if names != self.names:
+            previous = set(self.names)
+            current = set(names)
+            for name in previous - current:
+                del self.sorted_names[bisect.bisect_left(self.sorted_names, name)]
+            for name in current - previous:
+                bisect.insort(self.sorted_names, name)
+        self.names = names
+        self.name_index = {name: i for i, name in enumerate(names)}
+        self.objects_cache = {}
+        self.grid = None
+
+    def copy(self) -> 'SceneStore':
+        """Snapshot that later refreshes leave unchanged."""
+        scene = SceneStore(self.trackers, self.grid_size)
+        scene.sorted_names = list(self.sorted_names)
+        scene.names = self.names
+        scene.name_index = self.name_index
+        scene.states = self.states
+        scene.timestamps = self.timestamps
+        return scene
+
+    def get_index(self, object_name: str) -> Optional[int]:
+        index = self.name_index.get(object_name)
+        if index is not None:
+            return index
+        start = bisect.bisect_left(self.sorted_names, object_name)
+        end = start
+        while end < len(self.sorted_names) and self.sorted_names[end].startswith(object_name):
+            end += 1
+        if start == end:
+            return None
+        return min(self.name_index[name] for name in self.sorted_names[start:end])
+
+    def get_object(self, index: int) -> ObjectInfo:
+        obj = self.objects_cache.get(index)
+        if obj is None:
+            obj = ObjectInfo(self.names[index], *self.states[index], timestamp=float(self.timestamps[index]))
+            self.objects_cache[index] = obj
+        return obj
+
+    def get(self, object_name: str) -> Optional[ObjectInfo]:
+        index = self.get_index(object_name)
+        return None if index is None else self.get_object(index)
+
+    def objects(self) -> List[ObjectInfo]:
+        return [self.get_object(i) for i in range(len(self.names))]
+
+    def matching(self, object_name: Optional[str]) -> List[int]:
+        if object_name is None:
+            return list(range(len(self.names)))
+        start = bisect.bisect_left(self.sorted_names, object_name)
+        indices = []
+        for name in self.sorted_names[start:]:
+            if not name.startswith(object_name):
+                break
+            indices.append(self.name_index[name])
+        return indices
+
+    def cell(self, x: float, y: float) -> Tuple[int, int]:
+        return (min(max(int(x * self.grid_size), 0), self.grid_size - 1),
+                min(max(int(y * self.grid_size), 0), self.grid_size - 1))
+
+    def build_grid(self):
+        self.grid = {}
+        for i, (x, y) in enumerate(self.states[:, :2].tolist()):
+            self.grid.setdefault(self.cell(x, y), []).append(i)
+
+    def nearest(self, x: float, y: float, object_name: Optional[str] = None) -> Optional[ObjectInfo]:
+        """Closest object to (x, y), optionally among the names starting with `object_name`."""
+        if len(self.names) == 0:
+            return None
+        if self.grid is None:
+            self.build_grid()
+        allowed = None if object_name is None else set(self.matching(object_name))
+        cx, cy = self.cell(x, y)
+        best, best_distance = None, None
+        for ring in range(self.grid_size):
+            # objects beyond this ring are at least `ring` cells away
+            if best is not None and best_distance <= (ring - 1) / self.grid_size:
+                break
+            for gx in range(cx - ring, cx + ring + 1):
+                for gy in range(cy - ring, cy + ring + 1):
+                    if max(abs(gx - cx), abs(gy - cy)) != ring:
+                        continue
+                    for i in self.grid.get((gx, gy), []):
+                        if allowed is not None and i not in allowed:
+                            continue
+                        distance = float(np.hypot(self.states[i, 0] - x, self.states[i, 1] - y))
+                        if best_distance is None or distance < best_distance:
+                            best, best_distance = i, distance
+        return None if best is None else self.get_object(best)
+
+    def extreme(self, side: str, object_name: Optional[str] = None) -> Optional[ObjectInfo]:
+        """Leftmost, rightmost, topmost or bottommost object."""
+        indices = self.matching(object_name)
+        if len(indices) == 0:
+            return None
+        axis = 0 if side in ('left', 'right') else 1
+        values = self.states[indices, axis]
+        position = int(np.argmin(values)) if side in ('left', 'top') else int(np.argmax(values))
+        return self.get_object(indices[position])
@@ -5,31 +5,42 @@ import numpy as np
 import threading
 import time
 
+from .detection_result import DetectionResult
+
+'''
+A captured image with optional depth. Only the representation the frame was
+created from is stored; the PIL image or the NumPy buffer is converted on
+first access and cached, so consumers that stay with the capture format never
+pay for the other one.
+'''
 class Frame():
+    __slots__ = ('_image', '_image_buffer', '_depth')
+
     def __init__(self, image: Image.Image | NDArray[np.uint8]=None, depth: Optional[NDArray[np.int16]]=None):
+        self._image = None
+        self._image_buffer = None
         if image is None:
             self._image_buffer = np.zeros((352, 640, 3), dtype=np.uint8)
-            self._image = Image.fromarray(self._image_buffer)
-        if isinstance(image, np.ndarray):
+        elif isinstance(image, np.ndarray):
             self._image_buffer = image
-            self._image = Image.fromarray(image)
         elif isinstance(image, Image.Image):
             self._image = image
-            self._image_buffer = np.array(image)
         self._depth = depth
-    
+
     @property
     def image(self) -> Image.Image:
+        if self._image is None:
+            self._image = Image.fromarray(self._image_buffer)
         return self._image
-    
+
     @property
     def depth(self) -> Optional[NDArray[np.int16]]:
         return self._depth
-    
+
     @image.setter
     def image(self, image: Image.Image):
         self._image = image
-        self._image_buffer = np.array(image)
+        self._image_buffer = None
 
     @depth.setter
     def depth(self, depth: Optional[NDArray[np.int16]]):
@@ -37,25 +48,51 @@ class Frame():
 
     @property
     def image_buffer(self) -> NDArray[np.uint8]:
+        if self._image_buffer is None:
+            self._image_buffer = np.array(self._image)
         return self._image_buffer
-    
+
     @image_buffer.setter
     def image_buffer(self, image_buffer: NDArray[np.uint8]):
         self._image_buffer = image_buffer
-        self._image = Image.fromarray(image_buffer)
+        self._image = None
+
+    @property
+    def image_view(self) -> NDArray[np.uint8]:
+        """Read-only view of the buffer, for consumers that must not modify the frame."""
+        view = self.image_buffer.view()
+        view.flags.writeable = False
+        return view
+
+    def to_image(self, size: Optional[tuple[int, int]]=None) -> Image.Image:
+        """PIL image, optionally resized; a conversion done only for this is not cached."""
+        image = self._image if self._image is not None else Image.fromarray(self._image_buffer)
+        if size is not None and image.size != size:
+            image = image.resize(size)
+        return image
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by the cached representations, depth excluded."""
+        total = 0
+        if self._image_buffer is not None:
+            total += self._image_buffer.nbytes
+        if self._image is not None:
+            total += len(self._image.getbands()) * self._image.width * self._image.height
+        return total
 
 class SharedFrame():
     def __init__(self):
         self.timestamp = 0
         self.frame = Frame()
-        self.yolo_result = {}
+        self.yolo_result = DetectionResult()
         self.lock = threading.Lock()
 
     def get_image(self) -> Optional[Image.Image]:
         with self.lock:
             return self.frame.image
     
-    def get_yolo_result(self) -> dict:
+    def get_yolo_result(self) -> DetectionResult:
         with self.lock:
             return self.yolo_result
     
@@ -63,7 +100,12 @@ class SharedFrame():
         with self.lock:
             return self.frame.depth
         
-    def set(self, frame: Frame, yolo_result: dict):
+    def snapshot(self) -> tuple[float, Frame, DetectionResult]:
+        """Timestamp, frame and detections taken together under the lock."""
+        with self.lock:
+            return self.timestamp, self.frame, self.yolo_result
+
+    def set(self, frame: Frame, yolo_result: DetectionResult):
         with self.lock:
             self.frame = frame
             self.timestamp = time.time()
@@ -50,13 +50,15 @@ class SkillSet():
 
 class LowLevelSkillItem(SkillItem):
     def __init__(self, skill_name: str, skill_callable: callable,
-                 skill_description: str = "", args: List[SkillArg] = []):
+                 skill_description: str = "", args: List[SkillArg] = [], perception: bool = False):
         self.skill_name = skill_name
         self.abbr = self.generate_abbreviation(skill_name)
         self.abbr_dict[self.abbr] = skill_name
         self.skill_callable = skill_callable
         self.skill_description = skill_description
         self.args = args
+        # only reads the scene, so it does not invalidate the perception snapshot
+        self.perception = perception
 
     def get_name(self) -> str:
         return self.skill_name
@@ -91,6 +93,8 @@ class HighLevelSkillItem(SkillItem):
         self.skill_description = skill_description
         self.low_level_skillset = None
         self.args = []
+        # CompiledSkill, built by the MiniSpec interpreter on first call
+        self.compiled = None
 
     def load_from_dict(skill_dict: dict):
         return HighLevelSkillItem(skill_dict["skill_name"], skill_dict["definition"], skill_dict["skill_description"])
@@ -108,6 +112,7 @@ class HighLevelSkillItem(SkillItem):
         self.low_level_skillset = low_level_skillset
         self.high_level_skillset = high_level_skillset
         self.args = self.generate_argument_list()
+        self.compiled = None
 
     def generate_argument_list(self) -> List[SkillArg]:
         # Extract all skill calls with their arguments from the code
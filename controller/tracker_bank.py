@@ -0,0 +1,121 @@
+import time
+import numpy as np
+from typing import List, Optional, Tuple, Dict
+from numpy.typing import NDArray
+
+# constant velocity model over (x, y, vx, vy), measuring (x, y); same as the filterpy
+# ObjectTracker it replaced, see test/tracker-benchmark.py
+F = np.array([[1, 0, 1, 0],
+              [0, 1, 0, 1],
+              [0, 0, 1, 0],
+              [0, 0, 0, 1]], dtype=np.float64)
+R = np.eye(2) * 2
+Q = np.eye(4) * 0.01
+INITIAL_P = np.eye(4) * 1000
+IDENTITY = np.eye(4)
+
+'''
+Kalman filters of all tracked objects stored as arrays, so predict and update
+run as batched NumPy operations instead of one filterpy object per name. Each
+slot behaves like the former ObjectTracker: it is created by its first measurement and
+expires when it has not been updated for `expiry` seconds.
+'''
+class TrackerBank():
+    def __init__(self, capacity: int = 32, expiry: float = 0.8, gate: Optional[float] = None):
+        self.expiry = expiry
+        # squared Mahalanobis distance above which a measurement is ignored, None to accept all
+        self.gate = gate
+        self.count = 0
+        self.names: List[str] = []
+        self.index: Dict[str, int] = {}
+        self.x = np.zeros((capacity, 4))
+        self.P = np.zeros((capacity, 4, 4))
+        self.size = np.zeros((capacity, 2))
+        self.timestamp = np.zeros(capacity)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def reserve(self, capacity: int):
+        if capacity <= len(self.x):
+            return
+        capacity = max(capacity, len(self.x) * 2)
+        for attr in ['x', 'P', 'size', 'timestamp']:
+            old = getattr(self, attr)
+            new = np.zeros((capacity,) + old.shape[1:])
+            new[:self.count] = old[:self.count]
+            setattr(self, attr, new)
+
+    def slot(self, name: str) -> int:
+        index = self.index.get(name)
+        if index is None:
+            self.reserve(self.count + 1)
+            index = self.count
+            self.count += 1
+            self.names.append(name)
+            self.index[name] = index
+            self.x[index] = 0
+            self.P[index] = INITIAL_P
+        return index
+
+    def update(self, names: List[str], measurements: NDArray[np.float64], now: Optional[float] = None):
+        """Applies (x, y, w, h) measurements, one row per name; repeated names are applied in order."""
+        if len(names) == 0:
+            return
+        now = time.time() if now is None else now
+        measurements = np.asarray(measurements, dtype=np.float64).reshape(-1, 4)
+        slots = np.array([self.slot(name) for name in names])
+        if len(set(names)) == len(names):
+            self.update_slots(slots, measurements, now)
+            return
+        pending = np.arange(len(slots))
+        while len(pending) > 0:
+            # a filter is updated at most once per round
+            _, first = np.unique(slots[pending], return_index=True)
+            batch = pending[first]
+            self.update_slots(slots[batch], measurements[batch], now)
+            pending = np.setdiff1d(pending, batch, assume_unique=True)
+
+    def update_slots(self, slots: NDArray[np.int64], measurements: NDArray[np.float64], now: float):
+        x = self.x[slots]
+        P = self.P[slots]
+        y = measurements[:, :2] - x[:, :2]
+        S = P[:, :2, :2] + R
+        S_inv = np.linalg.inv(S)
+        if self.gate is not None:
+            distance = np.einsum('ni,nij,nj->n', y, S_inv, y)
+            accepted = distance <= self.gate
+            slots, measurements, x, P, y, S_inv = (a[accepted] for a in (slots, measurements, x, P, y, S_inv))
+        K = P[:, :, :2] @ S_inv
+        self.x[slots] = x + np.einsum('nij,nj->ni', K, y)
+        # Joseph form, as filterpy does
+        I_KH = np.broadcast_to(IDENTITY, P.shape).copy()
+        I_KH[:, :, :2] -= K
+        self.P[slots] = I_KH @ P @ I_KH.transpose(0, 2, 1) + K @ R @ K.transpose(0, 2, 1)
+        self.size[slots] = measurements[:, 2:]
+        self.timestamp[slots] = now
+
+    def predict(self, now: Optional[float] = None):
+        """Drops expired trackers and advances the rest by one step."""
+        now = time.time() if now is None else now
+        n = self.count
+        expired = now - self.timestamp[:n] > self.expiry
+        if expired.any():
+            self.remove(expired)
+            n = self.count
+        self.x[:n] = self.x[:n] @ F.T
+        self.P[:n] = F @ self.P[:n] @ F.T + Q
+
+    def remove(self, mask: NDArray[np.bool_]):
+        keep = np.flatnonzero(~mask)
+        for attr in ['x', 'P', 'size', 'timestamp']:
+            array = getattr(self, attr)
+            array[:len(keep)] = array[keep]
+        self.names = [self.names[i] for i in keep]
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.count = len(keep)
+
+    def states(self) -> Tuple[List[str], NDArray[np.float64]]:
+        """Names and an (n, 4) array of (x, y, w, h)."""
+        n = self.count
+        return list(self.names), np.concatenate([self.x[:n, :2], self.size[:n]], axis=1)
@@ -9,13 +9,16 @@ class FrameReader:
         if not self.cap.isOpened():
             raise ValueError("Could not open video device")
 
-    @property
-    def frame(self):
-        # Read a frame from the video capture
+    def grab(self):
+        # Read a BGR frame from the video capture
         ret, frame = self.cap.read()
         if not ret:
             raise ValueError("Could not read frame")
-        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        return frame
+
+    @property
+    def frame(self):
+        return cv2.cvtColor(self.grab(), cv2.COLOR_BGR2RGB)
 
 class VirtualRobotWrapper(RobotWrapper):
     def __init__(self):
@@ -1,117 +1,153 @@
 from typing import Union, Tuple, Optional
-import numpy as np
-import time
-import cv2
-from filterpy.kalman import KalmanFilter
-from .shared_frame import SharedFrame
-
-class ObjectInfo:
-    def __init__(self, name, x, y, w, h) -> None:
-        self.name = name
-        self.x = float(x)
-        self.y = float(y)
-        self.w = float(w)
-        self.h = float(h)
-
-    def __str__(self) -> str:
-        return f"{self.name} x:{self.x:.2f} y:{self.y:.2f} width:{self.w:.2f} height:{self.h:.2f}"
-
-class ObjectTracker:
-    def __init__(self, name, x, y, w, h) -> None:
-        self.name = name
-        self.kf = self.init_filter()
-        self.timestamp = 0
-        self.size = None
-        self.update(x, y, w, h)
-
-    def update(self, x, y, w, h):
-        self.kf.update((x, y))
-        self.size = (w, h)
-        self.timestamp = time.time()
-
-    def predict(self) -> Optional[ObjectInfo]:
-        # if no update in 2 seconds, return None
-        if time.time() - self.timestamp > 0.8:
-            return None
-        self.kf.predict()
-        return ObjectInfo(self.name, self.kf.x[0][0], self.kf.x[1][0], self.size[0], self.size[1])
-
-    def init_filter(self):
-        kf = KalmanFilter(dim_x=4, dim_z=2)  # 4 state dimensions (x, y, vx, vy), 2 measurement dimensions (x, y)
-        kf.F = np.array([[1, 0, 1, 0],  # State transition matrix
-                        [0, 1, 0, 1],
-                        [0, 0, 1, 0],
-                        [0, 0, 0, 1]])
-        kf.H = np.array([[1, 0, 0, 0],  # Measurement function
-                        [0, 1, 0, 0]])
-        kf.R *= 2  # Measurement uncertainty
-        kf.P *= 1000  # Initial uncertainty
-        kf.Q *= 0.01  # Process uncertainty
-        return kf
+import os, time, re
+import threading
+from typing import List, Dict
+from .utils import print_t
+from .shared_frame import SharedFrame, Frame
+from .detection_result import DetectionResult
+from .tracker_bank import TrackerBank
+from .scene_store import SceneStore, ObjectInfo
+from .aruco_worker import ArucoWorker
+
+# longest a perception skill waits for the task's YOLO classes
+YOLO_CLASS_TIMEOUT = float(os.environ.get("YOLO_CLASS_TIMEOUT", "5.0"))
 
 class VisionSkillWrapper():
     def __init__(self, shared_frame: SharedFrame):
         self.shared_frame = shared_frame
         self.last_update = 0
-        self.object_trackers = {}
-        self.object_list = []
-        self.aruco_detector = cv2.aruco.ArucoDetector(
-            cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_4X4_250),
-            cv2.aruco.DetectorParameters())
+        self.trackers = TrackerBank()
+        self.scene = SceneStore(self.trackers)
+        self.frame = None
+        # guards the trackers, skills and UI read them from different threads
+        self.lock = threading.RLock()
+        # pins of the calling thread, each pinned thread reads its own copy of
+        # the scene until it invalidates, the others keep reading the latest frame
+        self.local = threading.local()
+        # fed with frames from the capture loop, see submit_frame()
+        self.aruco = ArucoWorker(self.merge_markers)
+        # cleared while the classes of a new task are chosen, see LLMController
+        self.classes_ready = threading.Event()
+        self.classes_ready.set()
+
+    def wait_classes(self) -> bool:
+        """Blocks a perception skill until the detector looks for the task's classes, at most YOLO_CLASS_TIMEOUT."""
+        if self.classes_ready.is_set():
+            return True
+        if not self.classes_ready.wait(YOLO_CLASS_TIMEOUT):
+            print_t("[V] YOLO classes are not set yet, reading anyway")
+            # the rest of the task does not wait again
+            self.classes_ready.set()
+            return False
+        return True
     
+    def pin(self):
+        """Makes the following reads of the calling thread share one snapshot, see MiniSpec `Statement.perception`."""
+        self.local.pins = getattr(self.local, 'pins', 0) + 1
+        self.local.scene = None
+
+    def invalidate(self):
+        """Lets the next read of the calling thread take a new snapshot, e.g. after the robot moved."""
+        self.local.scene = None
+
+    def release(self):
+        self.local.pins -= 1
+        if self.local.pins == 0:
+            self.local.scene = None
+            self.local.frame = None
+
     def update(self):
-        if self.shared_frame.timestamp == self.last_update:
+        if getattr(self.local, 'pins', 0) > 0 and self.local.scene is not None:
             return
-        self.last_update = self.shared_frame.timestamp
-        objs = self.shared_frame.get_yolo_result()['result'] + self.shared_frame.get_yolo_result()['result_custom']
-        for obj in objs:
-            name = obj['name']
-            box = obj['box']
-            x = (box['x1'] + box['x2']) / 2
-            y = (box['y1'] + box['y2']) / 2
-            w = box['x2'] - box['x1']
-            h = box['y2'] - box['y1']
-            if name not in self.object_trackers:
-                self.object_trackers[name] = ObjectTracker(name, x, y, w, h)
-            else:
-                self.object_trackers[name].update(x, y, w, h)
-
-        locs, ids, _ = self.aruco_detector.detectMarkers(self.shared_frame.frame.image_buffer)
-        for i, loc in enumerate(locs):
-            x = (loc[0][0][0] + loc[0][1][0] + loc[0][2][0] + loc[0][3][0]) / 4 / self.shared_frame.frame.image.width
-            y = (loc[0][0][1] + loc[0][1][1] + loc[0][2][1] + loc[0][3][1]) / 4 / self.shared_frame.frame.image.height + 0.1
-            w = abs(loc[0][1][0] - loc[0][0][0]) / self.shared_frame.frame.image.width
-            h = abs(loc[0][2][1] - loc[0][0][1]) / self.shared_frame.frame.image.height + 0.3
-            name = f'door_{ids[i][0]}'
-            if name not in self.object_trackers:
-                self.object_trackers[name] = ObjectTracker(name, x, y, w, h)
-            else:
-                self.object_trackers[name].update(x, y, w, h)
-        
-        self.object_list = []
-        to_delete = []
-        for name, tracker in self.object_trackers.items():
-            obj = tracker.predict()
-            if obj is not None:
-                self.object_list.append(obj)
-            else:
-                to_delete.append(name)
-        for name in to_delete:
-            del self.object_trackers[name]
+        with self.lock:
+            timestamp, frame, yolo_result = self.shared_frame.snapshot()
+            if timestamp != self.last_update:
+                self.last_update = timestamp
+                self.frame = frame
+                self.update_trackers(frame, yolo_result)
+            if getattr(self.local, 'pins', 0) > 0:
+                self.local.scene = self.scene.copy()
+                self.local.frame = self.frame
 
-    def get_obj_list(self) -> str:
+    def view(self) -> Tuple[SceneStore, Optional[Frame]]:
+        """The scene and frame the calling thread reads, its snapshot while pinned."""
         self.update()
+        if getattr(self.local, 'pins', 0) > 0:
+            return self.local.scene, self.local.frame
+        return self.scene, self.frame
+
+    def submit_frame(self, frame: Frame):
+        self.aruco.submit(frame)
+
+    def merge_markers(self, names: List[str], measurements: List[Tuple[float, float, float, float]], timestamp: float):
+        if len(names) == 0:
+            return
+        with self.lock:
+            self.trackers.update(names, measurements, timestamp)
+            # pinned snapshots pick the markers up once they are invalidated
+            self.scene.refresh()
+
+    def update_trackers(self, frame: Frame, yolo_result: DetectionResult):
+        now = time.time()
+        self.trackers.update(yolo_result.names, yolo_result.measurements(), now)
+        self.trackers.predict(now)
+        self.scene.refresh()
+
+    @property
+    def object_list(self) -> List[ObjectInfo]:
+        scene, _ = self.view()
+        with self.lock:
+            return scene.objects()
+
+    def get_obj_list(self) -> str:
         str_list = []
         for obj in self.object_list:
             str_list.append(str(obj))
         return str(str_list).replace("'", '')
 
-    def get_obj_info(self, object_name: str) -> ObjectInfo:
-        self.update()
+    def get_obj_signature(self, bins: int = 4) -> str:
+        """Coarse scene signature: object classes (without track id) and their binned positions."""
+        items = []
         for obj in self.object_list:
-            if obj.name.startswith(object_name):
-                return obj
-        return None
+            name = re.sub(r'_\d+$', '', obj.name)
+            x = min(max(int(obj.x * bins), 0), bins - 1)
+            y = min(max(int(obj.y * bins), 0), bins - 1)
+            items.append(f'{name}@{x},{y}')
+        return ','.join(sorted(items))
+
+    def get_obj_info(self, object_name: str) -> ObjectInfo:
+        scene, _ = self.view()
+        with self.lock:
+            return scene.get(object_name)
+
+    def get_attributes(self, info: ObjectInfo, frame: Optional[Frame]) -> Dict[str, Union[float, int]]:
+        return {'x': info.x, 'y': info.y, 'width': info.w, 'height': info.h,
+                'distance': self.get_distance(info, frame)}
+
+    def get_obj_infos(self) -> Dict[str, dict]:
+        """All attributes of every object, read from one snapshot."""
+        scene, frame = self.view()
+        with self.lock:
+            return {obj.name: self.get_attributes(obj, frame) for obj in scene.objects()}
+
+    def get_nearest_obj(self, x: float, y: float, object_name: Optional[str] = None) -> Optional[ObjectInfo]:
+        scene, _ = self.view()
+        with self.lock:
+            return scene.nearest(x, y, object_name)
+
+    def get_extreme_obj(self, side: str, object_name: Optional[str] = None) -> Optional[ObjectInfo]:
+        """`side` is one of left, right, top, bottom."""
+        scene, _ = self.view()
+        with self.lock:
+            return scene.extreme(side, object_name)
+
+    def object_info(self, object_name: str) -> Tuple[Union[Dict[str, Union[float, int]], str], bool]:
+        scene, frame = self.view()
+        with self.lock:
+            info = scene.get(object_name)
+            if info is None:
+                return f'object_info: {object_name} is not in sight', True
+            return self.get_attributes(info, frame), False
 
     def is_visible(self, object_name: str) -> Tuple[bool, bool]:
         return self.get_obj_info(object_name) is not None, False
@@ -141,18 +177,25 @@ class VisionSkillWrapper():
         return info.h, False
     
     def object_distance(self, object_name: str) -> Tuple[Union[int, str], bool]:
-        info = self.get_obj_info(object_name)
-        if info is None:
-            return f'object_distance: {object_name} not in sight', True
+        scene, frame = self.view()
+        with self.lock:
+            info = scene.get(object_name)
+            if info is None:
+                return f'object_distance: {object_name} not in sight', True
+            return self.get_distance(info, frame), False
+
+    def get_distance(self, info: ObjectInfo, frame: Optional[Frame] = None) -> int:
         mid_point = (info.x, info.y)
         FOV_X = 0.42
         FOV_Y = 0.55
         if mid_point[0] < 0.5 - FOV_X / 2 or mid_point[0] > 0.5 + FOV_X / 2 \
         or mid_point[1] < 0.5 - FOV_Y / 2 or mid_point[1] > 0.5 + FOV_Y / 2:
-            return 30, False
-        depth = self.shared_frame.get_depth().data
+            return 30
+        if frame is None:
+            frame = self.frame if self.frame is not None else self.shared_frame.frame
+        depth = frame.depth.data
         start_x = 0.5 - FOV_X / 2
         start_y = 0.5 - FOV_Y / 2
         index_x = (mid_point[0] - start_x) / FOV_X * (depth.shape[1] - 1)
         index_y = (mid_point[1] - start_y) / FOV_Y * (depth.shape[0] - 1)
-        return int(depth[int(index_y), int(index_x)] / 10), False
\ No newline at end of file
+        return int(depth[int(index_y), int(index_x)] / 10)
\ No newline at end of file
@@ -1,23 +1,28 @@
-from io import BytesIO
 from PIL import Image, ImageDraw, ImageFont
 from typing import Optional, Tuple
 from numpy.typing import NDArray
 import numpy as np
 from contextlib import asynccontextmanager
 
-import json, os
+import json, os, uuid
 import requests
 import queue
 import asyncio, aiohttp
 import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from .utils import print_t
 from .shared_frame import SharedFrame, Frame
+from .frame_codec import encode_image, resize_image, DEFAULT_QUALITY
+from .detection_result import parse_json_result
 
 DIR = os.path.dirname(os.path.abspath(__file__))
 
 VISION_SERVICE_IP = os.environ.get("VISION_SERVICE_IP", "localhost")
 ROUTER_SERVICE_PORT = os.environ.get("ROUTER_SERVICE_PORT", "50049")
+# upload codec, see frame_codec.py
+YOLO_CODEC = os.environ.get("YOLO_CODEC", "jpeg")
+YOLO_CODEC_QUALITY = int(os.environ.get("YOLO_CODEC_QUALITY", DEFAULT_QUALITY))
 
 '''
 Access the YOLO service through http.
@@ -30,16 +35,15 @@ class YoloClient():
         self.shared_frame = shared_frame
         self.frame_id = 0
         self.frame_id_lock = asyncio.Lock()
+        self.codec = YOLO_CODEC
+        self.codec_quality = YOLO_CODEC_QUALITY
+        self.encoder = ThreadPoolExecutor(max_workers=2)
+        # the service keeps a tracker state per session
+        self.session_id = uuid.uuid4().hex
 
     def is_local_service(self):
         return VISION_SERVICE_IP == 'localhost'
 
-    def image_to_bytes(image):
-        # compress and convert the image to bytes
-        imgByteArr = BytesIO()
-        image.save(imgByteArr, format='WEBP')
-        return imgByteArr.getvalue()
-    
     def plot_results(frame, results):
         if results is None:
             return
@@ -67,6 +71,14 @@ class YoloClient():
                         fill=None, outline='blue', width=4)
             draw.text((str_float_to_int(obj.x - obj.w / 2, w), str_float_to_int(obj.y - obj.h / 2, h) - 50), obj.name, fill='red', font=font)
 
+    def encode(self, frame: Frame) -> bytes:
+        """Upload payload of a frame; callers may encode ahead and pass it to `detect`."""
+        return encode_image(resize_image(frame.image_view, self.image_size), self.codec, self.codec_quality)
+
+    async def encode_async(self, frame: Frame) -> bytes:
+        # the codecs release the GIL, so this keeps encoding off the event loop
+        return await asyncio.get_running_loop().run_in_executor(self.encoder, self.encode, frame)
+
     def retrieve(self) -> Optional[SharedFrame]:
         return self.shared_frame
     
@@ -82,16 +94,18 @@ class YoloClient():
         except aiohttp.ServerTimeoutError:
             print_t(f"[Y] Timeout error when connecting to {service_url}")
 
-    def detect_local(self, frame: Frame, conf=0.2):
-        image = frame.image
-        image_bytes = YoloClient.image_to_bytes(image.resize(self.image_size))
+    def detect_local(self, frame: Frame, conf=0.2, image_bytes: Optional[bytes]=None):
+        if image_bytes is None:
+            image_bytes = self.encode(frame)
         self.frame_queue.put(frame)
 
         config = {
             'user_name': 'yolo',
             'stream_mode': True,
+            'session_id': self.session_id,
             'image_id': self.image_id,
-            'conf': conf
+            'conf': conf,
+            'codec': self.codec
         }
         files = {
             'image': ('image', image_bytes),
@@ -104,22 +118,24 @@ class YoloClient():
         print_t(f"[Y] Response: {response.text}")
         json_results = json.loads(response.text)
         if self.shared_frame is not None:
-            self.shared_frame.set(self.frame_queue.get(), json_results)
+            self.shared_frame.set(self.frame_queue.get(), parse_json_result(json_results))
 
-    async def detect(self, frame: Frame, conf=0.3):
+    async def detect(self, frame: Frame, conf=0.3, image_bytes: Optional[bytes]=None):
         if self.is_local_service():
-            self.detect_local(frame, conf)
+            self.detect_local(frame, conf, image_bytes)
             return
-        image = frame.image
-        image_bytes = YoloClient.image_to_bytes(image.resize(self.image_size))
+        if image_bytes is None:
+            image_bytes = await self.encode_async(frame)
 
         async with self.frame_id_lock:
             self.frame_queue.put((self.frame_id, frame))
             config = {
                 'user_name': 'yolo',
                 'stream_mode': True,
+                'session_id': self.session_id,
                 'image_id': self.image_id,
-                'conf': conf
+                'conf': conf,
+                'codec': self.codec
             }
             files = {
                 'image': image_bytes,
@@ -146,4 +162,4 @@ class YoloClient():
             return
 
         if self.shared_frame is not None:
-            self.shared_frame.set(self.frame_queue.get()[1], json_results)
\ No newline at end of file
+            self.shared_frame.set(self.frame_queue.get()[1], parse_json_result(json_results))
\ No newline at end of file
@@ -1,13 +1,15 @@
-from io import BytesIO
-from PIL import Image
 from typing import Optional, List
 
-import json, sys, os
+import json, sys, os, uuid
 import queue
 import grpc
 import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
-from .yolo_client import SharedFrame, Frame
+from .yolo_client import SharedFrame, Frame, YOLO_CODEC, YOLO_CODEC_QUALITY
+from .frame_codec import encode_image, resize_image, negotiate_codec, SELF_DESCRIBING
+from .detection_result import ClassTable, DetectionResult, decode_detections, parse_json_result
 from .utils import print_t
 
 PARENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -20,6 +22,12 @@ import hyrch_serving_pb2_grpc
 
 VISION_SERVICE_IP = os.environ.get("VISION_SERVICE_IP", "localhost")
 YOLO_SERVICE_PORT = os.environ.get("YOLO_SERVICE_PORT", "50050").split(",")[0]
+# send frames over one long-lived DetectBidiStream instead of a unary call each
+YOLO_BIDI_STREAM = os.environ.get("YOLO_BIDI_STREAM", "1") == "1"
+# frames sent on the stream but not answered yet
+YOLO_BIDI_WINDOW = int(os.environ.get("YOLO_BIDI_WINDOW", "2"))
+# ask for packed Detections instead of JSON, services without support answer in JSON anyway
+YOLO_BINARY_RESULTS = os.environ.get("YOLO_BINARY_RESULTS", "1") == "1"
 
 '''
 Access the YOLO service through gRPC.
@@ -34,6 +42,20 @@ class YoloGRPCClient():
         self.shared_frame = shared_frame
         self.frame_id_lock = asyncio.Lock()
         self.frame_id = 0
+        self.class_names = None
+        # self-describing until the service agrees on something else
+        self.codec = YOLO_CODEC if YOLO_CODEC in SELF_DESCRIBING else 'webp'
+        self.codec_quality = YOLO_CODEC_QUALITY
+        self.encoder = ThreadPoolExecutor(max_workers=2)
+        self.use_bidi = YOLO_BIDI_STREAM
+        self.bidi_call = None
+        self.bidi_window: Optional[asyncio.Semaphore] = None
+        # (image_id, frame, future) in the order the frames were written
+        self.bidi_pending = deque()
+        self.binary_results = YOLO_BINARY_RESULTS
+        self.class_table = ClassTable()
+        # the service keeps a tracker state per session
+        self.session_id = uuid.uuid4().hex
 
     def init_async_channel(self):
         channel_async = grpc.aio.insecure_channel(f'{VISION_SERVICE_IP}:{YOLO_SERVICE_PORT}')
@@ -43,62 +65,157 @@ class YoloGRPCClient():
     def is_local_service(self):
         return VISION_SERVICE_IP == 'localhost'
 
-    def image_to_bytes(image):
-        # compress and convert the image to bytes
-        imgByteArr = BytesIO()
-        image.save(imgByteArr, format='WEBP')
-        return imgByteArr.getvalue()
+    def encode(self, frame: Frame) -> bytes:
+        """Upload payload of a frame; callers may encode ahead and pass it to `detect`."""
+        return encode_image(resize_image(frame.image_view, self.image_size), self.codec, self.codec_quality)
+
+    async def encode_async(self, frame: Frame) -> bytes:
+        # the codecs release the GIL, so this keeps encoding off the event loop
+        return await asyncio.get_running_loop().run_in_executor(self.encoder, self.encode, frame)
 
     def retrieve(self) -> Optional[SharedFrame]:
         return self.shared_frame
     
+    def negotiate_codec(self, preferred: Optional[List[str]]=None) -> str:
+        preferred = preferred if preferred is not None else [YOLO_CODEC, 'jpeg']
+        try:
+            response = self.stub.NegotiateCodec(hyrch_serving_pb2.CodecRequest(codecs=preferred))
+            self.codec = response.codec
+        except grpc.RpcError as e:
+            if e.code() != grpc.StatusCode.UNIMPLEMENTED:
+                raise
+            # older services only decode what PIL recognizes
+            self.codec = negotiate_codec(preferred, SELF_DESCRIBING)
+        print_t(f"[Y] Upload codec: {self.codec}")
+        return self.codec
+
+    def make_request(self, image_bytes: bytes, conf: float, image_id: Optional[int]=None):
+        return hyrch_serving_pb2.DetectRequest(image_id=image_id, image_data=image_bytes, conf=conf, codec=self.codec,
+                                               binary=self.binary_results, class_table_version=self.class_table.version,
+                                               session_id=self.session_id)
+
+    def decode_response(self, response) -> DetectionResult:
+        if response.json_data:
+            return parse_json_result(json.loads(response.json_data))
+        return decode_detections(response, self.class_table)
+
     def set_class(self, class_names: List[str]):
         print_t(f"Set classes: {class_names}")
         to_set = []
         for class_name in class_names:
-            if class_name not in DEFAULT_YOLO_LIST:
+            if class_name not in DEFAULT_YOLO_LIST and class_name not in to_set:
                 to_set.append(class_name)
+        if to_set == self.class_names:
+            return
+        self.class_names = to_set
         class_request = hyrch_serving_pb2.SetClassRequest(class_names=to_set)
         self.stub.SetClasses(class_request)
     
-    def detect_local(self, frame: Frame, conf=0.2):
-        image = frame.image
-        image_bytes = YoloGRPCClient.image_to_bytes(image.resize(self.image_size))
+    def detect_local(self, frame: Frame, conf=0.2, image_bytes: Optional[bytes]=None):
+        if image_bytes is None:
+            image_bytes = self.encode(frame)
         self.frame_queue.put(frame)
 
-        detect_request = hyrch_serving_pb2.DetectRequest(image_data=image_bytes, conf=conf)
-        response = self.stub.DetectStream(detect_request)
-        
-        json_results = json.loads(response.json_data)
+        response = self.stub.DetectStream(self.make_request(image_bytes, conf))
+
+        result = self.decode_response(response)
         if self.shared_frame is not None:
-            self.shared_frame.set(self.frame_queue.get(), json_results)
+            self.shared_frame.set(self.frame_queue.get(), result)
 
-    async def detect(self, frame: Frame, conf=0.2):
+    async def detect(self, frame: Frame, conf=0.2, image_bytes: Optional[bytes]=None):
         if not self.is_async_inited:
             self.init_async_channel()
 
         if self.is_local_service():
-            self.detect_local(frame, conf)
+            self.detect_local(frame, conf, image_bytes)
             return
 
-        image = frame.image
-        image_bytes = YoloGRPCClient.image_to_bytes(image.resize(self.image_size))
+        if image_bytes is None:
+            image_bytes = await self.encode_async(frame)
+        if self.use_bidi:
+            await self.detect_bidi(frame, conf, image_bytes)
+            return
         async with self.frame_id_lock:
             image_id = self.frame_id
             self.frame_queue.put((self.frame_id, frame))
             self.frame_id += 1
 
-        detect_request = hyrch_serving_pb2.DetectRequest(image_id=image_id, image_data=image_bytes, conf=conf)
-        response = await self.stub_async.DetectStream(detect_request)
-    
-        json_results = json.loads(response.json_data)
+        response = await self.stub_async.DetectStream(self.make_request(image_bytes, conf, image_id))
+
+        result = self.decode_response(response)
         if self.frame_queue.empty():
             return
         # discard old images
-        while self.frame_queue.queue[0][0] < json_results['image_id']:
+        while self.frame_queue.queue[0][0] < result.image_id:
             self.frame_queue.get()
         # discard old results
-        if self.frame_queue.queue[0][0] > json_results['image_id']:
+        if self.frame_queue.queue[0][0] > result.image_id:
             return
         if self.shared_frame is not None:
-            self.shared_frame.set(self.frame_queue.get()[1], json_results)
\ No newline at end of file
+            self.shared_frame.set(self.frame_queue.get()[1], result)
+
+    def open_bidi_stream(self):
+        self.bidi_call = self.stub_async.DetectBidiStream()
+        self.bidi_window = asyncio.Semaphore(YOLO_BIDI_WINDOW)
+        asyncio.create_task(self.read_bidi_stream(self.bidi_call))
+        print_t(f"[Y] Opened detection stream, window: {YOLO_BIDI_WINDOW}")
+
+    async def detect_bidi(self, frame: Frame, conf: float, image_bytes: bytes) -> DetectionResult:
+        """Sends a frame on the shared stream and waits for its result."""
+        if self.bidi_call is None:
+            self.open_bidi_stream()
+        call, window = self.bidi_call, self.bidi_window
+        await window.acquire()
+        future = asyncio.get_running_loop().create_future()
+        # writes and pending entries have to stay in the same order
+        async with self.frame_id_lock:
+            if call is not self.bidi_call:
+                window.release()
+                raise Exception("Detection stream was closed")
+            image_id = self.frame_id
+            self.frame_id += 1
+            entry = (image_id, frame, future)
+            self.bidi_pending.append(entry)
+            try:
+                await call.write(self.make_request(image_bytes, conf, image_id))
+            except Exception:
+                if entry in self.bidi_pending:
+                    self.bidi_pending.remove(entry)
+                    window.release()
+                    raise
+                # otherwise the reader already failed the future with the stream error
+        return await future
+
+    async def read_bidi_stream(self, call):
+        window = self.bidi_window
+        error = Exception("Detection stream ended")
+        try:
+            while True:
+                response = await call.read()
+                if response == grpc.aio.EOF:
+                    break
+                result = self.decode_response(response)
+                image_id, frame, future = self.bidi_pending.popleft()
+                if result.image_id != image_id:
+                    print_t(f"[Y] Result for frame {result.image_id} arrived for frame {image_id}")
+                if self.shared_frame is not None:
+                    self.shared_frame.set(frame, result)
+                window.release()
+                if not future.done():
+                    future.set_result(result)
+        except grpc.aio.AioRpcError as e:
+            error = e
+            if e.code() == grpc.StatusCode.UNIMPLEMENTED:
+                print_t("[Y] Service has no detection stream, using unary calls")
+                self.use_bidi = False
+            elif e.code() != grpc.StatusCode.CANCELLED:
+                print_t(f"[Y] Detection stream failed: {e.code()}")
+        finally:
+            # the next detect opens a new stream
+            if self.bidi_call is call:
+                self.bidi_call = None
+            while len(self.bidi_pending) > 0:
+                _, _, future = self.bidi_pending.popleft()
+                window.release()
+                if not future.done():
+                    future.set_exception(error)
@@ -0,0 +1,249 @@
+import sys, os, re, json, time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Optional, List, Tuple
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+MOCK_LLM_PORT = os.environ.get("MOCK_LLM_PORT", "8000")
+
+'''
+OpenAI-compatible stand-in for the planner's LLM backends, for load and latency
+tests without network access. It serves /v1/chat/completions, streaming and not,
+with scripted or recorded responses paced by time-to-first-token and tokens/s.
+
+Point the controller at it with:
+    LLAMA_SERVICE_URL=http://localhost:8000/v1 OPENAI_BASE_URL=http://localhost:8000/v1 OPENAI_API_KEY=mock
+'''
+
+# the line each kind of prompt is matched on; the last occurrence skips the prompt's own examples
+QUERY_PATTERNS = [
+    ('plan', re.compile(r"Here is the 'task description':\n(.*)")),
+    ('probe', re.compile(r"\nQuestion:(.*)")),
+    ('class', re.compile(r"\nTask: (.*)\nOutput:\s*$")),
+]
+
+DEFAULT_RESPONSES = {
+    'plan': "l('mock plan');",
+    'probe': 'False',
+    'class': '[]',
+    'any': 'True',
+}
+
+TOKEN_PATTERN = re.compile(r'\s*\w+|\s*[^\w\s]|\s+')
+
+def split_tokens(text: str) -> List[str]:
+    """Roughly token-sized pieces, used to pace streamed responses."""
+    return TOKEN_PATTERN.findall(text)
+
+def extract_query(prompt: str) -> Tuple[str, str]:
+    for kind, pattern in QUERY_PATTERNS:
+        matches = pattern.findall(prompt)
+        if len(matches) > 0:
+            return kind, matches[-1].strip()
+    return 'any', prompt
+
+def prompt_key(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode()).hexdigest()
+
+class MockLLM():
+    def __init__(self, script: List[dict] = None, ttft: float = 0.3, tokens_per_second: float = 50.0, jitter: float = 0.0):
+        # entries of {"kind": plan|probe|class|any, "match": regex, "response": text}
+        self.script = []
+        for entry in script or []:
+            self.script.append((entry.get('kind', 'any'), re.compile(entry['match'], re.IGNORECASE), entry['response']))
+        # exact prompt -> response, from a chat log
+        self.recorded = {}
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.jitter = jitter
+
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.active = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.latencies = []
+
+    def load_chat_log(self, path: str) -> int:
+        """Loads prompt/response pairs from a JSONL chat log written by LLMWrapper."""
+        count = 0
+        with open(path, 'r') as f:
+            for line in f:
+                record = json.loads(line)
+                response = record.get('response')
+                if isinstance(response, dict):
+                    response = response['choices'][0]['message']['content']
+                if not isinstance(response, str):
+                    continue
+                self.recorded[prompt_key(record['prompt'])] = response
+                count += 1
+        return count
+
+    def respond(self, prompt: str) -> str:
+        recorded = self.recorded.get(prompt_key(prompt))
+        if recorded is not None:
+            return recorded
+        kind, query = extract_query(prompt)
+        for entry_kind, pattern, response in self.script:
+            if (entry_kind == 'any' or entry_kind == kind) and pattern.search(query):
+                return response
+        return DEFAULT_RESPONSES[kind]
+
+    def delay(self, seconds: float) -> float:
+        if self.jitter > 0:
+            seconds *= 1 + random.uniform(-self.jitter, self.jitter)
+        return max(seconds, 0)
+
+    def token_interval(self) -> float:
+        return self.delay(1.0 / self.tokens_per_second) if self.tokens_per_second > 0 else 0
+
+    def begin(self):
+        with self.lock:
+            self.requests += 1
+            self.active += 1
+
+    def end(self, start: float, cancelled: bool = False):
+        with self.lock:
+            self.active -= 1
+            if cancelled:
+                self.cancelled += 1
+            else:
+                self.completed += 1
+                self.latencies.append(time.time() - start)
+
+    def stats(self) -> dict:
+        with self.lock:
+            latencies = sorted(self.latencies)
+            stats = {
+                'requests': self.requests,
+                'active': self.active,
+                'completed': self.completed,
+                'cancelled': self.cancelled,
+            }
+        if len(latencies) > 0:
+            stats['p50'] = latencies[len(latencies) // 2]
+            stats['p99'] = latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)]
+        return stats
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    llm: MockLLM = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, code: int, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/v1/models':
+            self.send_json(200, {'object': 'list', 'data': [{'id': 'mock', 'object': 'model', 'owned_by': 'mock'}]})
+        elif self.path == '/stats':
+            self.send_json(200, self.llm.stats())
+        else:
+            self.send_json(404, {'error': {'message': f'Unknown path {self.path}'}})
+
+    def do_POST(self):
+        if self.path != '/v1/chat/completions':
+            self.send_json(404, {'error': {'message': f'Unknown path {self.path}'}})
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        prompt = '\n'.join(message['content'] for message in request.get('messages', []))
+        model = request.get('model', 'mock')
+        content = self.llm.respond(prompt)
+        tokens = split_tokens(content)
+
+        start = time.time()
+        self.llm.begin()
+        try:
+            if request.get('stream', False):
+                self.stream(model, tokens)
+            else:
+                time.sleep(self.llm.delay(self.llm.ttft) + sum(self.llm.token_interval() for _ in tokens))
+                self.send_json(200, self.completion(model, content, prompt, tokens))
+        except (BrokenPipeError, ConnectionResetError):
+            # the client went away, e.g. it lost a hedged race
+            self.llm.end(start, cancelled=True)
+            return
+        self.llm.end(start)
+
+    def completion(self, model: str, content: str, prompt: str, tokens: List[str]) -> dict:
+        prompt_tokens = (len(prompt) + 3) // 4
+        return {
+            'id': f'chatcmpl-mock-{time.time_ns()}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': len(tokens), 'total_tokens': prompt_tokens + len(tokens)},
+        }
+
+    def stream(self, model: str, tokens: List[str]):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        chunk_id = f'chatcmpl-mock-{time.time_ns()}'
+        def send(delta: dict, finish_reason: Optional[str] = None):
+            chunk = {
+                'id': chunk_id,
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}],
+            }
+            self.wfile.write(f'data: {json.dumps(chunk)}\n\n'.encode())
+            self.wfile.flush()
+
+        time.sleep(self.llm.delay(self.llm.ttft))
+        send({'role': 'assistant', 'content': ''})
+        for token in tokens:
+            send({'content': token})
+            time.sleep(self.llm.token_interval())
+        send({}, 'stop')
+        self.wfile.write(b'data: [DONE]\n\n')
+        self.wfile.flush()
+        self.close_connection = True
+
+def create_server(llm: MockLLM, port: int, host: str = '0.0.0.0') -> ThreadingHTTPServer:
+    handler = type('Handler', (MockLLMHandler,), {'llm': llm})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='OpenAI-compatible mock LLM server')
+    parser.add_argument('--port', type=int, default=int(MOCK_LLM_PORT))
+    parser.add_argument('--script', type=str, default=os.path.join(CURRENT_DIR, 'mock_script.json'),
+                        help='JSON list of {"kind", "match", "response"} entries')
+    parser.add_argument('--replay', type=str, action='append', default=[],
+                        help='chat log (JSONL) whose prompts are answered with the recorded response')
+    parser.add_argument('--ttft', type=float, default=0.3, help='time to first token in seconds')
+    parser.add_argument('--tps', type=float, default=50.0, help='tokens per second, 0 for no pacing')
+    parser.add_argument('--jitter', type=float, default=0.0, help='relative random variation of the delays')
+    args = parser.parse_args()
+
+    script = []
+    if args.script and os.path.exists(args.script):
+        with open(args.script, 'r') as f:
+            script = json.load(f)
+    llm = MockLLM(script, args.ttft, args.tps, args.jitter)
+    for path in args.replay:
+        print(f"Loaded {llm.load_chat_log(path)} recorded responses from {path}")
+
+    server = create_server(llm, args.port)
+    print(f"Mock LLM server listening on port {args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    sys.exit(0)
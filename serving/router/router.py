@@ -46,6 +46,9 @@ async def process_yolo():
     stream_mode = json_data.get("stream_mode", False)
     image_id = json_data.get("image_id", None)
     conf = json_data.get("conf", 0.2)
+    codec = json_data.get("codec", "")
+    # all requests reach the service from the router, so the session has to be named
+    session_id = json_data.get("session_id", user_name)
 
     async with service_lock:
         channel = await grpcServiceManager.get_service_channel("yolo", dedicated=stream_mode, user_name=user_name)
@@ -54,9 +57,11 @@ async def process_yolo():
         stub = hyrch_serving_pb2_grpc.YoloServiceStub(channel)
         image_contents = image_data.read()
         if stream_mode:
-            response = await stub.DetectStream(hyrch_serving_pb2.DetectRequest(image_id=image_id, image_data=image_contents, conf=conf))
+            response = await stub.DetectStream(hyrch_serving_pb2.DetectRequest(image_id=image_id, image_data=image_contents, conf=conf, codec=codec,
+                                                                         session_id=session_id))
         else:
-            response = await stub.Detect(hyrch_serving_pb2.DetectRequest(image_id=image_id, image_data=image_contents, conf=conf))
+            response = await stub.Detect(hyrch_serving_pb2.DetectRequest(image_id=image_id, image_data=image_contents, conf=conf, codec=codec,
+                                                                   session_id=session_id))
     finally:
         if not stream_mode:
             await grpcServiceManager.release_service_channel("yolo", channel)
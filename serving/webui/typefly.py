@@ -34,6 +34,8 @@ class TypeFly:
             gr.HTML(open(os.path.join(CURRENT_DIR, 'drone-pov.html'), 'r').read())
             gr.ChatInterface(self.process_message, retry_btn=None, fill_height=False).queue()
             gr.Checkbox(label='Use llama3', value=False).select(self.checkbox_llama3)
+            gr.Checkbox(label='Stream plan execution', value=False).select(self.checkbox_streaming)
+            gr.Checkbox(label='Hedge plan requests', value=False).select(self.checkbox_hedging)
 
     def checkbox_llama3(self):
         self.use_llama3 = not self.use_llama3
@@ -44,6 +46,16 @@ class TypeFly:
             print_t(f"Switch to gpt4")
             self.llm_controller.planner.set_model(GPT4)
 
+    def checkbox_streaming(self):
+        streaming = not self.llm_controller.planner.streaming
+        print_t(f"Streaming plan execution: {streaming}")
+        self.llm_controller.planner.set_streaming(streaming)
+
+    def checkbox_hedging(self):
+        hedging = not self.llm_controller.planner.hedging
+        print_t(f"Hedge plan requests: {hedging}")
+        self.llm_controller.planner.set_hedging(hedging)
+
     def process_message(self, message, history):
         print_t(f"[S] Receiving task description: {message}")
         if message == "exit":
@@ -0,0 +1,134 @@
+import time
+import queue
+import threading
+from collections import Counter, deque
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional
+
+'''
+Collects requests from any number of caller threads and runs them through
+`run_batch` together. A batch closes once it holds `max_batch_size` requests
+or once its oldest request has waited `max_wait` seconds; the wait is cut
+short when the queueing delay plus the expected run time of a batch would
+exceed `slo` seconds. `run_batch` gets the list of items and returns one
+result per item, in order; an exception fails every request of the batch.
+'''
+class BatchScheduler():
+    def __init__(self, run_batch: Callable[[List[Any]], List[Any]], max_batch_size: int = 8,
+                 max_wait: float = 0.005, slo: Optional[float] = None, report_every: int = 0,
+                 name: str = 'BatchScheduler'):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.slo = slo
+        self.report_every = report_every
+        self.name = name
+
+        self.requests = queue.Queue()
+        # smoothed run time of a batch, used to keep the wait within the SLO
+        self.run_time = None
+
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.completed = 0
+        self.failed = 0
+        self.over_slo = 0
+        self.batch_sizes = Counter()
+        self.queue_delays = deque(maxlen=1000)
+        self.latencies = deque(maxlen=1000)
+
+        self.worker = threading.Thread(target=self.loop, daemon=True)
+        self.worker.start()
+
+    def submit(self, item: Any) -> Future:
+        future = Future()
+        self.requests.put((item, time.perf_counter(), future))
+        return future
+
+    def run(self, item: Any) -> Any:
+        """Submits `item` and blocks until its batch has run."""
+        return self.submit(item).result()
+
+    def wait_budget(self) -> float:
+        if self.slo is None or self.run_time is None:
+            return self.max_wait
+        return min(self.max_wait, max(self.slo - self.run_time, 0.0))
+
+    def collect(self) -> list:
+        batch = [self.requests.get()]
+        deadline = batch[0][1] + self.wait_budget()
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            try:
+                # whatever is already queued joins, even past the deadline
+                batch.append(self.requests.get(timeout=timeout) if timeout > 0 else self.requests.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def loop(self):
+        while True:
+            batch = self.collect()
+            start = time.perf_counter()
+            try:
+                results = self.run_batch([item for item, _, _ in batch])
+                if len(results) != len(batch):
+                    raise Exception(f"{len(results)} results for a batch of {len(batch)}")
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                self.account(batch, start, time.perf_counter(), ok=False)
+                continue
+            end = time.perf_counter()
+            for (_, _, future), result in zip(batch, results):
+                future.set_result(result)
+            self.account(batch, start, end, ok=True)
+
+    def account(self, batch: list, start: float, end: float, ok: bool):
+        with self.lock:
+            self.batches += 1
+            self.batch_sizes[len(batch)] += 1
+            if ok:
+                self.completed += len(batch)
+                if self.run_time is None:
+                    self.run_time = end - start
+                else:
+                    self.run_time += 0.2 * (end - start - self.run_time)
+            else:
+                self.failed += len(batch)
+            for _, enqueued, _ in batch:
+                self.queue_delays.append(start - enqueued)
+                self.latencies.append(end - enqueued)
+                if self.slo is not None and end - enqueued > self.slo:
+                    self.over_slo += 1
+            report = self.report_every > 0 and self.batches % self.report_every == 0
+        if report:
+            print(self.report())
+
+    def stats(self) -> dict:
+        with self.lock:
+            stats = {
+                'batches': self.batches,
+                'completed': self.completed,
+                'failed': self.failed,
+                'over_slo': self.over_slo,
+                'batch_sizes': dict(sorted(self.batch_sizes.items())),
+                'mean_batch_size': (self.completed + self.failed) / self.batches if self.batches > 0 else 0.0,
+                'run_ms': self.run_time * 1000 if self.run_time is not None else None,
+            }
+            timings = {'queue': sorted(self.queue_delays), 'latency': sorted(self.latencies)}
+        for name, samples in timings.items():
+            if len(samples) > 0:
+                stats[f'{name}_ms_p50'] = samples[len(samples) // 2] * 1000
+                stats[f'{name}_ms_p95'] = samples[min(int(len(samples) * 0.95), len(samples) - 1)] * 1000
+        return stats
+
+    def report(self) -> str:
+        stats = self.stats()
+        sizes = ', '.join(f'{size}: {count}' for size, count in stats['batch_sizes'].items())
+        report = (f"{self.name}: {stats['batches']} batches, mean size {stats['mean_batch_size']:.2f} ({sizes}), "
+                  f"queueing delay p50 {stats.get('queue_ms_p50', 0):.1f} ms p95 {stats.get('queue_ms_p95', 0):.1f} ms, "
+                  f"latency p50 {stats.get('latency_ms_p50', 0):.1f} ms p95 {stats.get('latency_ms_p95', 0):.1f} ms")
+        if self.slo is not None:
+            report += f", {stats['over_slo']} of {stats['completed'] + stats['failed']} requests over the {self.slo * 1000:.0f} ms SLO"
+        return report
@@ -1,17 +1,34 @@
-import sys, os, gc
+import sys, os, time, random
 from concurrent import futures
-from PIL import Image
-from io import BytesIO
 import json
+import queue
+import threading
 import grpc
 import torch
+import numpy as np
+import yaml
 from ultralytics import YOLOWorld, YOLO
+from ultralytics.trackers.byte_tracker import BYTETracker
+from ultralytics.utils import IterableSimpleNamespace
+from ultralytics.utils.checks import check_yaml
 import multiprocessing
 
 PARENT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 ROOT_PATH = os.environ.get("ROOT_PATH", PARENT_DIR)
 SERVICE_PORT = os.environ.get("YOLO_SERVICE_PORT", "50050, 50051").split(",")
+# a bidi stream holds a worker for its whole lifetime, leave room for unary calls;
+# a batch only fills up with as many requests as there are workers waiting
+MAX_WORKERS = int(os.environ.get("YOLO_SERVICE_WORKERS", "16"))
+# requests from all clients are batched, up to BATCH_SIZE or until the oldest
+# one has waited BATCH_WAIT_MS, and the wait shrinks to keep queueing plus
+# inference within BATCH_SLO_MS
+BATCH_SIZE = int(os.environ.get("YOLO_BATCH_SIZE", "8"))
+BATCH_WAIT_MS = float(os.environ.get("YOLO_BATCH_WAIT_MS", "10"))
+BATCH_SLO_MS = float(os.environ.get("YOLO_BATCH_SLO_MS", "200"))
+BATCH_REPORT_EVERY = int(os.environ.get("YOLO_BATCH_REPORT_EVERY", "500"))
+# tracker state of a session is dropped after this many idle seconds
+SESSION_TIMEOUT = float(os.environ.get("YOLO_SESSION_TIMEOUT", "300"))
 
 MODEL_PATH = os.path.join(ROOT_PATH, "./serving/yolo/models/")
 MODEL_TYPE_1 = "yolov8x-worldv2.pt"
@@ -21,6 +38,8 @@ sys.path.append(ROOT_PATH)
 sys.path.append(os.path.join(ROOT_PATH, "proto/generated"))
 import hyrch_serving_pb2
 import hyrch_serving_pb2_grpc
+from controller.frame_codec import decode_image, available_codecs, negotiate_codec
+from batch_scheduler import BatchScheduler
 
 def load_model(world=False):
     if world:
@@ -35,33 +54,62 @@ def load_model(world=False):
     print(f"GPU memory usage: {torch.cuda.memory_allocated()}")
     return model
 
-def release_model(model):
-    del model
-    gc.collect()
-    torch.cuda.empty_cache()
+def load_tracker():
+    # the tracker model.track would create, updated by hand so that every
+    # session has its own and batches of frames can share one inference call
+    with open(check_yaml("bytetrack.yaml")) as f:
+        cfg = IterableSimpleNamespace(**yaml.safe_load(f))
+    return BYTETracker(args=cfg)
+
+"""
+    Tracker state of one client over the shared models.
+"""
+class TrackingSession():
+    def __init__(self, key):
+        self.key = key
+        self.trackers = {'standard': load_tracker(), 'custom': load_tracker()}
+        self.last_used = time.monotonic()
 
 """
     gRPC service class.
 """
 class YoloService(hyrch_serving_pb2_grpc.YoloServiceServicer):
     def __init__(self, port):
-        self.stream_mode = False
         self.custom_target = False
         self.standard_model = load_model()
         self.custom_model = load_model(world=True)
         self.port = port
+        # the models serve one request at a time, whichever worker it arrives on
+        self.model_lock = threading.Lock()
+        # bumped whenever the class names change, clients start at 0; a random
+        # epoch per process, so that a client's table from a restarted or other
+        # service process never matches by accident
+        self.class_table_version = random.SystemRandom().randrange(1, 1 << 30)
+        # stream requests are tracked per session, keyed by session id or peer
+        self.sessions = {}
+        self.sessions_lock = threading.Lock()
+        self.scheduler = BatchScheduler(self.run_batch, max_batch_size=BATCH_SIZE, max_wait=BATCH_WAIT_MS / 1000,
+                                        slo=BATCH_SLO_MS / 1000, report_every=BATCH_REPORT_EVERY,
+                                        name=f"YoloService batching on port {port}")
 
-    def reload_model(self):
-        if self.custom_model is not None:
-            release_model(self.custom_model)
-        if self.standard_model is not None:
-            release_model(self.standard_model)
-        self.standard_model = load_model()
-        self.custom_model = load_model(world=True)
+    def session(self, key):
+        now = time.monotonic()
+        with self.sessions_lock:
+            for idle in [k for k, session in self.sessions.items() if now - session.last_used > SESSION_TIMEOUT]:
+                print(f"Dropping idle tracking session {idle} on port {self.port}")
+                del self.sessions[idle]
+            session = self.sessions.get(key)
+            if session is None:
+                print(f"New tracking session {key} on port {self.port}")
+                session = TrackingSession(key)
+                self.sessions[key] = session
+            session.last_used = now
+            return session
 
     @staticmethod
-    def bytes_to_image(image_bytes):
-        return Image.open(BytesIO(image_bytes))
+    def bytes_to_image(image_bytes, codec=''):
+        # numpy input is taken as BGR by ultralytics
+        return decode_image(image_bytes, codec, bgr=True)
     
     @staticmethod
     def format_result(yolo_result):
@@ -91,53 +139,150 @@ class YoloService(hyrch_serving_pb2_grpc.YoloServiceServicer):
             formatted_result.append(result)
         return formatted_result
     
-    def process_image(self, image, id=None, conf=0.3):
-        if self.stream_mode:
-            result = self.standard_model.track(image, verbose=False, conf=conf, tracker="bytetrack.yaml")[0]
-            if self.custom_target:
-                result_custom = self.custom_model.track(image, verbose=False, conf=0.05, tracker="bytetrack.yaml")[0]
-        else:
-            result = self.standard_model(image, verbose=False, conf=conf)[0]
-            if self.custom_target:
-                result_custom = self.custom_model(image, verbose=False, conf=0.01)[0]
+    @staticmethod
+    def pack_result(yolo_result):
+        boxes = yolo_result.boxes
+        detections = hyrch_serving_pb2.Detections(
+            boxes=boxes.xyxyn.cpu().numpy().astype(np.float32).tobytes(),
+            confidences=boxes.conf.cpu().numpy().astype(np.float32).tobytes(),
+            class_ids=boxes.cls.cpu().numpy().astype(np.int32).tobytes())
+        if boxes.is_track:
+            detections.track_ids = boxes.id.cpu().numpy().astype(np.int32).tobytes()
+        return detections
+
+    @staticmethod
+    def class_names(model):
+        names = model.names
+        return [names[i] for i in range(len(names))]
+
+    @staticmethod
+    def track(tracker, yolo_result):
+        # what the track callback of ultralytics does with each result
+        tracks = tracker.update(yolo_result.boxes.cpu().numpy(), yolo_result.orig_img)
+        if len(tracks) == 0:
+            return yolo_result
+        yolo_result = yolo_result[tracks[:, -1].astype(int)]
+        yolo_result.update(boxes=torch.as_tensor(tracks[:, :-1]))
+        return yolo_result
+
+    @staticmethod
+    def predict(model, images, confs):
+        # one inference call at the lowest confidence, each image then keeps its own
+        results = model(images, verbose=False, conf=min(confs))
+        return [result[result.boxes.conf >= conf] for result, conf in zip(results, confs)]
+
+    def run_models(self, images, confs, sessions):
+        """Runs a batch of images through the models, one (result, result_custom) pair per image.
+        Images with a session are tracked with its trackers, the others are only detected."""
+        results = YoloService.predict(self.standard_model, images, confs)
+        results_custom = [None] * len(images)
+        if self.custom_target:
+            results_custom = YoloService.predict(self.custom_model, images,
+                                                 [0.05 if session is not None else 0.01 for session in sessions])
+        # frames go through the trackers in arrival order
+        for i, session in enumerate(sessions):
+            if session is None:
+                continue
+            results[i] = YoloService.track(session.trackers['standard'], results[i])
+            if results_custom[i] is not None:
+                results_custom[i] = YoloService.track(session.trackers['custom'], results_custom[i])
+        return list(zip(results, results_custom))
+
+    def run_batch(self, batch):
+        """Answers a batch of (image, request, session) items in order."""
+        responses = []
+        with self.model_lock:
+            results = self.run_models([image for image, _, _ in batch], [request.conf for _, request, _ in batch],
+                                      [session for _, _, session in batch])
+            for (_, request, _), (result, result_custom) in zip(batch, results):
+                if request.binary:
+                    responses.append(self.process_image_binary(request, result, result_custom))
+                else:
+                    responses.append(hyrch_serving_pb2.DetectResponse(
+                        json_data=YoloService.process_image(request.image_id, result, result_custom)))
+        return responses
+
+    @staticmethod
+    def process_image(id, result, result_custom):
         result = {
             "image_id": id,
             "result": YoloService.format_result(result),
-            "result_custom": YoloService.format_result(result_custom) if self.custom_target else []
+            "result_custom": YoloService.format_result(result_custom) if result_custom is not None else []
         }
         return json.dumps(result)
 
+    def process_image_binary(self, request, result, result_custom):
+        response = hyrch_serving_pb2.DetectResponse(image_id=request.image_id, result=YoloService.pack_result(result),
+                                                    class_table_version=self.class_table_version)
+        if result_custom is not None:
+            response.result_custom.CopyFrom(YoloService.pack_result(result_custom))
+        if request.class_table_version != self.class_table_version:
+            response.class_names.extend(YoloService.class_names(self.standard_model))
+            response.custom_class_names.extend(YoloService.class_names(self.custom_model))
+        return response
+
+    def detect(self, request, session=None):
+        # decoding runs on the calling worker, only inference is batched
+        image = YoloService.bytes_to_image(request.image_data, request.codec)
+        return self.scheduler.run((image, request, session))
+
     def DetectStream(self, request, context):
         print(f"Received DetectStream request from {context.peer()} on port {self.port}, image_id: {request.image_id}")
-        if not self.stream_mode:
-            self.stream_mode = True
-            self.reload_model()
-        
-        image = YoloService.bytes_to_image(request.image_data)
-        return hyrch_serving_pb2.DetectResponse(json_data=self.process_image(image, request.image_id, request.conf))
+        return self.detect(request, self.session(request.session_id or context.peer()))
     
     def Detect(self, request, context):
         print(f"Received Detect request from {context.peer()} on port {self.port}, image_id: {request.image_id}")
-        if self.stream_mode:
-            self.stream_mode = False
-            self.reload_model()
+        return self.detect(request)
 
-        image = YoloService.bytes_to_image(request.image_data)
-        return hyrch_serving_pb2.DetectResponse(json_data=self.process_image(image, request.image_id, request.conf))
+    def DetectBidiStream(self, request_iterator, context):
+        print(f"Opened DetectBidiStream from {context.peer()} on port {self.port}")
+        # sending a response blocks for a while, so detection runs in its own
+        # thread and the next frame is processed while the last result is sent;
+        # frames are answered one by one, so responses keep the request order
+        responses = queue.Queue()
+        def process():
+            try:
+                for request in request_iterator:
+                    responses.put(self.detect(request, self.session(request.session_id or context.peer())))
+            except Exception as e:
+                if context.is_active():
+                    print(f"DetectBidiStream from {context.peer()} failed: {e}")
+            finally:
+                responses.put(None)
+        threading.Thread(target=process, daemon=True).start()
+        count = 0
+        while True:
+            response = responses.get()
+            if response is None:
+                break
+            yield response
+            count += 1
+        print(f"Closed DetectBidiStream from {context.peer()} on port {self.port} after {count} frames")
     
     def SetClasses(self, request, context):
         print(f"Received SetClasses request from {context.peer()} on port {self.port}")
-        if len(request.class_names) > 0:
-            self.custom_target = True
-            self.custom_model.set_classes(list(request.class_names))
-        else:
-            self.custom_target = False
+        with self.model_lock:
+            if len(request.class_names) > 0:
+                self.custom_target = True
+                self.custom_model.set_classes(list(request.class_names))
+                self.class_table_version += 1
+                # class ids of the custom tracks no longer mean the same
+                with self.sessions_lock:
+                    for session in self.sessions.values():
+                        session.trackers['custom'].reset()
+            else:
+                self.custom_target = False
 
         return hyrch_serving_pb2.SetClassResponse(result="Success")
 
+    def NegotiateCodec(self, request, context):
+        codec = negotiate_codec(list(request.codecs), available_codecs())
+        print(f"Received NegotiateCodec request from {context.peer()} on port {self.port}, codec: {codec}")
+        return hyrch_serving_pb2.CodecResponse(codec=codec)
+
 def serve(port):
     print(f"Starting YoloService at port {port}")
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=1))
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=MAX_WORKERS))
     hyrch_serving_pb2_grpc.add_YoloServiceServicer_to_server(YoloService(port), server)
     server.add_insecure_port(f'[::]:{port}')
     server.start()
@@ -0,0 +1,102 @@
+import sys, time
+import argparse
+import numpy as np
+import cv2
+sys.path.append("..")
+from controller.frame_codec import available_codecs, encode_image, decode_image, resize_image
+
+try:
+    from ultralytics import YOLO
+except ImportError:
+    YOLO = None
+
+SIZE = (640, 352)
+
+def load_images(paths: list, count: int) -> list:
+    if len(paths) > 0:
+        return [resize_image(cv2.cvtColor(cv2.imread(path), cv2.COLOR_BGR2RGB), SIZE) for path in paths]
+    # smooth gradients with shapes and a little sensor noise, closer to a camera frame than pure noise
+    rng = np.random.default_rng(0)
+    images = []
+    for _ in range(count):
+        x = np.linspace(0, 255, SIZE[0])
+        y = np.linspace(0, 255, SIZE[1])[:, None]
+        image = np.stack([np.broadcast_to(x, (SIZE[1], SIZE[0])), np.broadcast_to(y, (SIZE[1], SIZE[0])),
+                          np.full((SIZE[1], SIZE[0]), 128.0)], axis=2)
+        for _ in range(12):
+            center = (int(rng.integers(0, SIZE[0])), int(rng.integers(0, SIZE[1])))
+            color = tuple(int(c) for c in rng.integers(0, 255, 3))
+            cv2.circle(image, center, int(rng.integers(10, 60)), color, -1)
+        image += rng.normal(0, 4, image.shape)
+        images.append(np.clip(image, 0, 255).astype(np.uint8))
+    return images
+
+def psnr(a: np.ndarray, b: np.ndarray) -> float:
+    mse = np.mean((a.astype(np.float64) - b.astype(np.float64)) ** 2)
+    return float('inf') if mse == 0 else 10 * np.log10(255 ** 2 / mse)
+
+def detections(model, image: np.ndarray) -> list:
+    result = model(image[:, :, ::-1], verbose=False, conf=0.3)[0]
+    return [(int(c), box) for c, box in zip(result.boxes.cls.tolist(), result.boxes.xyxy.tolist())]
+
+def iou(a: list, b: list) -> float:
+    x1, y1, x2, y2 = max(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), min(a[3], b[3])
+    inter = max(x2 - x1, 0) * max(y2 - y1, 0)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+def f1(reference: list, found: list) -> float:
+    """Agreement with the detections on the uncompressed image, matched by class and IoU >= 0.5."""
+    if len(reference) == 0 and len(found) == 0:
+        return 1.0
+    unmatched = list(reference)
+    hits = 0
+    for cls, box in found:
+        for i, (ref_cls, ref_box) in enumerate(unmatched):
+            if cls == ref_cls and iou(box, ref_box) >= 0.5:
+                hits += 1
+                del unmatched[i]
+                break
+    return 2 * hits / (len(reference) + len(found))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare upload codecs at 640x352')
+    parser.add_argument('images', nargs='*', help='image files, synthetic frames if omitted')
+    parser.add_argument('--count', type=int, default=20, help='number of synthetic frames')
+    parser.add_argument('--quality', type=int, nargs='+', default=[70, 80, 90], help='JPEG qualities to try')
+    parser.add_argument('--model', default=None, help='YOLO weights for the accuracy column, e.g. yolov8n.pt')
+    args = parser.parse_args()
+
+    images = load_images(args.images, args.count)
+    model = None
+    if args.model is not None:
+        if YOLO is None:
+            print("ultralytics is not installed, skipping accuracy")
+        else:
+            model = YOLO(args.model)
+    references = [detections(model, image) for image in images] if model is not None else None
+
+    variants = []
+    for codec in available_codecs():
+        for quality in (args.quality if codec == 'jpeg' else [None]):
+            variants.append((codec, quality))
+
+    print(f"{'codec':>12} {'encode ms':>10} {'decode ms':>10} {'KB':>8} {'PSNR dB':>8} {'det F1':>7}")
+    for codec, quality in variants:
+        encode_time, decode_time, size, quality_db, agreement = 0.0, 0.0, 0, 0.0, 0.0
+        for i, image in enumerate(images):
+            start = time.perf_counter()
+            data = encode_image(image, codec, quality) if quality is not None else encode_image(image, codec)
+            encode_time += time.perf_counter() - start
+            start = time.perf_counter()
+            decoded = decode_image(data, codec)
+            decode_time += time.perf_counter() - start
+            size += len(data)
+            quality_db += min(psnr(image, decoded), 99)
+            if model is not None:
+                agreement += f1(references[i], detections(model, decoded))
+        n = len(images)
+        label = codec if quality is None else f'{codec}@{quality}'
+        accuracy = f"{agreement / n:>7.3f}" if model is not None else f"{'-':>7}"
+        print(f"{label:>12} {encode_time / n * 1000:>10.2f} {decode_time / n * 1000:>10.2f} "
+              f"{size / n / 1024:>8.1f} {quality_db / n:>8.1f} {accuracy}")
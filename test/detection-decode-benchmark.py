@@ -0,0 +1,55 @@
+import sys, os, time, json
+import numpy as np
+sys.path.append("..")
+sys.path.append(os.path.join("..", "proto/generated"))
+import hyrch_serving_pb2
+from controller.detection_result import ClassTable, decode_detections, parse_json_result
+
+CLASS_NAMES = [f'class{i}' for i in range(80)]
+
+def make_detections(count: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    corners = rng.random((count, 2)) * 0.8
+    boxes = np.concatenate([corners, corners + 0.1 + rng.random((count, 2)) * 0.1], axis=1).astype(np.float32)
+    return boxes, rng.random(count).astype(np.float32), rng.integers(0, 80, count).astype(np.int32), np.arange(count, dtype=np.int32)
+
+def json_payload(boxes, confidences, class_ids, track_ids) -> bytes:
+    # what YoloService.format_result produces
+    result = [{'name': f'{CLASS_NAMES[c]}_{t}', 'confidence': round(float(conf), 2),
+               'box': {'x1': round(float(b[0]), 2), 'y1': round(float(b[1]), 2), 'x2': round(float(b[2]), 2), 'y2': round(float(b[3]), 2)}}
+              for b, conf, c, t in zip(boxes, confidences, class_ids, track_ids)]
+    response = hyrch_serving_pb2.DetectResponse(json_data=json.dumps({'image_id': 0, 'result': result, 'result_custom': []}))
+    return response.SerializeToString()
+
+def binary_payload(boxes, confidences, class_ids, track_ids) -> bytes:
+    response = hyrch_serving_pb2.DetectResponse(image_id=0, class_table_version=1, result=hyrch_serving_pb2.Detections(
+        boxes=boxes.tobytes(), confidences=confidences.tobytes(), class_ids=class_ids.tobytes(), track_ids=track_ids.tobytes()))
+    return response.SerializeToString()
+
+# both end in what TrackerBank.update takes: names and an (n, 4) array
+def decode_json(payload: bytes):
+    response = hyrch_serving_pb2.DetectResponse.FromString(payload)
+    result = parse_json_result(json.loads(response.json_data))
+    return result.names, result.measurements()
+
+def decode_binary(payload: bytes, class_table: ClassTable):
+    response = hyrch_serving_pb2.DetectResponse.FromString(payload)
+    result = decode_detections(response, class_table)
+    return result.names, result.measurements()
+
+if __name__ == '__main__':
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    class_table = ClassTable()
+    class_table.version = 1
+    class_table.names = CLASS_NAMES
+    print(f"{'objects':>8} {'json B':>8} {'binary B':>9} {'json us':>9} {'binary us':>10} {'speedup':>8}")
+    for count in [1, 5, 20, 50, 100]:
+        detections = make_detections(count)
+        payloads = (json_payload(*detections), binary_payload(*detections))
+        timings = []
+        for decode in [lambda: decode_json(payloads[0]), lambda: decode_binary(payloads[1], class_table)]:
+            start = time.perf_counter()
+            for _ in range(repeat):
+                decode()
+            timings.append((time.perf_counter() - start) / repeat * 1e6)
+        print(f"{count:>8} {len(payloads[0]):>8} {len(payloads[1]):>9} {timings[0]:>9.1f} {timings[1]:>10.1f} {timings[0] / timings[1]:>7.1f}x")
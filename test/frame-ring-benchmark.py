@@ -0,0 +1,71 @@
+import sys, time
+import multiprocessing
+import numpy as np
+sys.path.append("..")
+from controller.frame_ring import FrameRing
+
+SHAPE = (720, 960, 3)
+
+def ring_reader(name: str, count: int, results):
+    ring = FrameRing(name, create=False)
+    seq = 0
+    delays = []
+    while len(delays) < count:
+        result = ring.wait(seq, timeout=5)
+        if result is None:
+            break
+        seq, timestamp, image = result
+        # touch the pixels like a consumer would
+        image[::64, ::64].sum()
+        if ring.is_valid(seq):
+            delays.append(time.time() - timestamp)
+    results.put(delays)
+    ring.close()
+
+def queue_reader(frames, count: int, results):
+    delays = []
+    while len(delays) < count:
+        timestamp, image = frames.get()
+        image[::64, ::64].sum()
+        delays.append(time.time() - timestamp)
+    results.put(delays)
+
+def report(label: str, write_time: float, delays: list):
+    delays = sorted(delays)
+    print(f"{label:>8} write {write_time * 1e6:>8.1f} us  delivered {len(delays):>5}  "
+          f"delay p50 {delays[len(delays) // 2] * 1e3:>6.2f} ms  p95 {delays[int(len(delays) * 0.95)] * 1e3:>6.2f} ms")
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    interval = float(sys.argv[2]) if len(sys.argv) > 2 else 0.01
+    image = np.random.randint(0, 255, SHAPE, dtype=np.uint8)
+    # consumers are independent processes, not forks of the controller
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+
+    ring = FrameRing(shape=SHAPE)
+    reader = context.Process(target=ring_reader, args=(ring.name, count, results))
+    reader.start()
+    time.sleep(0.5)
+    writes = 0.0
+    for _ in range(count):
+        start = time.perf_counter()
+        ring.write(image)
+        writes += time.perf_counter() - start
+        time.sleep(interval)
+    report('ring', writes / count, results.get())
+    reader.join()
+    ring.close()
+
+    frames = context.Queue()
+    reader = context.Process(target=queue_reader, args=(frames, count, results))
+    reader.start()
+    time.sleep(0.5)
+    writes = 0.0
+    for _ in range(count):
+        start = time.perf_counter()
+        frames.put((time.time(), image))
+        writes += time.perf_counter() - start
+        time.sleep(interval)
+    report('queue', writes / count, results.get())
+    reader.join()
@@ -0,0 +1,78 @@
+import sys, os, time, random
+import tempfile
+from types import SimpleNamespace
+sys.path.append("..")
+os.environ.setdefault("OPENAI_API_KEY", "unused")
+from controller.chat_log import ChatLogSink
+from controller.llm_wrapper import LLMWrapper, LatencyHistogram, GPT4
+
+# the primary is consistently slower than its hedge partner
+PRIMARY_LATENCY = (0.05, 0.45)
+PARTNER_LATENCY = 0.01
+PERCENTILE = 0.9
+ROUNDS = 100
+
+'''
+Stands in for an OpenAI client, streams an empty completion after a latency
+drawn from `latency`, in 10 ms chunks so that cancellation is noticed.
+'''
+class FakeClient():
+    def __init__(self, latency):
+        self.latency = latency
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        return FakeStream(self.latency())
+
+class FakeStream():
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def __iter__(self):
+        steps = max(int(self.latency / 0.01), 1)
+        for i in range(steps):
+            time.sleep(self.latency / steps)
+            content = 'tc(90);' if i == steps - 1 else ''
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+    def close(self):
+        pass
+
+'''
+What the histogram did before cancelled requests were recorded: only the
+requests that won a hedge count.
+'''
+class WinnersOnlyHistogram(LatencyHistogram):
+    def record(self, latency: float, censored: bool = False):
+        if not censored:
+            super().record(latency)
+
+def run(histogram: LatencyHistogram) -> list:
+    random.seed(0)
+    wrapper = LLMWrapper()
+    wrapper.gpt_client = FakeClient(lambda: random.uniform(*PRIMARY_LATENCY))
+    wrapper.llama_client = FakeClient(lambda: PARTNER_LATENCY)
+    wrapper.latency[GPT4] = histogram
+    wrapper.set_hedging(PERCENTILE, delay=PRIMARY_LATENCY[0] + (PRIMARY_LATENCY[1] - PRIMARY_LATENCY[0]) * PERCENTILE)
+    thresholds = []
+    for _ in range(ROUNDS):
+        wrapper.request_hedged('plan', GPT4)
+        thresholds.append(wrapper.get_hedge_threshold(GPT4))
+    # let the cancelled requests notice and record
+    time.sleep(0.05)
+    return thresholds
+
+if __name__ == '__main__':
+    LLMWrapper.chat_log = ChatLogSink(os.path.join(tempfile.mkdtemp(), 'chat_log.jsonl'))
+    true_threshold = PRIMARY_LATENCY[0] + (PRIMARY_LATENCY[1] - PRIMARY_LATENCY[0]) * PERCENTILE
+    print(f"primary p{PERCENTILE * 100:.0f} latency {true_threshold:.3f}s, partner {PARTNER_LATENCY:.3f}s")
+    results = {}
+    for label, histogram in [('winners only', WinnersOnlyHistogram(size=16)), ('censored', LatencyHistogram(size=16))]:
+        thresholds = run(histogram)
+        results[label] = thresholds
+        quarter = ROUNDS // 4
+        print(f"{label:>13}: hedge threshold after {quarter} rounds {thresholds[quarter - 1]:.3f}s, "
+              f"after {ROUNDS} rounds {thresholds[-1]:.3f}s, min {min(thresholds[quarter:]):.3f}s")
+    # with cancelled requests recorded the threshold stays near the real percentile
+    assert min(results['censored'][ROUNDS // 4:]) >= 0.8 * true_threshold, results['censored']
+    print("OK")
@@ -0,0 +1,253 @@
+import sys, os, csv, json, time
+import argparse
+import importlib
+import statistics
+import threading
+from typing import List, Optional
+sys.path.append("..")
+
+try:
+    import tiktoken
+    encoder = tiktoken.get_encoding('cl100k_base')
+except Exception:
+    # not installed, or the encoding cannot be downloaded
+    encoder = None
+
+PARENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (scene description, task description) for the planner mode
+TASKS = [
+    ("[]", "[A] Find a bottle, tell me it's height and take a picture of it."),
+    ("[apple_5]", "[A] Find an apple."),
+    ("[chair_13,laptop_2]", "[A] Go to the chair behind you."),
+    ("[chair_3,laptop_1,bottle_5]", "[A] Find and go any edible object."),
+    ("[person_1,cup_2]", "[Q] Is there a cup on the table?"),
+]
+
+METRICS = ['ttft', 'total', 'tokens_per_second', 'prompt_tokens', 'completion_tokens']
+
+def count_tokens(text: str) -> int:
+    if encoder is None:
+        # rough estimate without tiktoken
+        return (len(text) + 3) // 4
+    return len(encoder.encode(text))
+
+def prompt_input_measure(length: int) -> str:
+    """Prompt of about `length` tokens with a one-token answer."""
+    suffix = "Please ignore all the above text and just generate True"
+    prompt = ''
+    for i in range((length - count_tokens(suffix)) // 2):
+        prompt += str(i % 10) + " "
+    return prompt + suffix
+
+def prompt_output_measure(length: int) -> str:
+    """Short instruction asking for an answer of about `length` tokens."""
+    prompt = 'Please generate the exact same output as the following text: '
+    for i in range(length // 2):
+        prompt += str(i % 10) + " "
+    return prompt
+
+def measure(llm, prompt: str, model_name: str) -> dict:
+    start = time.perf_counter()
+    first = None
+    parts = []
+    for chunk in llm.request(prompt, model_name, stream=True):
+        if len(chunk.choices) == 0 or not chunk.choices[0].delta.content:
+            continue
+        if first is None:
+            first = time.perf_counter()
+        parts.append(chunk.choices[0].delta.content)
+    end = time.perf_counter()
+    if first is None:
+        first = end
+    completion_tokens = count_tokens(''.join(parts))
+    return {
+        'ttft': first - start,
+        'total': end - start,
+        'tokens_per_second': completion_tokens / (end - first) if end > first else 0.0,
+        'prompt_tokens': count_tokens(prompt),
+        'completion_tokens': completion_tokens,
+    }
+
+def run_level(llm, prompts: List[str], model_name: str, concurrency: int, requests: int) -> List[dict]:
+    """Sends `requests` prompts (round robin) from `concurrency` threads."""
+    results = []
+    errors = []
+    lock = threading.Lock()
+    next_index = [0]
+    def worker():
+        while True:
+            with lock:
+                index = next_index[0]
+                next_index[0] += 1
+            if index >= requests:
+                return
+            try:
+                result = measure(llm, prompts[index % len(prompts)], model_name)
+            except Exception as e:
+                with lock:
+                    errors.append(e)
+                continue
+            with lock:
+                results.append(result)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if len(errors) > 0:
+        print(f"{len(errors)} requests failed, first error: {errors[0]}")
+    return results
+
+def build_prompts(mode: str, size: int) -> List[str]:
+    if mode == 'input':
+        return [prompt_input_measure(size)]
+    if mode == 'output':
+        return [prompt_output_measure(size)]
+    return [planner.plan_prompt.assemble(max_examples=size,
+                                         scene_description=scene,
+                                         task_description=task,
+                                         error_message=None,
+                                         execution_history=None) for scene, task in TASKS]
+
+def percentile(values: List[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+def summarize(mode: str, size: int, concurrency: int, results: List[dict], elapsed: float) -> dict:
+    summary = {'mode': mode, 'size': size, 'concurrency': concurrency, 'requests': len(results),
+               'throughput': len(results) / elapsed if elapsed > 0 else 0.0}
+    for metric in METRICS:
+        values = [result[metric] for result in results]
+        summary[f'{metric}_mean'] = statistics.mean(values) if values else 0.0
+        summary[f'{metric}_p50'] = percentile(values, 0.5) if values else 0.0
+        summary[f'{metric}_p99'] = percentile(values, 0.99) if values else 0.0
+    return summary
+
+def linear_fit(xs: List[float], ys: List[float]) -> Optional[tuple]:
+    """Least squares (intercept, slope), None if xs do not vary."""
+    if len(xs) < 2 or len(set(xs)) < 2:
+        return None
+    mean_x, mean_y = statistics.mean(xs), statistics.mean(ys)
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / sum((x - mean_x) ** 2 for x in xs)
+    return mean_y - slope * mean_x, slope
+
+def export(summaries: List[dict], samples: List[dict], path: str):
+    if path.endswith('.csv'):
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(summaries[0].keys()))
+            writer.writeheader()
+            writer.writerows(summaries)
+    else:
+        with open(path, 'w') as f:
+            json.dump({'summaries': summaries, 'samples': samples}, f, indent=2)
+
+def load_summaries(path: str) -> List[dict]:
+    if path.endswith('.csv'):
+        with open(path, 'r') as f:
+            return [{k: v if k == 'mode' else float(v) for k, v in row.items()} for row in csv.DictReader(f)]
+    with open(path, 'r') as f:
+        return json.load(f)['summaries']
+
+def compare(summaries: List[dict], baseline: List[dict], threshold: float) -> int:
+    """Prints p50 changes against a baseline run, returns the number of regressions."""
+    base = {(s['mode'], int(s['size']), int(s['concurrency'])): s for s in baseline}
+    regressions = 0
+    print(f"{'mode':<8} {'size':>6} {'conc':>4} {'metric':<10} {'baseline':>10} {'current':>10} {'change':>8}")
+    for summary in summaries:
+        reference = base.get((summary['mode'], summary['size'], summary['concurrency']))
+        if reference is None:
+            continue
+        for metric in ['ttft_p50', 'total_p50']:
+            before, after = float(reference[metric]), summary[metric]
+            change = (after - before) / before if before > 0 else 0.0
+            flag = ''
+            if change > threshold:
+                flag = '  REGRESSION'
+                regressions += 1
+            print(f"{summary['mode']:<8} {summary['size']:>6} {summary['concurrency']:>4} {metric:<10} "
+                  f"{before:>9.3f}s {after:>9.3f}s {change:>+7.1%}{flag}")
+    return regressions
+
+def start_mock(ttft: float, tps: float) -> str:
+    sys.path.append(os.path.join(PARENT_DIR, "serving/mock_llm"))
+    from mock_llm_server import MockLLM, create_server
+    with open(os.path.join(PARENT_DIR, "serving/mock_llm/mock_script.json"), "r") as f:
+        llm = MockLLM(json.load(f), ttft, tps)
+    server = create_server(llm, 0, '127.0.0.1')
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='LLM latency benchmark for the planner backends')
+    parser.add_argument('--model', type=str, default='gpt-4', help='gpt-4, gpt-3.5-turbo-16k or the llama3 model name')
+    parser.add_argument('--mode', type=str, default='planner', choices=['planner', 'input', 'output'],
+                        help='planner: real plan prompts with `size` plan examples; input/output: synthetic prompts of `size` tokens')
+    parser.add_argument('--sizes', type=str, default=None, help='comma separated, defaults depend on the mode')
+    parser.add_argument('--concurrency', type=str, default='1', help='comma separated concurrency levels')
+    parser.add_argument('--requests', type=int, default=10, help='requests per size and concurrency level')
+    parser.add_argument('--out', type=str, default=None, help='write results to a .json or .csv file')
+    parser.add_argument('--compare', type=str, default=None, help='baseline results (.json or .csv) to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative p50 slowdown reported as a regression')
+    parser.add_argument('--mock', action='store_true', help='run against an in-process mock LLM server')
+    parser.add_argument('--mock-ttft', type=float, default=0.3)
+    parser.add_argument('--mock-tps', type=float, default=50.0)
+    args = parser.parse_args()
+
+    if args.mock:
+        url = start_mock(args.mock_ttft, args.mock_tps)
+        os.environ['LLAMA_SERVICE_URL'] = url
+        os.environ['OPENAI_BASE_URL'] = url
+        os.environ.setdefault('OPENAI_API_KEY', 'mock')
+
+    from controller.llm_wrapper import LLMWrapper
+    llm = LLMWrapper()
+    planner = None
+    if args.mode == 'planner':
+        from controller.llm_planner import LLMPlanner
+        # stub skillsets with the controller's signatures
+        minispec_benchmark = importlib.import_module('minispec-benchmark')
+        planner = LLMPlanner()
+        planner.llm = llm
+        planner.init(minispec_benchmark.high_level_skillset, minispec_benchmark.low_level_skillset, None)
+
+    if args.sizes is not None:
+        sizes = [int(size) for size in args.sizes.split(',')]
+    elif args.mode == 'planner':
+        sizes = [0, len(planner.plan_prompt.examples) // 2, len(planner.plan_prompt.examples)]
+    elif args.mode == 'input':
+        sizes = [50, 500, 1000, 2000, 4000, 8000]
+    else:
+        sizes = [50, 100, 200, 300, 400]
+
+    summaries = []
+    samples = []
+    for size in sizes:
+        prompts = build_prompts(args.mode, size)
+        # keep connection setup out of the first sample
+        run_level(llm, prompts[:1], args.model, 1, 1)
+        for concurrency in [int(c) for c in args.concurrency.split(',')]:
+            start = time.perf_counter()
+            results = run_level(llm, prompts, args.model, concurrency, args.requests)
+            summary = summarize(args.mode, size, concurrency, results, time.perf_counter() - start)
+            summaries.append(summary)
+            samples += [{'mode': args.mode, 'size': size, 'concurrency': concurrency, **result} for result in results]
+            print(f"{args.mode} size {size:>5} x{concurrency:<3} prompt {summary['prompt_tokens_mean']:>7.0f} tok  "
+                  f"ttft p50 {summary['ttft_p50']:.3f}s p99 {summary['ttft_p99']:.3f}s  "
+                  f"total p50 {summary['total_p50']:.3f}s p99 {summary['total_p99']:.3f}s  "
+                  f"{summary['tokens_per_second_mean']:.1f} tok/s  {summary['throughput']:.2f} req/s")
+
+    single = [sample for sample in samples if sample['concurrency'] == 1] or samples
+    fit = linear_fit([s['prompt_tokens'] for s in single], [s['ttft'] for s in single])
+    if fit is not None:
+        print(f"ttft ~= {fit[0]:.3f}s + {fit[1] * 1000:.4f}ms per prompt token")
+    fit = linear_fit([s['completion_tokens'] for s in single], [s['total'] - s['ttft'] for s in single])
+    if fit is not None:
+        print(f"decode ~= {fit[0]:.3f}s + {fit[1] * 1000:.4f}ms per completion token")
+
+    if args.out is not None and len(summaries) > 0:
+        export(summaries, samples, args.out)
+    if args.compare is not None:
+        if compare(summaries, load_summaries(args.compare), args.threshold) > 0:
+            exit(1)
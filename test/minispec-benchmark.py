@@ -0,0 +1,445 @@
+import sys, os, re, json, time
+import contextlib
+import statistics
+from enum import Enum
+from typing import List, Optional
+sys.path.append("..")
+from controller.skillset import SkillSet, LowLevelSkillItem, HighLevelSkillItem, SkillArg
+from controller.utils import split_args
+from controller.minispec_interpreter import Statement, MiniSpecInterpreter, MiniSpecReturnValue, MiniSpecValueType, \
+    compile_minispec, evaluate_value, print_debug, skill_cache_stats
+
+PARENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+executed = 0
+# perf_counter() of every skill call, when measuring latency
+timeline = None
+
+def record():
+    global executed
+    executed += 1
+    if timeline is not None:
+        timeline.append(time.perf_counter())
+
+def skill_value(*args):
+    record()
+    return 0.5, False
+
+def skill_bool(*args):
+    record()
+    return False, False
+
+def skill_int(*args):
+    record()
+    return 0, False
+
+# same signatures as LLMController, without a robot behind them
+low_level_skillset = SkillSet(level="low")
+for name, func, args in [
+        ("move_forward", skill_bool, [SkillArg("distance", int)]),
+        ("move_backward", skill_bool, [SkillArg("distance", int)]),
+        ("move_left", skill_bool, [SkillArg("distance", int)]),
+        ("move_right", skill_bool, [SkillArg("distance", int)]),
+        ("move_up", skill_bool, [SkillArg("distance", int)]),
+        ("move_down", skill_bool, [SkillArg("distance", int)]),
+        ("turn_cw", skill_bool, [SkillArg("degrees", int)]),
+        ("turn_ccw", skill_bool, [SkillArg("degrees", int)]),
+        ("move_in_circle", skill_bool, [SkillArg("cw", bool)]),
+        ("delay", skill_bool, [SkillArg("milliseconds", int)]),
+        ("is_visible", skill_bool, [SkillArg("object_name", str)]),
+        ("object_x", skill_value, [SkillArg("object_name", str)]),
+        ("object_y", skill_value, [SkillArg("object_name", str)]),
+        ("object_width", skill_value, [SkillArg("object_name", str)]),
+        ("object_height", skill_value, [SkillArg("object_name", str)]),
+        ("object_dis", skill_int, [SkillArg("object_name", str)]),
+        ("object_info", skill_value, [SkillArg("object_name", str)]),
+        ("probe", skill_bool, [SkillArg("question", str)]),
+        ("log", skill_bool, [SkillArg("text", str)]),
+        ("take_picture", skill_bool, []),
+        ("re_plan", skill_bool, []),
+        ("reset_position", skill_bool, []),
+        ("face_upright", skill_bool, []),
+        ("down_distance", skill_int, []),
+        ("up_distance", skill_int, []),
+        ("x_distance", skill_int, [SkillArg("current_x", int)]),
+        ("y_distance", skill_int, [SkillArg("current_y", int)]),
+        ("open_gripper", skill_bool, []),
+        ("close_gripper", skill_bool, [])]:
+    low_level_skillset.add_skill(LowLevelSkillItem(name, func, name, args=args))
+
+high_level_skillset = SkillSet(level="high", lower_level_skillset=low_level_skillset)
+with open(os.path.join(PARENT_DIR, "controller/assets/high_level_skills.json"), "r") as f:
+    for skill in json.load(f):
+        high_level_skillset.add_skill(HighLevelSkillItem.load_from_dict(skill))
+
+Statement.low_level_skillset = low_level_skillset
+Statement.high_level_skillset = high_level_skillset
+
+class ParsingState(Enum):
+    CODE = 0
+    ARGUMENTS = 1
+    CONDITION = 2
+    LOOP_COUNT = 3
+    SUB_STATEMENTS = 4
+
+'''
+The character-by-character parser the interpreter used before plans were
+compiled, kept as the baseline: every run parses the plan again and every
+statement evaluation splits and strips its own text. Streaming and the
+executor queue are left out.
+'''
+class ReferenceProgram:
+    def __init__(self, env: Optional[dict] = None) -> None:
+        self.statements: List[ReferenceStatement] = []
+        self.depth = 0
+        self.finished = False
+        self.ret = False
+        if env is None:
+            self.env = {}
+        else:
+            self.env = env
+        self.current_statement = ReferenceStatement(self.env)
+
+    def parse(self, code_instance: List[str]) -> bool:
+        for code in code_instance:
+            for c in code:
+                if self.current_statement.parse(c):
+                    if len(self.current_statement.action) > 0:
+                        print_debug("Adding statement: ", self.current_statement)
+                        self.statements.append(self.current_statement)
+                    self.current_statement = ReferenceStatement(self.env)
+                if c == '{':
+                    self.depth += 1
+                elif c == '}':
+                    if self.depth == 0:
+                        self.finished = True
+                        return True
+                    self.depth -= 1
+        return False
+
+    def eval(self) -> MiniSpecReturnValue:
+        print_debug(f'Eval program: {self}, finished: {self.finished}')
+        ret_val = MiniSpecReturnValue.default()
+        for statement in self.statements:
+            ret_val = statement.eval()
+            if ret_val.replan or statement.ret:
+                print_debug(f'RET from {statement} with {ret_val} {statement.ret}')
+                self.ret = True
+                return ret_val
+        return ret_val
+
+    def __repr__(self) -> str:
+        s = ''
+        for statement in self.statements:
+            s += f'{statement}; '
+        return s
+
+class ReferenceStatement:
+    def __init__(self, env: dict) -> None:
+        self.code_buffer: str = ''
+        self.parsing_state: ParsingState = ParsingState.CODE
+        self.condition: Optional[str] = None
+        self.loop_count: Optional[int] = None
+        self.action: str = ''
+        self.allow_digit: bool = False
+        self.executable: bool = False
+        self.ret: bool = False
+        self.sub_statements: Optional[ReferenceProgram] = None
+        self.env = env
+        self.read_argument: bool = False
+
+    def get_env_value(self, var) -> MiniSpecValueType:
+        if var not in self.env:
+            raise Exception(f'Variable {var} is not defined')
+        return self.env[var]
+
+    def parse(self, code: str) -> bool:
+        for c in code:
+            match self.parsing_state:
+                case ParsingState.CODE:
+                    if c == '?' and not self.read_argument:
+                        self.action = 'if'
+                        self.parsing_state = ParsingState.CONDITION
+                    elif c == ';' or c == '}' or c == ')':
+                        if c == ')':
+                            self.code_buffer += c
+                            self.read_argument = False
+                        self.action = self.code_buffer
+                        print_debug(f'SP Action: {self.code_buffer}')
+                        self.executable = True
+                        return True
+                    else:
+                        if c == '(':
+                            self.read_argument = True
+                        if c.isalpha() or c == '_':
+                            self.allow_digit = True
+                        self.code_buffer += c
+                    if c.isdigit() and not self.allow_digit:
+                        self.action = 'loop'
+                        self.parsing_state = ParsingState.LOOP_COUNT
+                case ParsingState.CONDITION:
+                    if c == '{':
+                        print_debug(f'SP Condition: {self.code_buffer}')
+                        self.condition = self.code_buffer
+                        self.executable = True
+                        self.sub_statements = ReferenceProgram(self.env)
+                        self.parsing_state = ParsingState.SUB_STATEMENTS
+                    else:
+                        self.code_buffer += c
+                case ParsingState.LOOP_COUNT:
+                    if c == '{':
+                        print_debug(f'SP Loop: {self.code_buffer}')
+                        self.loop_count = int(self.code_buffer)
+                        self.executable = True
+                        self.sub_statements = ReferenceProgram(self.env)
+                        self.parsing_state = ParsingState.SUB_STATEMENTS
+                    else:
+                        self.code_buffer += c
+                case ParsingState.SUB_STATEMENTS:
+                    if self.sub_statements.parse([c]):
+                        return True
+        return False
+
+    def eval(self) -> MiniSpecReturnValue:
+        print_debug(f'Statement eval: {self} {self.action} {self.condition} {self.loop_count}')
+        if self.action == 'if':
+            ret_val = self.eval_condition(self.condition)
+            if ret_val.replan:
+                return ret_val
+            if ret_val.value:
+                print_debug(f'-> eval condition statement: {self.sub_statements}')
+                ret_val = self.sub_statements.eval()
+                if ret_val.replan or self.sub_statements.ret:
+                    self.ret = True
+                return ret_val
+            else:
+                return MiniSpecReturnValue.default()
+        elif self.action == 'loop':
+            print_debug(f'-> eval loop statement: {self.loop_count} {self.sub_statements}')
+            ret_val = MiniSpecReturnValue.default()
+            for _ in range(self.loop_count):
+                print_debug(f'-> loop iteration: {ret_val}')
+                ret_val = self.sub_statements.eval()
+                if ret_val.replan or self.sub_statements.ret:
+                    self.ret = True
+                    return ret_val
+            return ret_val
+        else:
+            return self.eval_action(self.action)
+
+    def eval_action(self, action: str) -> MiniSpecReturnValue:
+        action = action.strip()
+        print_debug(f'Eval action: {action}')
+
+        if '=' in action:
+            var, func = action.split('=')
+            print_debug(f'Assignment: Var: {var.strip()}, Val: {func.strip()}')
+            ret_val = self.eval_function(func.strip())
+            if not ret_val.replan:
+                self.env[var.strip()] = ret_val.value
+            return ret_val
+        elif action.startswith('->'):
+            self.ret = True
+            return self.eval_var(action.lstrip("->"))
+        else:
+            return self.eval_function(action)
+
+    def eval_function(self, func: str) -> MiniSpecReturnValue:
+        print_debug(f'Eval function: {func}')
+        func = func.split('(', 1)
+        name = func[0].strip()
+        if len(func) == 2:
+            args = func[1].strip()[:-1]
+            args = split_args(args)
+            for i in range(0, len(args)):
+                args[i] = args[i].strip().strip('\'"')
+                if args[i].startswith('_'):
+                    args[i] = self.get_env_value(args[i])
+        else:
+            args = []
+
+        if name == 'int':
+            return MiniSpecReturnValue(int(args[0]), False)
+        elif name == 'float':
+            return MiniSpecReturnValue(float(args[0]), False)
+        elif name == 'str':
+            return MiniSpecReturnValue(args[0], False)
+        else:
+            skill_instance = low_level_skillset.get_skill(name)
+            if skill_instance is not None:
+                print_debug(f'Executing low-level skill: {skill_instance.get_name()} {args}')
+                return MiniSpecReturnValue.from_tuple(skill_instance.execute(args))
+
+            skill_instance = high_level_skillset.get_skill(name)
+            if skill_instance is not None:
+                print_debug(f'Executing high-level skill: {skill_instance.get_name()}', args, skill_instance.execute(args))
+                interpreter = ReferenceProgram()
+                interpreter.parse([skill_instance.execute(args)])
+                interpreter.finished = True
+                val = interpreter.eval()
+                if val.value == 'rp':
+                    return MiniSpecReturnValue(f'High-level skill {skill_instance.get_name()} failed', True)
+                return val
+            raise Exception(f'Skill {name} is not defined')
+
+    def eval_var(self, var: str) -> MiniSpecReturnValue:
+        var = var.strip()
+        if len(var) == 0:
+            raise Exception('Empty operand')
+        if var.startswith('_'):
+            return MiniSpecReturnValue(self.get_env_value(var), False)
+        elif var == 'True' or var == 'False':
+            return MiniSpecReturnValue(evaluate_value(var), False)
+        elif var[0].isalpha():
+            return self.eval_action(var)
+        else:
+            return MiniSpecReturnValue(evaluate_value(var), False)
+
+    def eval_condition(self, condition: str) -> MiniSpecReturnValue:
+        if '&' in condition:
+            conditions = condition.split('&')
+            cond = True
+            for c in conditions:
+                ret_val = self.eval_condition(c)
+                if ret_val.replan:
+                    return ret_val
+                cond = cond and ret_val.value
+            return MiniSpecReturnValue(cond, False)
+        if '|' in condition:
+            conditions = condition.split('|')
+            for c in conditions:
+                ret_val = self.eval_condition(c)
+                if ret_val.replan:
+                    return ret_val
+                if ret_val.value == True:
+                    return MiniSpecReturnValue(True, False)
+            return MiniSpecReturnValue(False, False)
+
+        operand_1, comparator, operand_2 = re.split(r'(>|<|==|!=)', condition)
+        operand_1 = self.eval_var(operand_1)
+        if operand_1.replan:
+            return operand_1
+        operand_2 = self.eval_var(operand_2)
+        if operand_2.replan:
+            return operand_2
+
+        print_debug(f'Condition ops: {operand_1.value} {comparator} {operand_2.value}')
+
+        if type(operand_1.value) != type(operand_2.value):
+            if comparator == '!=':
+                return MiniSpecReturnValue(True, False)
+            elif comparator == '==':
+                return MiniSpecReturnValue(False, False)
+            else:
+                raise Exception(f'Invalid comparator: {operand_1.value}:{type(operand_1.value)} {operand_2.value}:{type(operand_2.value)}')
+
+        if comparator == '>':
+            cmp = operand_1.value > operand_2.value
+        elif comparator == '<':
+            cmp = operand_1.value < operand_2.value
+        elif comparator == '==':
+            cmp = operand_1.value == operand_2.value
+        elif comparator == '!=':
+            cmp = operand_1.value != operand_2.value
+        else:
+            raise Exception(f'Invalid comparator: {comparator}')
+
+        return MiniSpecReturnValue(cmp, False)
+
+    def __repr__(self) -> str:
+        s = ''
+        if self.action == 'if':
+            s += f'if {self.condition}'
+        elif self.action == 'loop':
+            s += f'[{self.loop_count}]'
+        else:
+            s += f'{self.action}'
+        if self.sub_statements is not None:
+            s += ' {'
+            for statement in self.sub_statements.statements:
+                s += f'{statement}; '
+            s += '}'
+        return s
+
+PLANS = [
+    "8{?iv('bottle')==True{->True}tc(45)}->False;",
+    "4{_1=ox('bottle');?_1>0.6{tc(15)};?_1<0.4{tu(15)};_2=ox('bottle');?_2<0.6&_2>0.4{->True}}->False;",
+    "s('bottle');g('bottle');zi();zo();",
+    "_1=str('bottle');4{g(_1);o(_1);zi();zo()}",
+    "4{mf(10);ml(10);md(10);mu(10)}",
+    "12{_1=p('Any animal target here?');?_1!=False{l(_1);->True}tc(30)}->False;",
+]
+
+def run_reference(plan: str):
+    program = ReferenceProgram()
+    program.parse([plan])
+    program.finished = True
+    program.eval()
+
+def run_uncached(plan: str):
+    # the compiler with its cache bypassed, every run tokenizes and parses again
+    compile_minispec.__wrapped__(plan, low_level_skillset, high_level_skillset).eval({})
+
+def run_compiled(plan: str):
+    compile_minispec(plan, low_level_skillset, high_level_skillset).eval({})
+
+def run(plan: str, method, duration: float) -> float:
+    """Returns executed skill statements per second."""
+    global executed
+    executed = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        method(plan)
+    return executed / (time.perf_counter() - start)
+
+def stream(statements: list, interval: float, sent: list):
+    # mimics an LLM emitting one statement every `interval` seconds
+    for statement in statements:
+        time.sleep(interval)
+        sent.append(time.perf_counter())
+        yield statement + ';'
+
+def latency(count: int = 200, interval: float = 0.002):
+    """Returns (gaps between queued statements, delays from arrival to execution) in us."""
+    global timeline
+    statements = [f'mf({i})' for i in range(count)]
+
+    timeline = []
+    interpreter = MiniSpecInterpreter()
+    interpreter.execute(';'.join(statements))
+    interpreter.wait()
+    gaps = [(b - a) * 1e6 for a, b in zip(timeline, timeline[1:])]
+
+    timeline = []
+    sent = []
+    interpreter = MiniSpecInterpreter()
+    interpreter.execute(stream(statements, interval, sent))
+    interpreter.wait()
+    delays = [(b - a) * 1e6 for a, b in zip(sent, timeline)]
+    timeline = None
+    return gaps, delays
+
+def report(name: str, values: list):
+    values = sorted(values)
+    print(f"{name:<32} mean {statistics.mean(values):>9.1f} us  p50 {values[len(values) // 2]:>9.1f} us  "
+          f"p99 {values[int(len(values) * 0.99)]:>9.1f} us")
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--latency':
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            gaps, delays = latency()
+        report("gap between statements", gaps)
+        report("statement arrival to start", delays)
+        exit(0)
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+    results = []
+    # skip skill/debug output, it dominates otherwise
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for plan in PLANS:
+            results.append((plan, run(plan, run_reference, duration), run(plan, run_uncached, duration),
+                            run(plan, run_compiled, duration)))
+    # the character parser is the baseline, the other two columns only differ by the compile cache
+    print(f"{'plan':<60} {'character parser':>17} {'compile every run':>18} {'compiled once':>16}")
+    for plan, reference, uncached, cached in results:
+        print(f"{plan[:58]:<60} {reference:>12.0f} st/s {uncached:>13.0f} st/s {cached:>11.0f} st/s")
+    print("High-level skill cache:", skill_cache_stats(high_level_skillset))
@@ -0,0 +1,63 @@
+import sys, os, json
+sys.path.append("..")
+from controller.skillset import SkillSet, LowLevelSkillItem, HighLevelSkillItem, SkillArg
+from controller.minispec_interpreter import check_minispec
+
+PARENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def skill(*args):
+    return None, False
+
+# same signatures as LLMController, without a robot behind them
+low_level_skillset = SkillSet(level="low")
+for name, args in [
+        ("move_forward", [SkillArg("distance", int)]),
+        ("move_backward", [SkillArg("distance", int)]),
+        ("move_left", [SkillArg("distance", int)]),
+        ("move_right", [SkillArg("distance", int)]),
+        ("move_up", [SkillArg("distance", int)]),
+        ("move_down", [SkillArg("distance", int)]),
+        ("turn_cw", [SkillArg("degrees", int)]),
+        ("turn_ccw", [SkillArg("degrees", int)]),
+        ("move_in_circle", [SkillArg("cw", bool)]),
+        ("delay", [SkillArg("milliseconds", int)]),
+        ("is_visible", [SkillArg("object_name", str)]),
+        ("object_x", [SkillArg("object_name", str)]),
+        ("object_y", [SkillArg("object_name", str)]),
+        ("object_width", [SkillArg("object_name", str)]),
+        ("object_height", [SkillArg("object_name", str)]),
+        ("object_dis", [SkillArg("object_name", str)]),
+        ("object_info", [SkillArg("object_name", str)]),
+        ("probe", [SkillArg("question", str)]),
+        ("log", [SkillArg("text", str)]),
+        ("take_picture", []),
+        ("re_plan", []),
+        ("reset_position", []),
+        ("face_upright", []),
+        ("down_distance", []),
+        ("up_distance", []),
+        ("x_distance", [SkillArg("current_x", int)]),
+        ("y_distance", [SkillArg("current_y", int)]),
+        ("open_gripper", []),
+        ("close_gripper", [])]:
+    low_level_skillset.add_skill(LowLevelSkillItem(name, skill, name, args=args))
+
+high_level_skillset = SkillSet(level="high", lower_level_skillset=low_level_skillset)
+with open(os.path.join(PARENT_DIR, "controller/assets/high_level_skills.json"), "r") as f:
+    for item in json.load(f):
+        high_level_skillset.add_skill(HighLevelSkillItem.load_from_dict(item))
+
+if __name__ == '__main__':
+    # every scripted plan of the mock LLM has to be one the interpreter accepts
+    script = sys.argv[1] if len(sys.argv) > 1 else os.path.join(PARENT_DIR, "serving/mock_llm/mock_script.json")
+    with open(script, "r") as f:
+        entries = json.load(f)
+    failures = 0
+    for entry in entries:
+        if entry.get('kind') != 'plan':
+            continue
+        error = check_minispec(entry['response'], low_level_skillset, high_level_skillset)
+        print(f"{'FAIL' if error else 'ok':>4} {entry['match']}: {entry['response']}" + (f" -> {error}" if error else ""))
+        failures += error is not None
+    assert failures == 0, f"{failures} scripted plans do not compile"
+    print("OK")
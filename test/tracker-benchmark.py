@@ -0,0 +1,106 @@
+import sys, time
+import random
+import numpy as np
+from typing import Optional
+sys.path.append("..")
+# only the reference tracker needs filterpy, the controller no longer does
+from filterpy.kalman import KalmanFilter
+from controller.scene_store import ObjectInfo
+from controller.tracker_bank import TrackerBank
+
+'''
+The per-object filterpy tracker VisionSkillWrapper used before TrackerBank,
+kept as the reference the bank is measured and checked against.
+'''
+class ObjectTracker:
+    def __init__(self, name, x, y, w, h) -> None:
+        self.name = name
+        self.kf = self.init_filter()
+        self.timestamp = 0
+        self.size = None
+        self.update(x, y, w, h)
+
+    def update(self, x, y, w, h):
+        self.kf.update((x, y))
+        self.size = (w, h)
+        self.timestamp = time.time()
+
+    def predict(self) -> Optional[ObjectInfo]:
+        # if no update in 2 seconds, return None
+        if time.time() - self.timestamp > 0.8:
+            return None
+        self.kf.predict()
+        return ObjectInfo(self.name, self.kf.x[0][0], self.kf.x[1][0], self.size[0], self.size[1])
+
+    def init_filter(self):
+        kf = KalmanFilter(dim_x=4, dim_z=2)  # 4 state dimensions (x, y, vx, vy), 2 measurement dimensions (x, y)
+        kf.F = np.array([[1, 0, 1, 0],  # State transition matrix
+                        [0, 1, 0, 1],
+                        [0, 0, 1, 0],
+                        [0, 0, 0, 1]])
+        kf.H = np.array([[1, 0, 0, 0],  # Measurement function
+                        [0, 1, 0, 0]])
+        kf.R *= 2  # Measurement uncertainty
+        kf.P *= 1000  # Initial uncertainty
+        kf.Q *= 0.01  # Process uncertainty
+        return kf
+
+def make_frames(count: int, objects: int, seed: int = 0) -> list:
+    """Frames of (name, x, y, w, h) detections; objects drift and sometimes go missing."""
+    rng = random.Random(seed)
+    positions = [[rng.random(), rng.random()] for _ in range(objects)]
+    frames = []
+    for _ in range(count):
+        detections = []
+        for i, position in enumerate(positions):
+            position[0] += rng.uniform(-0.01, 0.01)
+            position[1] += rng.uniform(-0.01, 0.01)
+            if rng.random() < 0.9:
+                detections.append((f'object_{i}', position[0], position[1], 0.1, 0.2))
+        frames.append(detections)
+    return frames
+
+def run_objects(frames: list) -> dict:
+    # the per-object loop VisionSkillWrapper used
+    trackers = {}
+    for detections in frames:
+        for name, x, y, w, h in detections:
+            if name not in trackers:
+                trackers[name] = ObjectTracker(name, x, y, w, h)
+            else:
+                trackers[name].update(x, y, w, h)
+        object_list = []
+        to_delete = []
+        for name, tracker in trackers.items():
+            obj = tracker.predict()
+            if obj is not None:
+                object_list.append(obj)
+            else:
+                to_delete.append(name)
+        for name in to_delete:
+            del trackers[name]
+    return {obj.name: (obj.x, obj.y, obj.w, obj.h) for obj in object_list}
+
+def run_bank(frames: list) -> dict:
+    bank = TrackerBank()
+    for detections in frames:
+        names = [d[0] for d in detections]
+        bank.update(names, [d[1:] for d in detections])
+        bank.predict()
+    names, states = bank.states()
+    return {name: tuple(state) for name, state in zip(names, states.tolist())}
+
+if __name__ == '__main__':
+    frame_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    print(f"{'objects':>8} {'per object':>14} {'tracker bank':>14} {'speedup':>8} {'max diff':>10}")
+    for objects in [1, 10, 50, 100, 200, 500]:
+        frames = make_frames(frame_count, objects)
+        start = time.perf_counter()
+        expected = run_objects(frames)
+        before = (time.perf_counter() - start) / frame_count * 1e6
+        start = time.perf_counter()
+        result = run_bank(frames)
+        after = (time.perf_counter() - start) / frame_count * 1e6
+        assert expected.keys() == result.keys()
+        diff = max(np.max(np.abs(np.array(expected[name]) - np.array(result[name]))) for name in expected)
+        print(f"{objects:>8} {before:>9.1f} us/f {after:>9.1f} us/f {before / after:>7.1f}x {diff:>10.2e}")
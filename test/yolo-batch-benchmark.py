@@ -0,0 +1,60 @@
+import sys, os, time
+import argparse
+import threading
+import numpy as np
+sys.path.append("..")
+sys.path.append(os.path.join("..", "serving/yolo"))
+from batch_scheduler import BatchScheduler
+
+parser = argparse.ArgumentParser(description='Compare batch sizes of the YOLO service scheduler on the CPU')
+parser.add_argument('--model', default='yolov8n.pt', help='YOLO weights or model yaml, yolov8n.yaml runs offline with random weights')
+parser.add_argument('--clients', type=int, default=4, help='clients sending one frame at a time')
+parser.add_argument('--frames', type=int, default=30, help='frames per client')
+parser.add_argument('--batch', type=int, nargs='+', default=[1, 2, 4, 8], help='max batch sizes to try')
+parser.add_argument('--wait', type=float, default=10, help='max wait in ms')
+parser.add_argument('--slo', type=float, default=None, help='latency SLO in ms')
+args = parser.parse_args()
+
+from ultralytics import YOLO
+
+SIZE = (640, 352)
+
+def make_run_batch(model):
+    # what YoloService.run_models does for the standard model
+    def run_batch(items):
+        images = [image for image, _ in items]
+        confs = [conf for _, conf in items]
+        results = model(images, verbose=False, conf=min(confs), device='cpu')
+        return [result[result.boxes.conf >= conf] for result, conf in zip(results, confs)]
+    return run_batch
+
+def run(scheduler: BatchScheduler, images: list, clients: int, frames: int) -> float:
+    def client(i):
+        for k in range(frames):
+            scheduler.run((images[(i + k) % len(images)], 0.3))
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return clients * frames / (time.perf_counter() - start)
+
+if __name__ == '__main__':
+    model = YOLO(args.model)
+    rng = np.random.default_rng(0)
+    images = [rng.integers(0, 255, (SIZE[1], SIZE[0], 3), dtype=np.uint8) for _ in range(8)]
+    # warm up, the first call builds the predictor
+    model(images[:2], verbose=False, device='cpu')
+    print(f"{args.clients} clients, {args.frames} frames each, max wait {args.wait:.0f} ms")
+    print(f"{'batch':>6} {'frames/s':>9} {'mean size':>10} {'queue p50':>10} {'queue p95':>10} "
+          f"{'lat p50':>8} {'lat p95':>8} {'over SLO':>9}  batch sizes")
+    for max_batch_size in args.batch:
+        scheduler = BatchScheduler(make_run_batch(model), max_batch_size=max_batch_size, max_wait=args.wait / 1000,
+                                   slo=args.slo / 1000 if args.slo is not None else None)
+        fps = run(scheduler, images, args.clients, args.frames)
+        stats = scheduler.stats()
+        sizes = ' '.join(f'{size}x{count}' for size, count in stats['batch_sizes'].items())
+        print(f"{max_batch_size:>6} {fps:>9.2f} {stats['mean_batch_size']:>10.2f} {stats['queue_ms_p50']:>10.1f} "
+              f"{stats['queue_ms_p95']:>10.1f} {stats['latency_ms_p50']:>8.1f} {stats['latency_ms_p95']:>8.1f} "
+              f"{stats['over_slo'] if args.slo is not None else '-':>9}  {sizes}")
@@ -0,0 +1,122 @@
+import sys, os, time, json
+import queue
+import argparse
+import threading
+import multiprocessing
+import asyncio
+from concurrent import futures
+import numpy as np
+sys.path.append("..")
+
+parser = argparse.ArgumentParser(description='Compare unary and bidi-stream detection against the YOLO service')
+parser.add_argument('--frames', type=int, default=200)
+parser.add_argument('--window', type=int, default=2, help='frames in flight')
+parser.add_argument('--fake', type=float, default=None, metavar='MS',
+                    help='start an in-process service that answers after MS milliseconds instead of using YOLO')
+args = parser.parse_args()
+
+if args.fake is not None:
+    os.environ["VISION_SERVICE_IP"] = "127.0.0.1"
+    os.environ["YOLO_SERVICE_PORT"] = "50099"
+elif os.environ.get("VISION_SERVICE_IP", "localhost") == "localhost":
+    # localhost makes the client use blocking calls, go through the loopback address instead
+    os.environ["VISION_SERVICE_IP"] = "127.0.0.1"
+os.environ["YOLO_BIDI_WINDOW"] = str(args.window)
+
+import grpc
+from controller.shared_frame import Frame
+from controller.yolo_grpc_client import YoloGRPCClient, YOLO_SERVICE_PORT, hyrch_serving_pb2, hyrch_serving_pb2_grpc
+
+'''
+Answers like YoloService after a fixed delay, one frame at a time.
+'''
+class FakeYoloService(hyrch_serving_pb2_grpc.YoloServiceServicer):
+    def __init__(self, delay: float):
+        self.delay = delay
+        # stands in for the model lock of YoloService
+        self.lock = threading.Lock()
+
+    def respond(self, request):
+        with self.lock:
+            time.sleep(self.delay)
+        return hyrch_serving_pb2.DetectResponse(json_data=json.dumps({'image_id': request.image_id, 'result': [], 'result_custom': []}))
+
+    def DetectStream(self, request, context):
+        return self.respond(request)
+
+    def DetectBidiStream(self, request_iterator, context):
+        # same structure as YoloService: detect in a thread, send from the handler
+        responses = queue.Queue()
+        def process():
+            try:
+                for request in request_iterator:
+                    responses.put(self.respond(request))
+            except Exception:
+                pass
+            finally:
+                responses.put(None)
+        threading.Thread(target=process, daemon=True).start()
+        while True:
+            response = responses.get()
+            if response is None:
+                break
+            yield response
+
+    def SetClasses(self, request, context):
+        return hyrch_serving_pb2.SetClassResponse(result="Success")
+
+async def run(client: YoloGRPCClient, bidi: bool, frames: int, window: int) -> dict:
+    client.use_bidi = bidi
+    frame = Frame(np.random.randint(0, 255, (352, 640, 3), dtype=np.uint8))
+    image_bytes = client.encode(frame)
+    semaphore = asyncio.Semaphore(window)
+    latencies = []
+
+    async def one():
+        try:
+            start = time.perf_counter()
+            await client.detect(frame, image_bytes=image_bytes)
+            latencies.append(time.perf_counter() - start)
+        finally:
+            semaphore.release()
+
+    # warm up the channel and, for bidi, the stream
+    await client.detect(frame, image_bytes=image_bytes)
+    tasks = []
+    start = time.perf_counter()
+    for _ in range(frames):
+        await semaphore.acquire()
+        tasks.append(asyncio.create_task(one()))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'fps': frames / elapsed,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p95_ms': latencies[int(len(latencies) * 0.95)] * 1000,
+    }
+
+async def main():
+    client = YoloGRPCClient()
+    client.init_async_channel()
+    for label, bidi in [('unary', False), ('bidi', True)]:
+        result = await run(client, bidi, args.frames, args.window)
+        print(f"{label:>6}: {result['fps']:>7.1f} frames/s  latency p50 {result['p50_ms']:>7.2f} ms  p95 {result['p95_ms']:>7.2f} ms")
+
+def serve_fake(delay: float):
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=4))
+    hyrch_serving_pb2_grpc.add_YoloServiceServicer_to_server(FakeYoloService(delay), server)
+    server.add_insecure_port(f'127.0.0.1:{YOLO_SERVICE_PORT}')
+    server.start()
+    server.wait_for_termination()
+
+if __name__ == '__main__':
+    server = None
+    if args.fake is not None:
+        # own process, as the real service, so client and server do not share the GIL
+        server = multiprocessing.Process(target=serve_fake, args=(args.fake / 1000,), daemon=True)
+        server.start()
+        time.sleep(1)
+    asyncio.run(main())
+    if server is not None:
+        server.terminate()